@@ -0,0 +1,275 @@
+"""Локальная имитация Telegram Bot API для проверок и нагрузочных тестов.
+
+Бот подключается к ней через TELEGRAM_API_URL=http://127.0.0.1:<порт>.
+Сервер отвечает на методы, которые использует бот, запоминает все вызовы
+и отдаёт обновления через getUpdates (режим polling) либо отправляет их
+на webhook, установленный через setWebhook.
+
+Запуск отдельно: python -m benchmarks.fake_telegram [порт]
+"""
+import asyncio
+import itertools
+import json
+import sys
+import time
+from collections import Counter
+from typing import Any, Dict, List, Optional
+
+from aiohttp import ClientSession, web
+
+BOT_USER = {"id": 100000001, "is_bot": True, "first_name": "StudyBuddy", "username": "studybuddy_test_bot"}
+
+
+class FakeTelegram:
+    """Имитация Bot API: /bot<token>/<method>"""
+
+    def __init__(self, latency: float = 0.0, record: bool = True):
+        # Задержка ответа, как у настоящего API
+        self.latency = latency
+        # record=False - вызовы только считаются (для долгих нагрузочных тестов)
+        self.record = record
+        self.calls: List[Dict[str, Any]] = []
+        self.counts: Counter = Counter()
+        self.webhook: Optional[Dict[str, Any]] = None
+        # Следующие flood_count вызовов flood_method получат 429 с retry_after
+        self.flood_method = "sendMessage"
+        self.flood_count = 0
+        self.flood_retry_after = 1
+        # Файлы пользователей для getFile: file_id -> содержимое
+        self.files: Dict[str, bytes] = {}
+
+        self._updates: List[Dict[str, Any]] = []
+        self._update_ids = itertools.count(1)
+        self._message_ids = itertools.count(1)
+        self._new_update: Optional[asyncio.Event] = None
+        self._new_call: Optional[asyncio.Event] = None
+        self._runner: Optional[web.AppRunner] = None
+        self._client: Optional[ClientSession] = None
+
+    # ---------- запуск ----------
+    def app(self) -> web.Application:
+        app = web.Application(client_max_size=50 * 1024 * 1024)
+        app.router.add_post("/bot{token}/{method}", self.handle)
+        app.router.add_get("/bot{token}/{method}", self.handle)
+        app.router.add_get("/file/bot{token}/{file_id}", self.download)
+        return app
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0) -> str:
+        """Запуск сервера; возвращает базовый адрес для TELEGRAM_API_URL"""
+        self._new_update = asyncio.Event()
+        self._new_call = asyncio.Event()
+        self._runner = web.AppRunner(self.app())
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, host, port)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        return f"http://{host}:{port}"
+
+    async def stop(self):
+        if self._client is not None:
+            await self._client.close()
+        if self._runner is not None:
+            await self._runner.cleanup()
+
+    # ---------- Bot API ----------
+    async def handle(self, request: web.Request) -> web.Response:
+        method = request.match_info["method"]
+        params: Dict[str, Any] = dict(request.query)
+        if request.content_type == "application/json":
+            params.update(await request.json())
+        elif request.can_read_body:
+            form = await request.post()
+            for key, value in form.items():
+                # Загруженный файл (attach://<поле>) хранится содержимым
+                if isinstance(value, str) and value.startswith("attach://"):
+                    attached = form.get(value[len("attach://"):])
+                    value = attached.file.read() if isinstance(attached, web.FileField) else value
+                if not isinstance(value, web.FileField):
+                    params.setdefault(key, value)
+        self.counts[method] += 1
+        if self.record:
+            self.calls.append({"method": method, "params": params, "time": time.time()})
+            self._new_call.set()
+
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+        if self.flood_count and method == self.flood_method:
+            self.flood_count -= 1
+            return web.json_response({
+                "ok": False, "error_code": 429,
+                "description": f"Too Many Requests: retry after {self.flood_retry_after}",
+                "parameters": {"retry_after": self.flood_retry_after},
+            }, status=429)
+
+        handler = getattr(self, "api_" + method.casefold(), None)
+        if handler is None:
+            # Остальные методы просто подтверждаются
+            return self._ok(True)
+        return await handler(params)
+
+    @staticmethod
+    def _ok(result: Any) -> web.Response:
+        return web.json_response({"ok": True, "result": result})
+
+    async def api_getme(self, params) -> web.Response:
+        return self._ok(BOT_USER)
+
+    async def api_setwebhook(self, params) -> web.Response:
+        self.webhook = {"url": params["url"], "secret_token": params.get("secret_token")}
+        return self._ok(True)
+
+    async def api_deletewebhook(self, params) -> web.Response:
+        self.webhook = None
+        return self._ok(True)
+
+    async def api_sendmessage(self, params) -> web.Response:
+        chat_id = int(params["chat_id"])
+        return self._ok({
+            "message_id": next(self._message_ids),
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private"},
+            "from": BOT_USER,
+            "text": params.get("text", ""),
+        })
+
+    async def api_senddocument(self, params) -> web.Response:
+        chat_id = int(params["chat_id"])
+        message_id = next(self._message_ids)
+        return self._ok({
+            "message_id": message_id,
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private"},
+            "from": BOT_USER,
+            "document": {"file_id": f"sent{message_id}", "file_unique_id": f"sent{message_id}"},
+            "caption": params.get("caption"),
+        })
+
+    async def api_getfile(self, params) -> web.Response:
+        file_id = params["file_id"]
+        if file_id not in self.files:
+            return web.json_response({"ok": False, "error_code": 400,
+                                      "description": "Bad Request: invalid file_id"}, status=400)
+        return self._ok({"file_id": file_id, "file_unique_id": file_id,
+                         "file_size": len(self.files[file_id]), "file_path": file_id})
+
+    async def download(self, request: web.Request) -> web.Response:
+        content = self.files.get(request.match_info["file_id"])
+        if content is None:
+            raise web.HTTPNotFound()
+        return web.Response(body=content)
+
+    async def api_getupdates(self, params) -> web.Response:
+        offset = int(params.get("offset", 0))
+        timeout = float(params.get("timeout", 0))
+        self._updates = [u for u in self._updates if u["update_id"] >= offset]
+        if not self._updates and timeout:
+            self._new_update.clear()
+            try:
+                await asyncio.wait_for(self._new_update.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+        return self._ok(self._updates[:int(params.get("limit", 100))])
+
+    # ---------- обновления ----------
+    def message_update(self, user_id: int, text: str) -> Dict[str, Any]:
+        """Обновление с текстовым сообщением от пользователя"""
+        update_id = next(self._update_ids)
+        return {
+            "update_id": update_id,
+            "message": {
+                "message_id": update_id,
+                "date": int(time.time()),
+                "chat": {"id": user_id, "type": "private", "first_name": f"User{user_id}"},
+                "from": {"id": user_id, "is_bot": False, "first_name": f"User{user_id}"},
+                "text": text,
+            },
+        }
+
+    def document_update(self, user_id: int, content: bytes, file_name: str,
+                        caption: Optional[str] = None) -> Dict[str, Any]:
+        """Обновление с файлом от пользователя; файл доступен через getFile"""
+        update = self.message_update(user_id, "")
+        message = update["message"]
+        del message["text"]
+        file_id = f"file{update['update_id']}"
+        self.files[file_id] = content
+        message["document"] = {"file_id": file_id, "file_unique_id": file_id,
+                               "file_name": file_name, "file_size": len(content)}
+        if caption is not None:
+            message["caption"] = caption
+        return update
+
+    def callback_update(self, user_id: int, data: str, message_id: int = 1) -> Dict[str, Any]:
+        """Обновление с нажатием inline-кнопки под сообщением бота message_id"""
+        update_id = next(self._update_ids)
+        user = {"id": user_id, "is_bot": False, "first_name": f"User{user_id}"}
+        return {
+            "update_id": update_id,
+            "callback_query": {
+                "id": str(update_id),
+                "from": user,
+                "chat_instance": str(user_id),
+                "data": data,
+                "message": {
+                    "message_id": message_id,
+                    "date": int(time.time()),
+                    "chat": {"id": user_id, "type": "private", "first_name": user["first_name"]},
+                    "from": BOT_USER,
+                    "text": "...",
+                },
+            },
+        }
+
+    async def push(self, update: Dict[str, Any], secret_token: Optional[str] = None) -> int:
+        """Доставка обновления: на webhook, если он установлен, иначе в очередь getUpdates.
+
+        Возвращает HTTP-статус ответа webhook (200 для очереди).
+        """
+        if self.webhook is None:
+            self._updates.append(update)
+            self._new_update.set()
+            return 200
+
+        if self._client is None:
+            self._client = ClientSession()
+        token = secret_token if secret_token is not None else self.webhook["secret_token"]
+        headers = {"X-Telegram-Bot-Api-Secret-Token": token} if token else {}
+        async with self._client.post(self.webhook["url"], data=json.dumps(update),
+                                     headers={"Content-Type": "application/json", **headers}) as response:
+            return response.status
+
+    def sent(self, chat_id: Optional[int] = None) -> List[Dict[str, Any]]:
+        """Параметры отправленных ботом сообщений"""
+        return [
+            call["params"] for call in self.calls
+            if call["method"] == "sendMessage"
+            and (chat_id is None or int(call["params"]["chat_id"]) == chat_id)
+        ]
+
+    async def wait_for(self, method: str, count: int = 1, timeout: float = 10.0) -> List[Dict[str, Any]]:
+        """Ожидание, пока бот вызовет method не меньше count раз"""
+        deadline = time.monotonic() + timeout
+        while True:
+            calls = [call for call in self.calls if call["method"] == method]
+            if len(calls) >= count:
+                return calls
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise TimeoutError(f"{method}: {len(calls)} вызовов из {count} за {timeout} с")
+            self._new_call.clear()
+            try:
+                await asyncio.wait_for(self._new_call.wait(), remaining)
+            except asyncio.TimeoutError:
+                pass
+
+
+async def serve(port: int):
+    fake = FakeTelegram()
+    url = await fake.start(port=port)
+    print(f"Fake Bot API: TELEGRAM_API_URL={url}")
+    await asyncio.Event().wait()
+
+
+if __name__ == "__main__":
+    asyncio.run(serve(int(sys.argv[1]) if len(sys.argv) > 1 else 8081))
@@ -0,0 +1,194 @@
+"""Нагрузочный тест бота на локальной имитации Telegram Bot API.
+
+Загружает main.py в этом же процессе (TELEGRAM_API_URL указывает на
+FakeTelegram, данные - во временном каталоге) и прогоняет через его
+Dispatcher синтетические сценарии пользователей:
+
+    onboarding - /start, быстрые заметки, добавление пары
+    notes      - быстрые заметки
+    search     - поиск по заметкам
+    schedule   - просмотр расписания, /today, добавление пары
+    digest     - утренняя рассылка всем пользователям
+
+Для каждого сценария выводятся обновлений/с, задержка обработки обновления
+p50/p95/p99 (вместе с ответом Bot API) и доля времени сохранения данных.
+На регистрации пользователей tracemalloc измеряет прирост памяти
+в пересчёте на 10 000 пользователей.
+
+Запуск из корня проекта:
+    python -m benchmarks.load_test [пользователей] [одновременных сессий]
+Хранилище выбирается как у бота: STORAGE_BACKEND=sqlite python -m benchmarks.load_test
+"""
+import asyncio
+import gc
+import logging
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+from typing import Callable, Dict, List
+
+from benchmarks.fake_telegram import FakeTelegram
+from benchmarks.memory_bench import DAYS, SUBJECTS, TIMES, WORDS
+
+Script = Callable[[random.Random, int], List[str]]
+
+
+def percentile(values: List[float], share: float) -> float:
+    """Перцентиль по отсортированному списку (ближайший ранг)"""
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, int(share * len(values)))]
+
+
+def note_text(rng: random.Random) -> str:
+    return " ".join(rng.choice(WORDS) for _ in range(rng.randint(3, 15)))
+
+
+def add_class(rng: random.Random) -> List[str]:
+    return ["➕ Добавить пару", rng.choice(DAYS), rng.choice(TIMES), rng.choice(SUBJECTS)]
+
+
+# Сценарии: сообщения одного пользователя по порядку
+def onboarding(rng: random.Random, user_id: int) -> List[str]:
+    return ["/start"] + [note_text(rng) for _ in range(3)] + add_class(rng)
+
+
+def notes(rng: random.Random, user_id: int) -> List[str]:
+    return [note_text(rng) for _ in range(5)]
+
+
+def search(rng: random.Random, user_id: int) -> List[str]:
+    return ["🔍 Поиск", rng.choice(WORDS), "🔍 Поиск", " ".join(rng.sample(WORDS, 2))]
+
+
+def schedule(rng: random.Random, user_id: int) -> List[str]:
+    return ["📋 Посмотреть расписание", "/today"] + add_class(rng)
+
+
+MIXES: Dict[str, Script] = {"notes": notes, "search": search, "schedule": schedule}
+
+
+class LoadTest:
+    def __init__(self, bot_module, fake: FakeTelegram, concurrency: int):
+        self.bot = bot_module
+        self.fake = fake
+        self.concurrency = concurrency
+        self.rng = random.Random(42)
+        self.save_seconds = 0.0
+
+        # Время сохранений считается поверх метрик бота
+        observe_flush = bot_module.persistence.on_flush
+
+        def on_flush(latency: float, mutations: int, ok: bool):
+            self.save_seconds += latency
+            if observe_flush is not None:
+                observe_flush(latency, mutations, ok)
+
+        bot_module.persistence.on_flush = on_flush
+
+    async def replay(self, users: List[int], script: Script) -> List[float]:
+        """Сценарий для всех пользователей, concurrency сессий одновременно.
+
+        Сообщения одного пользователя идут строго по очереди, как в Telegram.
+        """
+        latencies: List[float] = []
+        pending = iter(users)
+
+        async def session():
+            for user_id in pending:
+                for text in script(self.rng, user_id):
+                    update = self.fake.message_update(user_id, text)
+                    started = time.perf_counter()
+                    await self.bot.dp.feed_raw_update(self.bot.bot, update)
+                    latencies.append(time.perf_counter() - started)
+
+        await asyncio.gather(*(session() for _ in range(self.concurrency)))
+        return latencies
+
+    async def digest(self, users: List[int]) -> List[float]:
+        """Утренняя рассылка всем пользователям; задержка - подготовка и отправка одного сообщения"""
+        latencies: List[float] = []
+
+        async def render(user_id: int):
+            started = time.perf_counter()
+            text = await self.bot.render_digest(user_id)
+            latencies.append(time.perf_counter() - started)
+            return text
+
+        # Замер отправки, а не лимитов: лимиты задаются через BROADCAST_RATE
+        await self.bot.broadcaster.run("loadtest-digest", users, render, resumable=False)
+        return latencies
+
+    async def phase(self, name: str, run, count_sent: bool = False):
+        self.save_seconds = 0.0
+        sent_before = self.fake.counts["sendMessage"]
+        started = time.perf_counter()
+        latencies = await run()
+        # Хвост несохранённых изменений тоже относится к сценарию
+        await self.bot.persistence.flush()
+        elapsed = time.perf_counter() - started
+
+        operations = self.fake.counts["sendMessage"] - sent_before if count_sent else len(latencies)
+        latencies.sort()
+        print(
+            f"{name:<11}{operations:>8}{operations / elapsed:>10.0f}"
+            f"{percentile(latencies, 0.50) * 1000:>9.2f}{percentile(latencies, 0.95) * 1000:>9.2f}"
+            f"{percentile(latencies, 0.99) * 1000:>9.2f}{self.save_seconds / elapsed * 100:>9.1f}%"
+        )
+
+
+async def run(users: int, concurrency: int):
+    fake = FakeTelegram(record=False)
+    api_url = await fake.start()
+
+    workdir = tempfile.mkdtemp(prefix="studybuddy-load-")
+    os.environ.update(
+        BOT_TOKEN="123456:TEST-load-test-token",
+        TELEGRAM_API_URL=api_url,
+        BROADCAST_RATE=os.environ.get("BROADCAST_RATE", "1000000"),
+        BROADCAST_CHAT_RATE=os.environ.get("BROADCAST_CHAT_RATE", "1000000"),
+        THROTTLE_RATE=os.environ.get("THROTTLE_RATE", "0"),
+    )
+    os.chdir(workdir)
+    import main as bot_module
+    # Журнал каждого обновления исказил бы замер
+    logging.disable(logging.INFO)
+
+    await bot_module.load_data()
+    test = LoadTest(bot_module, fake, concurrency)
+    user_ids = list(range(1, users + 1))
+    print(f"Пользователей: {users}, сессий: {concurrency}, "
+          f"хранилище: {bot_module.STORAGE_BACKEND}, каталог: {workdir}")
+    print(f"{'сценарий':<11}{'операций':>8}{'в сек.':>10}{'p50 мс':>9}{'p95 мс':>9}{'p99 мс':>9}{'запись':>10}")
+
+    try:
+        gc.collect()
+        tracemalloc.start()
+        before, _ = tracemalloc.get_traced_memory()
+        await test.phase("onboarding", lambda: test.replay(user_ids, onboarding))
+        gc.collect()
+        after, _ = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        for name, script in MIXES.items():
+            await test.phase(name, lambda script=script: test.replay(user_ids, script))
+        await test.phase("digest", lambda: test.digest(user_ids), count_sent=True)
+
+        print(f"Память: +{(after - before) / users * 10000 / 2 ** 20:.1f} МБ на 10 000 пользователей "
+              f"(onboarding, tracemalloc)")
+    finally:
+        await bot_module.persistence.flush()
+        await bot_module.fsm_storage.close()
+        await bot_module.storage.close()
+        await bot_module.bot.session.close()
+        await fake.stop()
+
+
+if __name__ == "__main__":
+    asyncio.run(run(
+        int(sys.argv[1]) if len(sys.argv) > 1 else 2000,
+        int(sys.argv[2]) if len(sys.argv) > 2 else 64,
+    ))
@@ -0,0 +1,97 @@
+"""Память на пользователя: словари user_data.json против компактных записей.
+
+Генерирует синтетических пользователей (расписание, дедлайны, заметки),
+загружает их как json.loads и как records.UserRecord и сравнивает объём
+выделенной памяти по tracemalloc.
+
+Запуск из корня проекта: python -m benchmarks.memory_bench [пользователей]
+"""
+import gc
+import json
+import random
+import sys
+import tracemalloc
+from datetime import datetime, timedelta
+
+from records import StringArena, UserRecord
+
+DAYS = ["Понедельник", "Вторник", "Среда", "Четверг", "Пятница", "Суббота"]
+TIMES = ["08:30", "10:10", "11:50", "13:30", "15:10", "16:50"]
+SUBJECTS = [
+    "Математический анализ", "Линейная алгебра", "Программирование", "Физика",
+    "История", "Английский язык", "Базы данных", "Алгоритмы", "Философия",
+    "Экономика", "Дискретная математика", "Операционные системы",
+]
+WORDS = (
+    "повторить конспект лекции задача вариант сдать отчёт лабораторная "
+    "формула доказательство семинар вопрос экзамен билет тема глава страница"
+).split()
+
+
+def stamp(rng: random.Random) -> str:
+    moment = datetime(2025, 9, 1) + timedelta(minutes=rng.randrange(300 * 24 * 60))
+    return moment.strftime("%d.%m.%Y %H:%M")
+
+
+def make_user(rng: random.Random, user_id: int) -> dict:
+    schedule = []
+    for _ in range(rng.randint(8, 20)):
+        weekday = rng.randrange(len(DAYS))
+        time_index = rng.randrange(len(TIMES))
+        schedule.append({
+            "day": DAYS[weekday], "time": TIMES[time_index], "subject": rng.choice(SUBJECTS),
+            "added": stamp(rng), "weekday": weekday, "minutes": 8 * 60 + 30 + time_index * 100,
+        })
+    deadlines = []
+    for _ in range(rng.randint(2, 10)):
+        due = datetime(2025, 9, 1) + timedelta(days=rng.randrange(300))
+        deadlines.append({
+            "name": f"{rng.choice(SUBJECTS)}: {rng.choice(WORDS)}", "due_date": due.strftime("%d.%m.%Y"),
+            "created": stamp(rng), "completed": rng.random() < 0.5, "due": due.date().isoformat(),
+        })
+    notes = []
+    for _ in range(rng.randint(5, 40)):
+        note = {"text": " ".join(rng.choice(WORDS) for _ in range(rng.randint(3, 30))), "created": stamp(rng)}
+        if rng.random() < 0.3:
+            note["quick_save"] = True
+        notes.append(note)
+    return {"name": f"Студент {user_id}", "schedule": schedule, "deadlines": deadlines, "notes": notes}
+
+
+def measure(build) -> int:
+    """Память, которую удерживает результат build()"""
+    gc.collect()
+    tracemalloc.start()
+    result = build()
+    gc.collect()
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del result
+    return current
+
+
+def main(users: int):
+    rng = random.Random(42)
+    raw = json.dumps({str(i): make_user(rng, i) for i in range(users)}, ensure_ascii=False)
+    items = sum(len(v) for u in json.loads(raw).values() for k, v in u.items() if isinstance(v, list))
+
+    def as_dicts():
+        return {int(k): v for k, v in json.loads(raw).items()}
+
+    def as_records():
+        arena = StringArena()
+        data = {int(k): v for k, v in json.loads(raw).items()}
+        records = {user_id: UserRecord.from_dict(user, arena) for user_id, user in data.items()}
+        del data
+        return records, arena
+
+    before = measure(as_dicts)
+    after = measure(as_records)
+    print(f"Пользователей: {users}, записей: {items} ({items / users:.1f} на пользователя)")
+    print(f"Словари:  {before / users:8.0f} байт/польз., {before / items:6.0f} байт/запись")
+    print(f"Записи:   {after / users:8.0f} байт/польз., {after / items:6.0f} байт/запись")
+    print(f"Экономия: {(1 - after / before) * 100:.0f}%")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 2000)
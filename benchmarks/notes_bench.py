@@ -0,0 +1,105 @@
+"""Заметки: тексты подряд (StringArena) против NoteStore с дедупликацией и сжатием.
+
+Генерирует синтетических пользователей, у которых кроме коротких заметок
+есть вставленные много раз фрагменты лекций и ссылки, и сравнивает:
+
+    память   - объём записей UserRecord с текстами по tracemalloc
+    диск     - размер снапшота user_data.json: с отступами (indent=2, как
+               было изначально), компактный JSON и формат с note_bodies
+    превью   - время подготовки превью всех заметок: полный текст из
+               StringArena и render.preview против NoteStore.head
+
+Запуск из корня проекта: python -m benchmarks.notes_bench [пользователей]
+"""
+import json
+import random
+import sys
+import time
+
+from benchmarks.memory_bench import WORDS, make_user, measure, stamp
+from notestore import NoteStore
+from records import StringArena, UserRecord
+from render import preview
+
+
+def sentence(rng: random.Random) -> str:
+    words = [rng.choice(WORDS) for _ in range(rng.randint(6, 16))]
+    return " ".join(words).capitalize() + "."
+
+
+def add_pastes(rng: random.Random, user: dict):
+    """Повторно вставленные фрагменты лекций и ссылки среди заметок пользователя"""
+    snippets = [
+        " ".join(sentence(rng) for _ in range(rng.randint(8, 40)))
+        for _ in range(rng.randint(1, 3))
+    ]
+    links = [
+        f"https://lms.example.edu/course/{rng.randrange(1000)}/lecture/{rng.randrange(100)}"
+        f"?section={rng.choice(WORDS)}&page={rng.randrange(500)}&utm_source=telegram"
+        for _ in range(rng.randint(1, 4))
+    ]
+    for _ in range(rng.randint(5, 30)):
+        text = rng.choice(snippets) if rng.random() < 0.5 else rng.choice(links)
+        user["notes"].append({"text": text, "created": stamp(rng), "quick_save": True})
+    rng.shuffle(user["notes"])
+
+
+def timed(function) -> float:
+    started = time.perf_counter()
+    function()
+    return time.perf_counter() - started
+
+
+def main(users: int):
+    rng = random.Random(42)
+    data = {}
+    for user_id in range(users):
+        user = make_user(rng, user_id)
+        add_pastes(rng, user)
+        data[user_id] = user
+    raw = json.dumps({str(k): v for k, v in data.items()}, ensure_ascii=False)
+    notes = sum(len(user["notes"]) for user in data.values())
+    text_bytes = sum(len(note["text"].encode("utf-8")) for user in data.values() for note in user["notes"])
+
+    def load(arena_type):
+        def build():
+            arena = arena_type()
+            records = {int(k): UserRecord.from_dict(v, arena) for k, v in json.loads(raw).items()}
+            return records, arena
+        return build
+
+    ram_before = measure(load(StringArena))
+    ram_after = measure(load(NoteStore))
+
+    arena = NoteStore()
+    records = {user_id: UserRecord.from_dict(user, arena) for user_id, user in data.items()}
+    disk_indent = len(json.dumps(data, ensure_ascii=False, indent=2).encode("utf-8"))
+    disk_compact = len(raw.encode("utf-8"))
+    packed = {user_id: user.to_dict(arena, packed=True) for user_id, user in records.items()}
+    disk_packed = len(json.dumps(packed, ensure_ascii=False, separators=(",", ":")).encode("utf-8"))
+
+    plain = StringArena()
+    plain_refs = [note.text for user in data.values() for note in
+                  UserRecord.from_dict(user, plain).notes]
+    refs = [note.text for user in records.values() for note in user.notes]
+    full = timed(lambda: [preview(plain.get(ref), 80) for ref in plain_refs])
+    head = timed(lambda: [preview(arena.head(ref), 80) for ref in refs])
+
+    stats = arena.stats()
+    print(f"Пользователей: {users}, заметок: {notes} ({notes / users:.1f} на пользователя), "
+          f"текста {text_bytes / 2 ** 20:.1f} МБ")
+    print(f"Уникальных длинных текстов: {stats['note_blobs']} (сжато {stats['note_blobs_compressed']}), "
+          f"повторов: {stats['note_dedup_hits']}")
+    print(f"{'':<28}{'было':>10}{'стало':>10}{'экономия':>10}")
+    print(f"{'память, МБ':<28}{ram_before / 2 ** 20:>10.1f}{ram_after / 2 ** 20:>10.1f}"
+          f"{(1 - ram_after / ram_before) * 100:>9.0f}%")
+    print(f"{'снапшот indent=2, МБ':<28}{disk_indent / 2 ** 20:>10.1f}{disk_packed / 2 ** 20:>10.1f}"
+          f"{(1 - disk_packed / disk_indent) * 100:>9.0f}%")
+    print(f"{'снапшот компактный, МБ':<28}{disk_compact / 2 ** 20:>10.1f}{disk_packed / 2 ** 20:>10.1f}"
+          f"{(1 - disk_packed / disk_compact) * 100:>9.0f}%")
+    print(f"{'превью всех заметок, мс':<28}{full * 1000:>10.1f}{head * 1000:>10.1f}"
+          f"{(1 - head / full) * 100:>9.0f}%")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 2000)
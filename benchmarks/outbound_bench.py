@@ -0,0 +1,110 @@
+"""Исходящие запросы к Bot API: сессия aiogram по умолчанию и OutboundSession с OutboundGate.
+
+Бот отправляет сообщения в локальную имитацию Bot API (FakeTelegram),
+которая отвечает с задержкой, как настоящий API:
+
+    пик          - N сообщений сразу (например, утренняя рассылка без лимитов):
+                   сообщений в секунду
+    ответы       - ответы пользователям каждые 20 мс на фоне рассылки:
+                   задержка ответа p50/p95
+    429          - первые запросы получают Flood control (retry after 1):
+                   сколько ответов пользователям потеряно
+
+Запуск из корня проекта:
+    python -m benchmarks.outbound_bench [сообщений] [задержка API, мс]
+"""
+import asyncio
+import logging
+import sys
+import time
+from typing import List
+
+from aiogram import Bot
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
+
+from benchmarks.fake_telegram import FakeTelegram
+from benchmarks.load_test import percentile
+from outbound import OutboundGate, OutboundSession, background
+
+# Одновременных отправок в пике: больше, чем соединений в любом из пулов
+SENDERS = 1000
+
+
+def make_bot(api: TelegramAPIServer, tuned: bool) -> Bot:
+    if not tuned:
+        return Bot("123456:TEST-outbound-bench", session=AiohttpSession(api=api))
+    session = OutboundSession(pool_size=256, api=api)
+    session.middleware(OutboundGate(concurrency=224))
+    return Bot("123456:TEST-outbound-bench", session=session)
+
+
+async def burst(bot: Bot, count: int) -> float:
+    pending = iter(range(count))
+
+    async def sender():
+        for _ in pending:
+            with background():
+                await bot.send_message(1, "рассылка")
+
+    started = time.perf_counter()
+    await asyncio.gather(*(sender() for _ in range(SENDERS)))
+    return count / (time.perf_counter() - started)
+
+
+async def replies_during_burst(bot: Bot, count: int) -> List[float]:
+    latencies: List[float] = []
+    broadcast = asyncio.ensure_future(burst(bot, count))
+    while not broadcast.done():
+        started = time.perf_counter()
+        await bot.send_message(2, "ответ")
+        latencies.append(time.perf_counter() - started)
+        await asyncio.sleep(0.02)
+    await broadcast
+    return sorted(latencies)
+
+
+async def replies_under_flood(bot: Bot, fake: FakeTelegram, replies: int) -> int:
+    fake.flood_count = replies // 2
+    lost = 0
+
+    async def reply(chat_id: int):
+        nonlocal lost
+        try:
+            await bot.send_message(chat_id, "ответ")
+        except Exception:
+            lost += 1
+
+    await asyncio.gather(*(reply(chat_id) for chat_id in range(replies)))
+    fake.flood_count = 0
+    return lost
+
+
+async def main(count: int, latency_ms: float):
+    # Предупреждения о 429 здесь ожидаемы
+    logging.disable(logging.WARNING)
+    fake = FakeTelegram(latency=latency_ms / 1000, record=False)
+    api = TelegramAPIServer.from_base(await fake.start())
+    print(f"Сообщений в пике: {count}, задержка API: {latency_ms:.0f} мс")
+    print(f"{'сессия':<24}{'пик, сообщ./с':>15}{'ответ p50 мс':>14}{'ответ p95 мс':>14}{'потеряно при 429':>18}")
+    try:
+        for tuned in (False, True):
+            bot = make_bot(api, tuned)
+            # Прогрев: соединения пула открыты
+            await burst(bot, 300)
+            rate = await burst(bot, count)
+            latencies = await replies_during_burst(bot, count)
+            lost = await replies_under_flood(bot, fake, 20)
+            name = "OutboundSession + Gate" if tuned else "aiogram по умолчанию"
+            print(f"{name:<24}{rate:>15.0f}{percentile(latencies, 0.5) * 1000:>14.1f}"
+                  f"{percentile(latencies, 0.95) * 1000:>14.1f}{lost:>12} из 20")
+            await bot.session.close()
+    finally:
+        await fake.stop()
+
+
+if __name__ == "__main__":
+    asyncio.run(main(
+        int(sys.argv[1]) if len(sys.argv) > 1 else 5000,
+        float(sys.argv[2]) if len(sys.argv) > 2 else 150,
+    ))
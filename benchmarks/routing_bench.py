@@ -0,0 +1,96 @@
+"""Накладные расходы маршрутизации сообщения до обработчика: до и после ButtonRouter.
+
+Собирает два Dispatcher с тем же порядком регистрации, что в main.py
+(команды, кнопки, шаги диалогов, обработчик остальных сообщений), но с
+пустыми обработчиками. В первом кнопки - цепочка lambda-фильтров, во
+втором - ButtonRouter. Для каждого вида сообщения измеряется среднее
+время dp.feed_update, то есть чистая стоимость маршрутизации.
+
+Запуск из корня проекта: python -m benchmarks.routing_bench [повторов]
+"""
+import asyncio
+import sys
+import time
+from datetime import datetime
+
+from aiogram import Bot, Dispatcher
+from aiogram.filters import Command
+from aiogram.fsm.state import State, StatesGroup
+from aiogram.types import Chat, Message, Update, User
+
+from button_router import ButtonRouter
+from render import BUTTON_TEXTS
+
+COMMANDS = ["start", "menu", "help", "today", "ping", "status", "timezone", "digest", "done"]
+# Кнопки в порядке регистрации в main.py
+BUTTONS = [
+    "📅 Расписание", "➕ Добавить пару", "📋 Посмотреть расписание", "⏰ Дедлайны",
+    "➕ Новый дедлайн", "📋 Мои дедлайны", "📝 Заметки", "➕ Новая заметка",
+    "📋 Все заметки", "🔍 Поиск", "📋 Сегодня", "ℹ️ Помощь", "↩️ Назад",
+]
+MESSAGES = {
+    "первая кнопка": BUTTONS[0],
+    "последняя кнопка": BUTTONS[-2],
+    "быстрая заметка": "повторить конспект лекции",
+    "команда": "/today",
+}
+
+
+class Form(StatesGroup):
+    step = State()
+
+
+async def noop(message: Message):
+    return True
+
+
+def build(routed: bool) -> Dispatcher:
+    dp = Dispatcher()
+    for command in COMMANDS:
+        dp.message.register(noop, Command(command))
+    if routed:
+        router = ButtonRouter(dp.message, yield_to_state=["↩️ Назад"])
+        dp.message.outer_middleware(router)
+        for text in BUTTONS:
+            router.button(text)(noop)
+    else:
+        for text in BUTTONS:
+            dp.message.register(noop, lambda m, text=text: m.text == text)
+    # Шаги диалогов: в main.py их 7, все с фильтром состояния
+    for _ in range(7):
+        dp.message.register(noop, Form.step)
+    dp.message.register(noop)
+    return dp
+
+
+def update(text: str, update_id: int) -> Update:
+    user = User(id=42, is_bot=False, first_name="Bench")
+    return Update(update_id=update_id, message=Message(
+        message_id=update_id, date=datetime.now(), text=text,
+        chat=Chat(id=42, type="private"), from_user=user
+    ))
+
+
+async def measure(dp: Dispatcher, bot: Bot, text: str, repeats: int) -> float:
+    updates = [update(text, i) for i in range(repeats)]
+    for item in updates[:100]:
+        await dp.feed_update(bot, item)
+    started = time.perf_counter()
+    for item in updates:
+        await dp.feed_update(bot, item)
+    return (time.perf_counter() - started) / repeats
+
+
+async def main(repeats: int):
+    assert set(BUTTONS) == BUTTON_TEXTS, "список кнопок разошёлся с render.py"
+    bot = Bot("123456:TEST-routing-bench-token")
+    chains = {"lambda-фильтры": build(False), "ButtonRouter": build(True)}
+    print(f"{'сообщение':<18}" + "".join(f"{name:>16}" for name in chains) + f"{'ускорение':>11}")
+    for label, text in MESSAGES.items():
+        times = [await measure(dp, bot, text, repeats) for dp in chains.values()]
+        print(f"{label:<18}" + "".join(f"{t * 1e6:>13.1f} мкс" for t in times) + f"{times[0] / times[1]:>10.2f}x")
+    await bot.session.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main(int(sys.argv[1]) if len(sys.argv) > 1 else 5000))
@@ -0,0 +1,72 @@
+"""Пропускная способность (обновлений/с) в зависимости от числа воркеров.
+
+Для каждого числа воркеров запускает main.py с SHARD_WORKERS=N против
+FakeTelegram, регистрирует пользователей, затем разом кладёт в getUpdates
+пачку сообщений и измеряет время, за которое бот на все ответил.
+
+Запуск из корня проекта:
+    python -m benchmarks.shard_bench [обновлений] [воркеры через запятую]
+"""
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+from benchmarks.fake_telegram import FakeTelegram
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+USERS = 200
+TEXTS = ["/today", "📋 Все заметки", "📋 Мои дедлайны", "/status"]
+
+
+async def measure(workers: int, updates: int, base_port: int) -> float:
+    fake = FakeTelegram()
+    api_url = await fake.start()
+    workdir = tempfile.mkdtemp(prefix=f"studybuddy-shards{workers}-")
+    env = dict(
+        os.environ,
+        BOT_TOKEN="123456:TEST-shard-bench-token",
+        TELEGRAM_API_URL=api_url,
+        SHARD_WORKERS=str(workers),
+        SHARD_BASE_PORT=str(base_port),
+        PORT=str(base_port - 1),
+        # Пачка обновлений разом: лимиты нагрузки исказили бы замер
+        THROTTLE_RATE=os.environ.get("THROTTLE_RATE", "0"),
+        UPDATE_MAX_WAITING=os.environ.get("UPDATE_MAX_WAITING", str(updates + USERS)),
+    )
+    env.pop("WEBHOOK_URL", None)
+    process = await asyncio.create_subprocess_exec(
+        sys.executable, os.path.join(ROOT, "main.py"), cwd=workdir, env=env,
+        stdout=asyncio.subprocess.DEVNULL, stderr=asyncio.subprocess.DEVNULL
+    )
+    try:
+        await fake.wait_for("getUpdates", timeout=60)
+        for user_id in range(1, USERS + 1):
+            await fake.push(fake.message_update(user_id, "/start"))
+        await fake.wait_for("sendMessage", USERS, timeout=120)
+
+        sent_before = len(fake.sent())
+        started = time.perf_counter()
+        for i in range(updates):
+            await fake.push(fake.message_update(i % USERS + 1, TEXTS[i % len(TEXTS)]))
+        await fake.wait_for("sendMessage", sent_before + updates, timeout=600)
+        return updates / (time.perf_counter() - started)
+    finally:
+        process.terminate()
+        await process.wait()
+        await fake.stop()
+
+
+async def main(updates: int, counts):
+    baseline = None
+    for index, workers in enumerate(counts):
+        rate = await measure(workers, updates, 17200 + index * 100)
+        baseline = baseline or rate
+        print(f"воркеров: {workers:2d}  {rate:8.0f} обновл./с  x{rate / baseline:.2f}")
+
+
+if __name__ == "__main__":
+    total = int(sys.argv[1]) if len(sys.argv) > 1 else 4000
+    workers_list = [int(n) for n in sys.argv[2].split(",")] if len(sys.argv) > 2 else [1, 2, 4]
+    asyncio.run(main(total, workers_list))
@@ -0,0 +1,129 @@
+"""Холодный запуск бота: обычный (user_data.json) и FAST_START=1 (user_data.bin).
+
+Создаёт данные N синтетических пользователей в двух временных каталогах -
+JSON-снапшот и двоичный снапшот - и для каждого запускает отдельный процесс,
+который выполняет main() бота на локальной имитации Bot API с одним
+ожидающим обновлением (/start уже зарегистрированного пользователя).
+
+Для каждого режима выводятся время импорта main.py, загрузки данных до начала
+приёма обновлений, время от старта процесса до ответа на первое обновление
+и время отложенной догрузки (FAST_START).
+
+Запуск из корня проекта: python -m benchmarks.startup_bench [пользователей]
+"""
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+MODES = {"user_data.json": "0", "FAST_START=1": "1"}
+
+
+def timed(timings: dict, name: str, function):
+    async def wrapper(*args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return await function(*args, **kwargs)
+        finally:
+            timings[name] = timings.get(name, 0.0) + time.perf_counter() - started
+    return wrapper
+
+
+async def child(started: float):
+    """Один запуск бота в текущем каталоге; результат - строка JSON"""
+    import asyncio
+    import logging
+
+    from benchmarks.fake_telegram import FakeTelegram
+
+    fake = FakeTelegram()
+    api_url = await fake.start()
+    os.environ.update(BOT_TOKEN="123456:TEST-startup-bench", TELEGRAM_API_URL=api_url, PORT="0")
+    await fake.push(fake.message_update(1, "/start"))
+
+    timings = {}
+    before_import = time.perf_counter()
+    import main as bot_module
+    timings["import"] = time.perf_counter() - before_import
+    logging.disable(logging.INFO)
+
+    if bot_module.FAST_START:
+        bot_module.open_storage = timed(timings, "load", bot_module.open_storage)
+        bot_module.storage.materialize = timed(timings, "deferred", bot_module.storage.materialize)
+        bot_module.build_indexes = timed(timings, "indexes", bot_module.build_indexes)
+    else:
+        bot_module.load_data = timed(timings, "load", bot_module.load_data)
+
+    task = asyncio.ensure_future(bot_module.main())
+    await fake.wait_for("sendMessage", timeout=120)
+    timings["first_update"] = time.perf_counter() - started
+    if bot_module.FAST_START:
+        # Догрузка начинается после первого обновления
+        while "indexes" not in timings:
+            await asyncio.sleep(0.01)
+        timings["deferred"] += timings["indexes"]
+    task.cancel()
+    try:
+        await task
+    except asyncio.CancelledError:
+        pass
+    await fake.stop()
+    print(json.dumps(timings))
+
+
+def prepare(users: int) -> dict:
+    """Каталоги с одинаковыми данными в обоих форматах"""
+    import asyncio
+    import random
+
+    from benchmarks.memory_bench import make_user
+    from storage import SEQ_KEY, MemoryBackend, WriteAheadLog
+
+    rng = random.Random(42)
+    data = {SEQ_KEY: 0}
+    data.update({str(user_id): make_user(rng, user_id) for user_id in range(1, users + 1)})
+    dirs = {}
+    for mode, fast in MODES.items():
+        path = dirs[mode] = tempfile.mkdtemp(prefix="studybuddy-startup-")
+        with open(os.path.join(path, "user_data.json"), "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False, separators=(",", ":"))
+        if fast == "1":
+            async def convert():
+                backend = MemoryBackend(WriteAheadLog(os.path.join(path, "user_data.json"), binary=True))
+                await backend.start()
+                await backend.close()
+            asyncio.run(convert())
+    return dirs
+
+
+def main(users: int):
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    dirs = prepare(users)
+    sizes = {mode: sum(os.path.getsize(os.path.join(path, name)) for name in os.listdir(path))
+             for mode, path in dirs.items()}
+    print(f"Пользователей: {users}")
+    print(f"{'режим':<16}{'снапшот МБ':>11}{'импорт с':>10}{'загрузка с':>12}"
+          f"{'1-й ответ с':>13}{'догрузка с':>12}")
+    for mode, fast in MODES.items():
+        env = dict(os.environ, FAST_START=fast, PYTHONPATH=root)
+        result = subprocess.run(
+            [sys.executable, "-m", "benchmarks.startup_bench", "--child"],
+            cwd=dirs[mode], env=env, capture_output=True, text=True, timeout=300
+        )
+        if result.returncode != 0:
+            print(result.stderr)
+            raise SystemExit(f"{mode}: процесс завершился с кодом {result.returncode}")
+        timings = json.loads(result.stdout.strip().splitlines()[-1])
+        deferred = f"{timings['deferred']:>12.2f}" if "deferred" in timings else f"{'-':>12}"
+        print(f"{mode:<16}{sizes[mode] / 2 ** 20:>11.1f}{timings['import']:>10.2f}{timings['load']:>12.2f}"
+              f"{timings['first_update']:>13.2f}{deferred}")
+
+
+if __name__ == "__main__":
+    if sys.argv[1:] == ["--child"]:
+        import asyncio
+        asyncio.run(child(time.perf_counter()))
+    else:
+        main(int(sys.argv[1]) if len(sys.argv) > 1 else 20000)
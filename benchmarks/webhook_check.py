@@ -0,0 +1,77 @@
+"""Проверка режима webhook на локальной имитации Telegram.
+
+Запускает бота (main.py) отдельным процессом с WEBHOOK_URL и
+TELEGRAM_API_URL, указывающим на FakeTelegram, и проверяет, что:
+бот устанавливает webhook с секретом, отвечает на присланное обновление,
+отклоняет запросы с неверным секретом. Заодно измеряет время от запуска
+процесса до готовности и задержку ответа на обновление.
+
+Запуск из корня проекта: python -m benchmarks.webhook_check
+"""
+import asyncio
+import os
+import socket
+import sys
+import tempfile
+import time
+
+from benchmarks.fake_telegram import FakeTelegram
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+USER_ID = 424242
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+async def check():
+    fake = FakeTelegram()
+    api_url = await fake.start()
+    port = free_port()
+    workdir = tempfile.mkdtemp(prefix="studybuddy-webhook-")
+
+    env = dict(
+        os.environ,
+        BOT_TOKEN="123456:TEST-webhook-check-token",
+        TELEGRAM_API_URL=api_url,
+        WEBHOOK_URL=f"http://127.0.0.1:{port}",
+        PORT=str(port),
+    )
+    started = time.perf_counter()
+    process = await asyncio.create_subprocess_exec(
+        sys.executable, os.path.join(ROOT, "main.py"),
+        cwd=workdir, env=env,
+        stdout=asyncio.subprocess.DEVNULL, stderr=asyncio.subprocess.DEVNULL
+    )
+    try:
+        calls = await fake.wait_for("setWebhook", timeout=30)
+        ready = time.perf_counter() - started
+        webhook = calls[0]["params"]
+        assert webhook["url"] == f"http://127.0.0.1:{port}/webhook", webhook
+        assert webhook.get("secret_token"), "webhook без секрета"
+        print(f"✅ setWebhook через {ready:.2f} с после запуска процесса")
+
+        status = await fake.push(fake.message_update(USER_ID, "/start"), secret_token="wrong")
+        assert status == 401, f"неверный секрет принят: {status}"
+        print("✅ запрос с неверным секретом отклонён (401)")
+
+        sent_before = len(fake.sent(USER_ID))
+        pushed = time.perf_counter()
+        status = await fake.push(fake.message_update(USER_ID, "/start"))
+        assert status == 200, status
+        await fake.wait_for("sendMessage", count=sent_before + 1)
+        latency = (time.perf_counter() - pushed) * 1000
+        reply = fake.sent(USER_ID)[-1]["text"]
+        assert "Привет" in reply, reply
+        print(f"✅ ответ на /start через {latency:.1f} мс")
+    finally:
+        process.terminate()
+        await process.wait()
+        await fake.stop()
+
+
+if __name__ == "__main__":
+    asyncio.run(check())
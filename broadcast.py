@@ -0,0 +1,276 @@
+import asyncio
+import json
+import logging
+import os
+import time
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional
+
+from aiogram import Bot
+from aiogram.exceptions import (
+    TelegramForbiddenError,
+    TelegramNetworkError,
+    TelegramRetryAfter,
+)
+
+from outbound import background
+
+logger = logging.getLogger(__name__)
+
+
+class TokenBucket:
+    """Ограничитель скорости «корзина токенов»: rate сообщений в секунду"""
+
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(rate, 1.0)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self):
+        while True:
+            now = time.monotonic()
+            if now < self.blocked_until:
+                await asyncio.sleep(self.blocked_until - now)
+                continue
+            self._refill(now)
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return
+            await asyncio.sleep((1 - self.tokens) / self.rate)
+
+    def try_acquire(self) -> bool:
+        """Токен без ожидания; False - лимит исчерпан"""
+        now = time.monotonic()
+        if now < self.blocked_until:
+            return False
+        self._refill(now)
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True
+        return False
+
+    def pause(self, seconds: float):
+        """Остановка выдачи токенов (ответ 429 от Telegram)"""
+        self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+        self.tokens = 0
+
+
+class BroadcastStats:
+    """Итоги одной рассылки"""
+
+    def __init__(self, job_id: str, total: int):
+        self.job_id = job_id
+        self.total = total
+        self.resumed_from = 0
+        self.sent = 0
+        self.failed = 0
+        self.blocked = 0
+        self.retries = 0
+        self.started = time.time()
+        self.finished: Optional[float] = None
+
+    @property
+    def elapsed(self) -> float:
+        return (self.finished or time.time()) - self.started
+
+    @property
+    def rate(self) -> float:
+        return self.sent / self.elapsed if self.elapsed > 0 else 0.0
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "job_id": self.job_id,
+            "total": self.total,
+            "resumed_from": self.resumed_from,
+            "sent": self.sent,
+            "failed": self.failed,
+            "blocked": self.blocked,
+            "retries": self.retries,
+            "elapsed_s": round(self.elapsed, 3),
+            "rate_per_s": round(self.rate, 2),
+            "finished": self.finished is not None,
+        }
+
+
+class Broadcaster:
+    """Массовая рассылка с пулом воркеров и соблюдением лимитов Telegram.
+
+    Получатели обходятся по возрастанию chat_id; курсор каждой рассылки
+    (последний chat_id, до которого всё отправлено) периодически сохраняется
+    на диск, поэтому после падения рассылка с тем же job_id продолжается
+    с места остановки. Несколько рассылок могут идти одновременно.
+    """
+
+    def __init__(self, bot: Bot, workers: int = 16, global_rate: float = 25.0,
+                 per_chat_rate: float = 1.0, max_retries: int = 3,
+                 cursor_path: str = "broadcast_cursor.json"):
+        self.bot = bot
+        self.workers = workers
+        self.global_rate = global_rate
+        self.per_chat_rate = per_chat_rate
+        self.max_retries = max_retries
+        self.cursor_path = cursor_path
+
+        self.global_bucket = TokenBucket(global_rate)
+        self.chat_buckets: Dict[int, TokenBucket] = {}
+        self.last_stats: Optional[BroadcastStats] = None
+        self._active = 0
+
+        # job_id -> последний chat_id, до которого всё отправлено
+        self.cursors: Dict[str, Optional[int]] = self._read_cursors()
+        self._cursor_lock: Optional[asyncio.Lock] = None
+
+    # ---------- курсоры ----------
+    def _read_cursors(self) -> Dict[str, Optional[int]]:
+        try:
+            with open(self.cursor_path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+        except Exception as e:
+            logger.warning(f"Не удалось прочитать курсоры рассылок: {e}")
+            return {}
+
+    def _write_cursors(self, cursors: Dict[str, Optional[int]]):
+        tmp_path = self.cursor_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(cursors, f)
+        os.replace(tmp_path, self.cursor_path)
+
+    async def _save_cursors(self):
+        if self._cursor_lock is None:
+            self._cursor_lock = asyncio.Lock()
+        async with self._cursor_lock:
+            await asyncio.to_thread(self._write_cursors, dict(self.cursors))
+
+    def unfinished_jobs(self) -> List[str]:
+        """job_id рассылок, прерванных до завершения"""
+        return list(self.cursors)
+
+    def forget(self, job_id: str):
+        """Отказ от продолжения прерванной рассылки"""
+        self.cursors.pop(job_id, None)
+        self._write_cursors(dict(self.cursors))
+
+    # ---------- отправка ----------
+    def _chat_bucket(self, chat_id: int) -> TokenBucket:
+        bucket = self.chat_buckets.get(chat_id)
+        if bucket is None:
+            bucket = self.chat_buckets[chat_id] = TokenBucket(self.per_chat_rate)
+        return bucket
+
+    async def send(self, chat_id: int, text: str, stats: Optional[BroadcastStats] = None,
+                   **kwargs) -> bool:
+        """Отправка одного сообщения с учётом лимитов и повторами после 429"""
+        for attempt in range(self.max_retries + 1):
+            await self.global_bucket.acquire()
+            await self._chat_bucket(chat_id).acquire()
+            try:
+                # Рассылка уступает очередь ответам пользователям
+                with background():
+                    await self.bot.send_message(chat_id, text, **kwargs)
+            except TelegramRetryAfter as e:
+                if stats is not None:
+                    stats.retries += 1
+                logger.warning(f"Лимит Telegram, пауза {e.retry_after} с")
+                self.global_bucket.pause(e.retry_after)
+                await asyncio.sleep(e.retry_after)
+            except TelegramForbiddenError:
+                # Пользователь заблокировал бота
+                if stats is not None:
+                    stats.blocked += 1
+                return False
+            except TelegramNetworkError as e:
+                if stats is not None:
+                    stats.retries += 1
+                logger.warning(f"Сетевая ошибка при отправке {chat_id}: {e}")
+                await asyncio.sleep(2 ** attempt)
+            except Exception as e:
+                logger.error(f"Не удалось отправить сообщение пользователю {chat_id}: {e}")
+                break
+            else:
+                if stats is not None:
+                    stats.sent += 1
+                return True
+
+        if stats is not None:
+            stats.failed += 1
+        return False
+
+    async def run(self, job_id: str, chat_ids: Iterable[int],
+                  render: Callable[[int], Awaitable[Optional[str]]],
+                  resumable: bool = True) -> BroadcastStats:
+        """Рассылка render(chat_id) всем получателям; None - пропустить получателя.
+
+        resumable=False - не сохранять курсор (рассылку не нужно продолжать
+        после перезапуска).
+        """
+        recipients: List[int] = sorted(set(chat_ids))
+        stats = BroadcastStats(job_id, len(recipients))
+        self.last_stats = stats
+
+        previous_done = self.cursors.get(job_id)
+        if previous_done is not None:
+            recipients = [chat_id for chat_id in recipients if chat_id > previous_done]
+            stats.resumed_from = stats.total - len(recipients)
+            logger.info(f"Рассылка {job_id} продолжается, осталось {len(recipients)}")
+        if resumable:
+            self.cursors[job_id] = previous_done
+
+        done = [False] * len(recipients)
+        watermark = 0
+        position = iter(range(len(recipients)))
+
+        def advance() -> Optional[int]:
+            nonlocal watermark
+            while watermark < len(done) and done[watermark]:
+                watermark += 1
+            return recipients[watermark - 1] if watermark else previous_done
+
+        async def worker():
+            for i in position:
+                chat_id = recipients[i]
+                try:
+                    text = await render(chat_id)
+                    if text is not None:
+                        await self.send(chat_id, text, stats)
+                except Exception as e:
+                    stats.failed += 1
+                    logger.error(f"Ошибка рассылки пользователю {chat_id}: {e}")
+                done[i] = True
+
+        async def checkpoint():
+            while resumable:
+                await asyncio.sleep(1.0)
+                self.cursors[job_id] = advance()
+                await self._save_cursors()
+
+        self._active += 1
+        checkpoint_task = asyncio.create_task(checkpoint())
+        try:
+            await asyncio.gather(*(worker() for _ in range(max(1, self.workers))))
+        finally:
+            checkpoint_task.cancel()
+            self._active -= 1
+            if not self._active:
+                self.chat_buckets.clear()
+            if resumable:
+                last_done = advance()
+                if watermark == len(done):
+                    self.cursors.pop(job_id, None)
+                else:
+                    self.cursors[job_id] = last_done
+                await self._save_cursors()
+
+        stats.finished = time.time()
+        logger.info(
+            f"Рассылка {job_id}: отправлено {stats.sent} из {stats.total}, "
+            f"ошибок {stats.failed}, заблокировали {stats.blocked}, "
+            f"за {stats.elapsed:.1f} с ({stats.rate:.1f} сообщ./с)"
+        )
+        return stats
@@ -0,0 +1,44 @@
+from typing import Any, Awaitable, Callable, Dict, Iterable
+
+from aiogram import BaseMiddleware
+from aiogram.dispatcher.event.handler import CallbackType, HandlerObject
+from aiogram.dispatcher.event.telegram import TelegramEventObserver
+from aiogram.types import Message, TelegramObject
+
+
+class ButtonRouter(BaseMiddleware):
+    """Маршрутизация нажатий кнопок по словарю «текст кнопки -> обработчик».
+
+    Регистрируется как outer middleware наблюдателя сообщений (dp.message):
+    сообщение с текстом кнопки сразу уходит своему обработчику, минуя
+    перебор фильтров всех зарегистрированных обработчиков. Внутренние
+    middleware наблюдателя (метрики и т.п.) при этом срабатывают как обычно.
+    Остальные сообщения проходят обычную маршрутизацию aiogram.
+
+    Кнопки из yield_to_state в незавершённом диалоге FSM достаются
+    обработчикам состояния (например, «↩️ Назад» возвращает на шаг диалога).
+    """
+
+    def __init__(self, observer: TelegramEventObserver, yield_to_state: Iterable[str] = ()):
+        self.observer = observer
+        self.yield_to_state = frozenset(yield_to_state)
+        self.routes: Dict[str, HandlerObject] = {}
+
+    def button(self, text: str) -> Callable[[CallbackType], CallbackType]:
+        """Декоратор обработчика кнопки"""
+        def wrapper(callback: CallbackType) -> CallbackType:
+            if text in self.routes:
+                raise ValueError(f"Кнопка уже зарегистрирована: {text}")
+            self.routes[text] = HandlerObject(callback=callback)
+            return callback
+        return wrapper
+
+    async def __call__(self, handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+                       event: Message, data: Dict[str, Any]) -> Any:
+        route = self.routes.get(event.text) if event.text is not None else None
+        if route is None or (event.text in self.yield_to_state and data.get("raw_state") is not None):
+            return await handler(event, data)
+
+        data["handler"] = route
+        wrapped = self.observer.middleware.wrap_middlewares(list(self.observer.middleware), route.call)
+        return await wrapped(event, data)
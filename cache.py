@@ -0,0 +1,137 @@
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, List, Optional, Tuple
+
+
+class LRUPolicy:
+    """Вытесняется ключ, к которому дольше всего не обращались"""
+
+    def __init__(self):
+        self.order: "OrderedDict[Hashable, None]" = OrderedDict()
+
+    def add(self, key: Hashable):
+        self.order[key] = None
+
+    def touch(self, key: Hashable):
+        self.order.move_to_end(key)
+
+    def remove(self, key: Hashable):
+        self.order.pop(key, None)
+
+    def victim(self) -> Hashable:
+        return next(iter(self.order))
+
+
+class LFUPolicy:
+    """Вытесняется ключ с наименьшим числом обращений (при равенстве - самый старый).
+
+    Ключи разложены по спискам частот, поэтому все операции - O(1).
+    """
+
+    def __init__(self):
+        self.freq: Dict[Hashable, int] = {}
+        self.buckets: Dict[int, "OrderedDict[Hashable, None]"] = {}
+        self.min_freq = 0
+
+    def _unlink(self, key: Hashable) -> int:
+        count = self.freq.pop(key)
+        bucket = self.buckets[count]
+        del bucket[key]
+        if not bucket:
+            del self.buckets[count]
+            if self.min_freq == count:
+                self.min_freq = count + 1
+        return count
+
+    def _link(self, key: Hashable, count: int):
+        self.freq[key] = count
+        self.buckets.setdefault(count, OrderedDict())[key] = None
+
+    def add(self, key: Hashable):
+        self._link(key, 1)
+        self.min_freq = 1
+
+    def touch(self, key: Hashable):
+        self._link(key, self._unlink(key) + 1)
+
+    def remove(self, key: Hashable):
+        if key in self.freq:
+            self._unlink(key)
+            if not self.freq:
+                self.min_freq = 0
+
+    def victim(self) -> Hashable:
+        while self.min_freq not in self.buckets:
+            self.min_freq += 1
+        return next(iter(self.buckets[self.min_freq]))
+
+
+POLICIES = {"lru": LRUPolicy, "lfu": LFUPolicy}
+
+
+class BoundedCache:
+    """Кэш не больше capacity элементов со сменной политикой вытеснения"""
+
+    def __init__(self, capacity: int, policy: str = "lru"):
+        if policy not in POLICIES:
+            raise ValueError(f"Неизвестная политика кэша: {policy} (есть: {', '.join(POLICIES)})")
+        self.capacity = max(1, capacity)
+        self.policy_name = policy
+        self.policy = POLICIES[policy]()
+        self.items: Dict[Hashable, Any] = {}
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        """Значение с учётом попадания/промаха"""
+        value = self.items.get(key)
+        if value is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.policy.touch(key)
+        return value
+
+    def peek(self, key: Hashable) -> Optional[Any]:
+        """Значение без учёта в статистике и политике"""
+        return self.items.get(key)
+
+    def put(self, key: Hashable, value: Any) -> List[Tuple[Hashable, Any]]:
+        """Добавление; возвращает вытесненные пары (ключ, значение)"""
+        if key in self.items:
+            self.items[key] = value
+            self.policy.touch(key)
+            return []
+
+        evicted = []
+        while len(self.items) >= self.capacity:
+            victim = self.policy.victim()
+            self.policy.remove(victim)
+            evicted.append((victim, self.items.pop(victim)))
+            self.evictions += 1
+        self.items[key] = value
+        self.policy.add(key)
+        return evicted
+
+    def pop(self, key: Hashable) -> Optional[Any]:
+        self.policy.remove(key)
+        return self.items.pop(key, None)
+
+    def __len__(self) -> int:
+        return len(self.items)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self.items
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "policy": self.policy_name,
+            "capacity": self.capacity,
+            "size": len(self.items),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+        }
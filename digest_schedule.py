@@ -0,0 +1,132 @@
+import re
+from datetime import datetime, timedelta, tzinfo
+from functools import lru_cache
+from typing import Any, Dict, Optional, Set, Tuple
+
+import pytz
+
+from timetable import parse_time
+
+OFFSET_RE = re.compile(r"^(utc|gmt|мск)?\s*([+-])\s*(\d{1,2})(?::?(\d{2}))?$")
+# МСК+N - смещение от московского времени (UTC+3)
+MSK_OFFSET_MINUTES = 3 * 60
+
+# Название часового пояса без учёта регистра -> каноническое имя pytz
+_TIMEZONES = {name.casefold(): name for name in pytz.all_timezones}
+
+
+def parse_timezone(text: str) -> Optional[str]:
+    """Часовой пояс из ввода пользователя: Europe/Samara, UTC+5, +03:00, МСК+1"""
+    text = text.strip()
+    name = _TIMEZONES.get(text.casefold())
+    if name is not None:
+        return name
+    if text.casefold() == "мск":
+        return "Europe/Moscow"
+
+    match = OFFSET_RE.match(text.casefold())
+    if not match:
+        return None
+    prefix, sign, hours, minutes = match.group(1), match.group(2), int(match.group(3)), int(match.group(4) or 0)
+    if hours > 14 or minutes > 59:
+        return None
+    offset = (hours * 60 + minutes) * (1 if sign == "+" else -1)
+    if prefix == "мск":
+        offset += MSK_OFFSET_MINUTES
+    if not -12 * 60 <= offset <= 14 * 60:
+        return None
+    return f"UTC{'+' if offset >= 0 else '-'}{abs(offset) // 60:02d}:{abs(offset) % 60:02d}"
+
+
+@lru_cache(maxsize=None)
+def get_timezone(name: str) -> tzinfo:
+    """Объект часового пояса по имени, сохранённому в профиле"""
+    if name.startswith("UTC") and len(name) == 9:
+        offset = int(name[4:6]) * 60 + int(name[7:9])
+        return pytz.FixedOffset(offset if name[3] == "+" else -offset)
+    return pytz.timezone(name)
+
+
+class DigestBuckets:
+    """Пользователи, сгруппированные по времени утренней рассылки.
+
+    Внутри часового пояса пользователи лежат в слотах местного времени по
+    bucket_minutes минут. Задача рассылки раз в слот переводит текущее
+    UTC-время в местное для каждого известного пояса и берёт готовые
+    множества пользователей, поэтому её стоимость зависит от размера слота
+    (и числа поясов), а не от общего числа пользователей. Переход на летнее
+    время учитывается автоматически.
+    """
+
+    def __init__(self, default_tz: str = "Europe/Moscow", default_time: str = "08:00",
+                 bucket_minutes: int = 5):
+        # Задача рассылки запускается по cron minute=*/bucket_minutes, а слоты
+        # отсчитываются от начала часа (floor) - длина слота должна делить 60
+        if bucket_minutes <= 0 or 60 % bucket_minutes:
+            raise ValueError(f"Длина слота рассылки должна делить 60 минут: {bucket_minutes}")
+        self.default_tz = default_tz
+        self.default_time = default_time
+        self.default_minutes = parse_time(default_time)
+        self.bucket_minutes = bucket_minutes
+        # часовой пояс -> слот местного времени -> пользователи
+        self.groups: Dict[str, Dict[int, Set[int]]] = {}
+        self.user_slot: Dict[int, Tuple[str, int]] = {}
+
+    def _slot(self, minutes: int) -> int:
+        return minutes // self.bucket_minutes
+
+    def assign(self, user_id: int, profile: Dict[str, Any]):
+        """Размещение пользователя по его настройкам (tz, digest_time)"""
+        self.remove(user_id)
+        digest_time = profile.get("digest_time", "")
+        if digest_time == "off":
+            return
+        minutes = parse_time(digest_time) if digest_time else self.default_minutes
+        if minutes is None:
+            minutes = self.default_minutes
+        tz_name = profile.get("tz") or self.default_tz
+
+        slot = self._slot(minutes)
+        self.groups.setdefault(tz_name, {}).setdefault(slot, set()).add(user_id)
+        self.user_slot[user_id] = (tz_name, slot)
+
+    def remove(self, user_id: int):
+        previous = self.user_slot.pop(user_id, None)
+        if previous is None:
+            return
+        tz_name, slot = previous
+        slots = self.groups[tz_name]
+        slots[slot].discard(user_id)
+        if not slots[slot]:
+            del slots[slot]
+            if not slots:
+                del self.groups[tz_name]
+
+    def rebuild(self, profiles: Dict[int, Dict[str, Any]]):
+        self.groups.clear()
+        self.user_slot.clear()
+        for user_id, profile in profiles.items():
+            self.assign(user_id, profile)
+
+    def due(self, now_utc: datetime) -> Set[int]:
+        """Пользователи, у которых в момент now_utc наступил слот рассылки"""
+        users: Set[int] = set()
+        for tz_name, slots in self.groups.items():
+            local = now_utc.astimezone(get_timezone(tz_name))
+            bucket = slots.get(self._slot(local.hour * 60 + local.minute))
+            if bucket:
+                users |= bucket
+        return users
+
+    def floor(self, now_utc: datetime) -> datetime:
+        """Начало текущего слота"""
+        now_utc = now_utc.replace(second=0, microsecond=0)
+        return now_utc - timedelta(minutes=now_utc.minute % self.bucket_minutes)
+
+    def sizes(self) -> Dict[str, int]:
+        """Размеры слотов (пояс + местное время) для диагностики"""
+        return {
+            f"{tz_name} {slot * self.bucket_minutes // 60:02d}:{slot * self.bucket_minutes % 60:02d}": len(users)
+            for tz_name, slots in self.groups.items()
+            for slot, users in slots.items()
+        }
@@ -0,0 +1,260 @@
+import asyncio
+import json
+import logging
+import sqlite3
+import time
+from typing import Any, Dict, List, Mapping, Optional, Tuple
+
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, DefaultKeyBuilder, KeyBuilder, StateType, StorageKey
+
+from cache import BoundedCache
+from storage import SQLiteWorker
+
+logger = logging.getLogger(__name__)
+
+FSM_SCHEMA = """
+CREATE TABLE IF NOT EXISTS fsm (
+    key TEXT PRIMARY KEY,
+    state TEXT, data TEXT,
+    updated REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_fsm_updated ON fsm(updated);
+"""
+
+UPSERT_SQL = "INSERT OR REPLACE INTO fsm (key, state, data, updated) VALUES (?, ?, ?, ?)"
+DELETE_SQL = "DELETE FROM fsm WHERE key = ?"
+EXPIRE_SQL = "DELETE FROM fsm WHERE updated < ?"
+
+# Состояние ключа: (state, data, время последнего изменения)
+Entry = Tuple[Optional[str], Dict[str, Any], float]
+
+# Ключа нет в базе (тоже кэшируется: у большинства сообщений состояния нет)
+EMPTY: Entry = (None, {}, float("inf"))
+
+# Ключей в одном запросе SELECT ... IN (...)
+READ_CHUNK = 500
+
+
+def init_fsm_schema(conn: sqlite3.Connection):
+    # WAL и ожидание блокировки - чтобы базу могли делить несколько процессов бота
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA busy_timeout=5000")
+    conn.executescript(FSM_SCHEMA)
+    conn.commit()
+
+
+class SQLiteFSMStorage(BaseStorage):
+    """Хранилище состояний FSM в SQLite вместо MemoryStorage.
+
+    Незавершённые диалоги (добавление пары, дедлайна) переживают перезапуск
+    и доступны всем процессам бота, работающим с одной базой. Прочитанные
+    состояния держатся в кэше; промахи, пришедшие за один проход цикла
+    событий, читаются одним запросом, а изменения пишутся пачкой через
+    flush_delay секунд. Состояние, не менявшееся дольше ttl секунд,
+    считается брошенным и удаляется.
+
+    Запись кэша перечитывается из базы через cache_ttl секунд: изменение,
+    сделанное другим процессом, становится видно не позже чем через
+    flush_delay + cache_ttl. Чтобы два процесса не вели один диалог
+    одновременно, обновления пользователя лучше направлять в один процесс
+    (маршрутизация по user_id). Если передан worker (например, SQLiteBackend.worker), используется
+    соединение хранилища данных пользователей.
+    """
+
+    def __init__(self, path: str = "fsm.db", worker: Optional[SQLiteWorker] = None,
+                 ttl: float = 24 * 3600, flush_delay: float = 0.2, cache_size: int = 10000,
+                 cache_ttl: float = 2.0, key_builder: Optional[KeyBuilder] = None):
+        self.shared = worker is not None
+        self.worker = worker or SQLiteWorker(path, init=init_fsm_schema)
+        self.ttl = ttl
+        self.flush_delay = flush_delay
+        self.cache_ttl = cache_ttl
+        self.key_builder = key_builder or DefaultKeyBuilder(with_bot_id=True, with_destiny=True)
+        # Ключ -> (запись, время чтения по time.monotonic)
+        self.cache = BoundedCache(cache_size)
+
+        # Изменения, ещё не записанные в базу (None - удалить ключ), и пачка,
+        # которая пишется сейчас
+        self.pending: Dict[str, Optional[Entry]] = {}
+        self.writing: Dict[str, Optional[Entry]] = {}
+        self._reads: Dict[str, asyncio.Future] = {}
+        self._read_scheduled = False
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._flush_task: Optional[asyncio.Task] = None
+        self._last_expire = 0.0
+
+        self.batches_read = 0
+        self.batches_written = 0
+        self.expired = 0
+
+    async def start(self):
+        if self.shared:
+            await self.worker.call(init_fsm_schema)
+        elif not self.worker.running:
+            await asyncio.to_thread(self.worker.start)
+        await self.expire()
+
+    # ---------- чтение ----------
+    def _fresh(self, entry: Entry) -> bool:
+        return time.time() - entry[2] < self.ttl
+
+    @staticmethod
+    def _select(conn: sqlite3.Connection, keys: List[str]) -> Dict[str, Entry]:
+        entries = {}
+        for start in range(0, len(keys), READ_CHUNK):
+            chunk = keys[start:start + READ_CHUNK]
+            rows = conn.execute(
+                f"SELECT key, state, data, updated FROM fsm WHERE key IN ({', '.join('?' * len(chunk))})",
+                chunk
+            )
+            for key, state, data, updated in rows:
+                entries[key] = (state, json.loads(data) if data else {}, updated)
+        return entries
+
+    async def _read_batch(self):
+        reads, self._reads = self._reads, {}
+        self._read_scheduled = False
+        try:
+            rows = await self.worker.call(self._select, list(reads))
+        except Exception as e:
+            for future in reads.values():
+                if not future.done():
+                    future.set_exception(e)
+            return
+        self.batches_read += 1
+        for key, future in reads.items():
+            if not future.done():
+                future.set_result(rows.get(key, EMPTY))
+
+    def _unflushed(self, db_key: str) -> Tuple[bool, Optional[Entry]]:
+        """Изменение ключа, ещё не записанное в базу: (есть ли, запись)"""
+        for batch in (self.pending, self.writing):
+            if db_key in batch:
+                return True, batch[db_key]
+        return False, None
+
+    async def _entry(self, key: StorageKey) -> Tuple[str, Optional[Entry]]:
+        """Ключ базы и актуальная запись (из очереди записи, кэша или базы)"""
+        db_key = self.key_builder.build(key)
+        unflushed, entry = self._unflushed(db_key)
+        if not unflushed:
+            cached = self.cache.get(db_key)
+            if cached is not None and time.monotonic() - cached[1] < self.cache_ttl:
+                entry = cached[0]
+            else:
+                future = self._reads.get(db_key)
+                if future is None:
+                    future = self._reads[db_key] = asyncio.get_running_loop().create_future()
+                    if not self._read_scheduled:
+                        self._read_scheduled = True
+                        asyncio.ensure_future(self._read_batch())
+                entry = await asyncio.shield(future)
+                unflushed, changed = self._unflushed(db_key)
+                if unflushed:
+                    # Пока шло чтение, ключ успели изменить
+                    entry = changed
+                else:
+                    self.cache.put(db_key, (entry, time.monotonic()))
+
+        if entry is EMPTY:
+            entry = None
+        elif entry is not None and not self._fresh(entry):
+            self.expired += 1
+            self._write(db_key, None)
+            entry = None
+        return db_key, entry
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        _, entry = await self._entry(key)
+        return entry[0] if entry else None
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        _, entry = await self._entry(key)
+        return dict(entry[1]) if entry else {}
+
+    # ---------- запись ----------
+    def _write(self, db_key: str, entry: Optional[Entry]):
+        if entry is not None and entry[0] is None and not entry[1]:
+            entry = None
+        self.pending[db_key] = entry
+        self.cache.put(db_key, (entry if entry is not None else EMPTY, time.monotonic()))
+        if self._timer is None:
+            self._timer = asyncio.get_running_loop().call_later(self.flush_delay, self._flush_soon)
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        db_key, entry = await self._entry(key)
+        state = state.state if isinstance(state, State) else state
+        self._write(db_key, (state, entry[1] if entry else {}, time.time()))
+
+    async def set_data(self, key: StorageKey, data: Mapping[str, Any]) -> None:
+        db_key, entry = await self._entry(key)
+        self._write(db_key, (entry[0] if entry else None, dict(data), time.time()))
+
+    def _flush_soon(self):
+        self._timer = None
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.ensure_future(self.flush())
+
+    def _apply(self, conn: sqlite3.Connection, batch: Dict[str, Optional[Entry]], expire_before: float):
+        conn.executemany(UPSERT_SQL, [
+            (key, entry[0], json.dumps(entry[1], ensure_ascii=False), entry[2])
+            for key, entry in batch.items() if entry is not None
+        ])
+        conn.executemany(DELETE_SQL, [(key,) for key, entry in batch.items() if entry is None])
+        if expire_before:
+            conn.execute(EXPIRE_SQL, (expire_before,))
+        conn.commit()
+
+    async def flush(self):
+        """Запись накопленных изменений одной транзакцией"""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if not self.pending:
+            return
+        batch, self.pending = self.pending, {}
+        self.writing = batch
+        try:
+            await self.worker.call(self._apply, batch, 0.0)
+        except Exception as e:
+            # Более новые изменения тех же ключей важнее
+            batch.update(self.pending)
+            self.pending = batch
+            self.writing = {}
+            logger.error(f"Ошибка записи состояний FSM: {e}")
+            if self._timer is None:
+                self._timer = asyncio.get_running_loop().call_later(self.flush_delay, self._flush_soon)
+            return
+        self.writing = {}
+        self.batches_written += 1
+        if time.time() - self._last_expire > 600:
+            await self.expire()
+        # Изменения, пришедшие во время записи, уходят следующей пачкой
+        if self.pending and self._timer is None:
+            self._timer = asyncio.get_running_loop().call_later(self.flush_delay, self._flush_soon)
+
+    async def expire(self):
+        """Удаление брошенных состояний старше ttl"""
+        self._last_expire = time.time()
+        try:
+            await self.worker.call(self._apply, {}, time.time() - self.ttl)
+        except Exception as e:
+            logger.warning(f"Не удалось удалить устаревшие состояния FSM: {e}")
+
+    async def close(self) -> None:
+        if not self.worker.running:
+            return
+        await self.flush()
+        if not self.shared:
+            await self.worker.close()
+
+    def stats(self) -> Dict[str, Any]:
+        stats = self.cache.stats()
+        stats.update({
+            "pending": len(self.pending),
+            "batches_read": self.batches_read,
+            "batches_written": self.batches_written,
+            "expired": self.expired,
+        })
+        return stats
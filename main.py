@@ -1,9 +1,12 @@
 import asyncio
+import html
 import logging
 import json
 import os
+import secrets
 import sys
 import time
+from itertools import islice
 
 # Получаем токен из переменных окружения Render
 BOT_TOKEN = os.getenv("BOT_TOKEN")
@@ -11,70 +14,301 @@ if not BOT_TOKEN:
     print("❌ ОШИБКА: BOT_TOKEN не найден в переменных окружения Render!")
     sys.exit(1)
 
-from datetime import datetime
-from typing import Dict, List
+from datetime import datetime, time as dt_time, timedelta
+from typing import Optional
 
 from aiogram import Bot, Dispatcher, types
 from aiogram.enums import ParseMode
+from aiogram.exceptions import TelegramBadRequest
 from aiogram.client.default import DefaultBotProperties
-from aiogram.filters import Command
+from aiogram.client.telegram import PRODUCTION, TelegramAPIServer
+from aiogram.filters import Command, CommandObject
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
 from aiogram.fsm.storage.memory import MemoryStorage
-from aiogram.types import ReplyKeyboardMarkup, KeyboardButton
+import pytz
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from aiohttp import web
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler
+
+from broadcast import Broadcaster
+from button_router import ButtonRouter
+from sharding import ShardFront, prepare_shards, read_manifest, serve_shard, wait_for_stop
+from metrics import (
+    BotMetrics, HandlerMetricsMiddleware, RequestMetricsMiddleware, SamplingProfiler,
+    UpdateMetricsMiddleware
+)
+from outbound import OutboundGate, OutboundSession
+from persistence import PersistenceScheduler
+from render import (
+    BACK_KEYBOARD, BUTTON_TEXTS, DEADLINES_KEYBOARD, MAIN_KEYBOARD, NOTES_KEYBOARD, SCHEDULE_KEYBOARD,
+    PAGE_SIZE, SEARCH_PAGE_SIZE, PageCallback, deadlines_page, notes_page,
+    page_keyboard, schedule_page, search_page
+)
+from search import SearchIndex, iter_substring_search
+from stats import UsageMiddleware, UsageStats
+from storage import LazyFileBackend, MemoryBackend, SQLiteBackend, StorageBackend, WriteAheadLog
+from fsm_storage import SQLiteFSMStorage
+from digest_schedule import DigestBuckets, get_timezone, parse_timezone
+from reminders import ReminderEngine
+from throttling import UpdateThrottle
+from transfer import EXPORT_FORMATS, ImportParser, StreamInputFile, export_lines, import_format
+from timetable import (
+    TimetableIndex, due_iso, due_timestamp, format_minutes, local_today, normalize_class,
+    normalize_deadline, parse_time, render_day
+)
 
 # Настройка логирования
 logging.basicConfig(
     level=logging.INFO,
-    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
+    format="%(asctime)s - " + (f"shard{os.getenv('SHARD_INDEX')} - " if os.getenv("SHARD_INDEX") else "")
+           + "%(name)s - %(levelname)s - %(message)s",
     handlers=[
         logging.StreamHandler(sys.stdout)
     ]
 )
 logger = logging.getLogger(__name__)
 
+# Несколько процессов: SHARD_WORKERS>1 - этот процесс распределяет обновления
+# по воркерам, каждый воркер (SHARD_INDEX задаёт распределитель) работает
+# в каталоге своего шарда в SHARDS_DIR со своими пользователями
+SHARD_WORKERS = int(os.getenv("SHARD_WORKERS", 1))
+SHARD_INDEX = os.getenv("SHARD_INDEX")
+SHARD_PORT = int(os.getenv("SHARD_PORT", 0))
+SHARDS_DIR = os.getenv("SHARDS_DIR", "shards")
+SHARD_BASE_PORT = int(os.getenv("SHARD_BASE_PORT", 17100))
+
+# Адрес Bot API (для проверки на локальном тестовом сервере)
+TELEGRAM_API_URL = os.getenv("TELEGRAM_API_URL")
+
+# Режим webhook включается заданием WEBHOOK_URL (публичный адрес сервиса),
+# без него бот работает через polling
+WEBHOOK_URL = os.getenv("WEBHOOK_URL", "").rstrip("/")
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/webhook")
+# Telegram присылает секрет в заголовке каждого запроса; если он не задан,
+# генерируется при запуске (webhook всё равно переустанавливается)
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET") or secrets.token_urlsafe(32)
+
+# Исходящие запросы к Bot API: пул соединений OUTBOUND_POOL_SIZE с keep-alive,
+# одновременно не больше OUTBOUND_CONCURRENCY запросов, ответы пользователям
+# обгоняют рассылки, после 429 ответ повторяется до OUTBOUND_MAX_RETRIES раз
+OUTBOUND_POOL_SIZE = int(os.getenv("OUTBOUND_POOL_SIZE", 256))
+OUTBOUND_KEEPALIVE = float(os.getenv("OUTBOUND_KEEPALIVE", 60))
+OUTBOUND_CONCURRENCY = int(os.getenv("OUTBOUND_CONCURRENCY", 224))
+OUTBOUND_MAX_RETRIES = int(os.getenv("OUTBOUND_MAX_RETRIES", 3))
+
 # Инициализация бота и диспетчера
 bot = Bot(
     token=BOT_TOKEN,
+    session=OutboundSession(
+        pool_size=OUTBOUND_POOL_SIZE,
+        keepalive=OUTBOUND_KEEPALIVE,
+        api=TelegramAPIServer.from_base(TELEGRAM_API_URL) if TELEGRAM_API_URL else PRODUCTION
+    ),
     default=DefaultBotProperties(parse_mode=ParseMode.HTML)
 )
-dp = Dispatcher(storage=MemoryStorage())
-
-# Хранение данных (временное, так как файловая система на Render непостоянная)
-user_data: Dict[int, Dict[str, List]] = {}
+outbound = OutboundGate(concurrency=OUTBOUND_CONCURRENCY, max_retries=OUTBOUND_MAX_RETRIES)
+bot.session.middleware(outbound)
+# Хранение данных: STORAGE_BACKEND=memory (по умолчанию), sqlite или files
 DATA_FILE = "user_data.json"
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "memory")
+SQLITE_PATH = os.getenv("SQLITE_PATH", "studybuddy.db")
+USER_DATA_DIR = os.getenv("USER_DATA_DIR", "user_data")
 
-def load_data():
-    """Безопасная загрузка данных из JSON файла"""
-    global user_data
-    try:
-        if os.path.exists(DATA_FILE):
-            with open(DATA_FILE, "r", encoding="utf-8") as f:
-                content = f.read().strip()
-                if content:
-                    data = json.loads(content)
-                    user_data = {int(k): v for k, v in data.items()}
-                    logger.info(f"Загружены данные для {len(user_data)} пользователей")
-                else:
-                    user_data = {}
-                    logger.info("Файл данных пуст")
-        else:
-            user_data = {}
-            logger.info("Файл данных не найден")
-    except Exception as e:
-        logger.error(f"Ошибка загрузки данных: {e}")
-        user_data = {}
+# Быстрый запуск после сна (FAST_START=1): двоичный снапшот user_data.bin, из
+# которого пользователи загружаются по мере обращения, а планировщик, напоминания
+# и догрузка остальных данных - после первого обновления (или через STARTUP_DEFER_S)
+FAST_START = os.getenv("FAST_START", "0") == "1"
+STARTUP_DEFER_S = float(os.getenv("STARTUP_DEFER_S", 30))
+
+def make_storage(directory: str = ".") -> StorageBackend:
+    """Хранилище выбранного типа с файлами в каталоге directory"""
+    if STORAGE_BACKEND == "sqlite":
+        return SQLiteBackend(os.path.join(directory, SQLITE_PATH))
+    if STORAGE_BACKEND == "files":
+        # Файл на пользователя, в памяти - не больше USER_CACHE_SIZE активных (lru или lfu)
+        return LazyFileBackend(
+            os.path.join(directory, USER_DATA_DIR),
+            cache_size=int(os.getenv("USER_CACHE_SIZE", 1000)),
+            policy=os.getenv("USER_CACHE_POLICY", "lru"),
+            compact_every=int(os.getenv("WAL_COMPACT_EVERY", 5000))
+        )
+    # Снапшот user_data.json (или user_data.bin) + журнал изменений user_data.json.wal
+    return MemoryBackend(
+        WriteAheadLog(os.path.join(directory, DATA_FILE),
+                      compact_every=int(os.getenv("WAL_COMPACT_EVERY", 5000)),
+                      binary=FAST_START)
+    )
+
+storage = make_storage()
+
+# Состояния диалогов: FSM_STORAGE=memory (по умолчанию) или sqlite - переживают
+# перезапуск и общие для процессов бота; при STORAGE_BACKEND=sqlite - в той же базе
+FSM_STORAGE = os.getenv("FSM_STORAGE", "memory")
+if FSM_STORAGE == "sqlite":
+    fsm_storage = SQLiteFSMStorage(
+        os.getenv("FSM_PATH", "fsm.db"),
+        worker=storage.worker if isinstance(storage, SQLiteBackend) else None,
+        ttl=float(os.getenv("FSM_TTL_HOURS", 24)) * 3600,
+        cache_ttl=float(os.getenv("FSM_CACHE_TTL", 2))
+    )
+else:
+    fsm_storage = MemoryStorage()
+dp = Dispatcher(storage=fsm_storage)
 
-def save_data():
-    """Сохранение данных в JSON файл"""
+# Кнопки находятся по тексту одним поиском в словаре, без перебора фильтров;
+# «↩️ Назад» в незавершённом диалоге обрабатывает шаг диалога
+buttons = ButtonRouter(dp.message, yield_to_state=["↩️ Назад"])
+dp.message.outer_middleware(buttons)
+
+# При FAST_START отложенная часть запуска ждёт первое обработанное обновление
+first_update: Optional[asyncio.Event] = None
+
+@dp.update.outer_middleware()
+async def first_update_middleware(handler, event, data):
     try:
-        with open(DATA_FILE, "w", encoding="utf-8") as f:
-            json.dump(user_data, f, ensure_ascii=False, indent=2)
-        logger.debug("Данные сохранены")
-    except Exception as e:
-        logger.error(f"Ошибка сохранения данных: {e}")
+        return await handler(event, data)
+    finally:
+        if first_update is not None and not first_update.is_set():
+            first_update.set()
+
+# Пачка изменений уходит на диск через 200 мс или после 500 изменений
+persistence = PersistenceScheduler(
+    storage,
+    delay=int(os.getenv("PERSIST_DELAY_MS", 200)) / 1000,
+    max_pending=int(os.getenv("PERSIST_MAX_PENDING", 500))
+)
+
+# Метрики для /metrics: обновления, обработчики, сохранения, запросы к Bot API
+bot_metrics = BotMetrics()
+dp.update.outer_middleware(UpdateMetricsMiddleware(bot_metrics))
+handler_metrics = HandlerMetricsMiddleware(bot_metrics)
+dp.message.middleware(handler_metrics)
+dp.callback_query.middleware(handler_metrics)
+bot.session.middleware(RequestMetricsMiddleware(bot_metrics))
+persistence.on_flush = bot_metrics.observe_flush
+outbound.on_wait = lambda priority, seconds: bot_metrics.api_queue_wait.observe(seconds, priority)
+outbound.on_retry = bot_metrics.api_flood_retries.inc
+
+def is_quick_note(event: types.Update, data: dict) -> bool:
+    """Обновление, которое станет быстрой заметкой (см. handle_other_messages)"""
+    message = event.message
+    return (
+        message is not None and message.text is not None and data.get("raw_state") is None
+        and not message.text.startswith("/") and message.text not in BUTTON_TEXTS
+    )
+
+# Нагрузка от пользователей: THROTTLE_RATE обновлений в секунду на пользователя
+# (до THROTTLE_BURST подряд, 0 - без лимита), не больше UPDATE_CONCURRENCY
+# обновлений одновременно. Быстрые заметки сверх лимита пользователя или когда
+# ждут UPDATE_QUEUE_LIMIT и больше сохраняются в общей очереди, но без
+# подтверждения; когда ждут UPDATE_MAX_WAITING, прочие обновления отклоняются
+throttle = UpdateThrottle(
+    rate=float(os.getenv("THROTTLE_RATE", 1)),
+    burst=float(os.getenv("THROTTLE_BURST", 10)),
+    concurrency=int(os.getenv("UPDATE_CONCURRENCY", 64)),
+    queue_limit=int(os.getenv("UPDATE_QUEUE_LIMIT", 100)),
+    max_waiting=int(os.getenv("UPDATE_MAX_WAITING", 1000)),
+    is_low_priority=is_quick_note
+)
+dp.update.outer_middleware(throttle)
+
+# Профилировщик включается запросом /profiler?token=...&action=start,
+# только если задан PROFILER_TOKEN
+PROFILER_TOKEN = os.getenv("PROFILER_TOKEN")
+profiler = SamplingProfiler(interval=int(os.getenv("PROFILER_INTERVAL_MS", 10)) / 1000)
+
+# Поиск по заметкам: SEARCH_MODE=index (по умолчанию) или substring (прежний режим)
+SEARCH_MODE = os.getenv("SEARCH_MODE", "index")
+
+# Ограничения /import: размер файла и число записей в нём
+IMPORT_MAX_BYTES = int(os.getenv("IMPORT_MAX_BYTES", 5 * 1024 * 1024))
+IMPORT_MAX_RECORDS = int(os.getenv("IMPORT_MAX_RECORDS", 5000))
+# Индексы поиска по заметкам - не больше SEARCH_CACHE_SIZE пользователей (LRU)
+search_index = SearchIndex(int(os.getenv("SEARCH_CACHE_SIZE", 1000)))
+
+# Индексы пар по дням недели и дедлайнов по дате для /today и рассылки -
+# не больше TIMETABLE_CACHE_SIZE пользователей (LRU)
+DEFAULT_TIMEZONE = os.getenv("DEFAULT_TIMEZONE", "Europe/Moscow")
+DEADLINE_HORIZON_DAYS = int(os.getenv("DEADLINE_HORIZON_DAYS", 7))
+timetable_index = TimetableIndex(int(os.getenv("TIMETABLE_CACHE_SIZE", 1000)))
+
+# Срок дедлайна - конец дня сдачи; напоминания за 24 ч и за 1 ч до него
+DEADLINE_DUE_TIME = dt_time(23, 59)
+
+# Утренняя рассылка по часовым поясам пользователей, слоты по 5 минут
+digest_buckets = DigestBuckets(
+    default_tz=DEFAULT_TIMEZONE,
+    default_time=os.getenv("DEFAULT_DIGEST_TIME", "08:00"),
+    bucket_minutes=int(os.getenv("DIGEST_BUCKET_MINUTES", 5))
+)
+
+# Статистика использования для /status, /stats и /stats.json: счётчики
+# обновляются на каждом изменении, ряды активности сохраняются в STATS_PATH;
+# /stats в боте - только для ADMIN_IDS (через запятую)
+usage = UsageStats(os.getenv("STATS_PATH", "stats.json"), tz=get_timezone(DEFAULT_TIMEZONE))
+dp.update.outer_middleware(UsageMiddleware(usage))
+ADMIN_IDS = {int(admin_id) for admin_id in os.getenv("ADMIN_IDS", "").split(",") if admin_id.strip()}
+
+async def load_data():
+    """Открытие хранилища и загрузка данных"""
+    await open_storage()
+    await build_indexes()
+
+async def open_storage():
+    """Открытие хранилища - всё, что нужно для ответов пользователям"""
+    await storage.start()
+    if isinstance(fsm_storage, SQLiteFSMStorage):
+        await fsm_storage.start()
+    # Индексы строятся заново при первом запросе пользователя
+    search_index.clear()
+    timetable_index.clear()
+    usage.load()
+    logger.info(f"Хранилище {STORAGE_BACKEND}: пользователей {await storage.count_users()}")
+
+async def build_indexes():
+    """Группы утренней рассылки и очередь напоминаний - обход всех пользователей"""
+    profiles = await storage.user_profiles()
+    digest_buckets.rebuild(profiles)
+    
+    # Куча напоминаний строится одним проходом по всем дедлайнам
+    upcoming = []
+    open_dues = []
+    for user_id, index, deadline in await storage.all_deadlines():
+        if deadline.get("completed"):
+            continue
+        open_dues.append(due_iso(deadline))
+        due_ts = deadline_due_ts(deadline, profiles.get(user_id, {}))
+        if due_ts is not None:
+            upcoming.append((user_id, index, due_ts))
+    reminders.rebuild(upcoming)
+    logger.info(f"⏰ Запланировано напоминаний о дедлайнах: {len(reminders)}")
+    
+    # Итоги статистики - один раз при запуске, дальше обновляются по событиям
+    counts = await storage.item_counts()
+    usage.seed(
+        {"users": len(profiles), "classes": counts["schedule"], "deadlines": counts["deadlines"],
+         "completed": counts["completed"], "notes": counts["notes"]},
+        open_dues
+    )
+
+def user_timezone(profile: dict):
+    return get_timezone(profile.get("tz") or DEFAULT_TIMEZONE)
+
+def deadline_due_ts(deadline: dict, profile: dict):
+    """Срок дедлайна (unix time): конец дня сдачи в часовом поясе пользователя"""
+    return due_timestamp(deadline, user_timezone(profile), DEADLINE_DUE_TIME)
+
+async def get_timetable(user_id: int):
+    """Индекс расписания пользователя (строится при первом обращении)"""
+    timetable = timetable_index.get(user_id)
+    if timetable is None:
+        timetable = timetable_index.build(
+            user_id,
+            await storage.list_schedule(user_id),
+            await storage.list_deadlines(user_id)
+        )
+    return timetable
 
 # Состояния FSM
 class Form(StatesGroup):
@@ -85,19 +319,75 @@ class Form(StatesGroup):
     waiting_for_deadline_date = State()
     waiting_for_note_text = State()
     waiting_for_search_query = State()
+    waiting_for_import = State()
 
-# Клавиатуры
-def get_main_keyboard():
-    buttons = [
-        [KeyboardButton(text="📅 Расписание"), KeyboardButton(text="⏰ Дедлайны")],
-        [KeyboardButton(text="📝 Заметки"), KeyboardButton(text="🔍 Поиск")],
-        [KeyboardButton(text="📋 Сегодня"), KeyboardButton(text="ℹ️ Помощь")],
-    ]
-    return ReplyKeyboardMarkup(keyboard=buttons, resize_keyboard=True)
+# Клавиатуры собраны заранее в render.py
+
+# ========== СПИСКИ ПО СТРАНИЦАМ ==========
+# Длинные списки показываются по страницам с кнопками листания (PageCallback):
+# view - список, cursor - позиция страницы. Для расписания и дедлайнов cursor -
+# номер первого элемента, для заметок (от новых к старым) - граница, до которой
+# показывать (-1 - самые новые), для поиска - сколько результатов пропустить.
+# Из хранилища берётся только нужный срез.
+ASCENDING_VIEWS = {"s": ("schedule", schedule_page), "d": ("deadlines", deadlines_page)}
 
-def get_back_keyboard():
-    buttons = [[KeyboardButton(text="↩️ Назад")]]
-    return ReplyKeyboardMarkup(keyboard=buttons, resize_keyboard=True)
+async def search_results(user_id: int, query: str, offset: int):
+    """Результаты поиска с offset-го до конца страницы (и один лишний) и их общее число"""
+    if SEARCH_MODE == "substring":
+        # Заметки перебираются только до конца страницы
+        notes = await storage.list_notes(user_id)
+        matches = iter_substring_search(notes, query)
+        return list(islice((notes[i] for i in matches), offset, offset + SEARCH_PAGE_SIZE + 1)), None
+    
+    # Тексты целиком нужны только для построения индекса, на странице - превью
+    index = search_index.get(user_id)
+    if index is None or index.size != (await storage.list_page(user_id, "notes", 0, 0))[1]:
+        index = search_index.build(user_id, await storage.list_notes(user_id))
+    ranked = index.search(query)
+    found = []
+    for i in ranked[offset:offset + SEARCH_PAGE_SIZE + 1]:
+        found += (await storage.note_previews(user_id, i, i + 1))[0]
+    return found, len(ranked)
+
+async def list_view(user_id: int, view: str, cursor: int, state: FSMContext = None):
+    """Текст и кнопки листания страницы списка; None - показывать нечего"""
+    if view in ASCENDING_VIEWS:
+        key, render = ASCENDING_VIEWS[view]
+        start = max(0, cursor)
+        items, total = await storage.list_page(user_id, key, start, start + PAGE_SIZE)
+        if not items:
+            return None
+        text, shown = render(items, start, total)
+        prev_cursor = max(0, start - PAGE_SIZE) if start else None
+        next_cursor = start + shown if start + shown < total else None
+
+    elif view == "n":
+        if cursor < 0:
+            _, cursor = await storage.list_page(user_id, "notes", 0, 0)
+        items, total = await storage.note_previews(user_id, max(0, cursor - PAGE_SIZE), cursor)
+        if not items:
+            return None
+        stop = min(cursor, total)
+        items.reverse()
+        text, shown = notes_page(items, total - stop + 1, total)
+        prev_cursor = min(total, stop + PAGE_SIZE) if stop < total else None
+        next_cursor = stop - shown if stop > shown else None
+
+    elif view == "q":
+        query = (await state.get_data()).get("search_query")
+        if query is None:
+            return None
+        found, total = await search_results(user_id, query, max(0, cursor))
+        if not found:
+            return None
+        offset = max(0, cursor)
+        text, shown = search_page(found[:SEARCH_PAGE_SIZE], offset, total)
+        prev_cursor = max(0, offset - SEARCH_PAGE_SIZE) if offset else None
+        next_cursor = offset + shown if shown < len(found) else None
+
+    else:
+        return None
+    return text, page_keyboard(view, prev_cursor, next_cursor)
 
 # ========== ОБРАБОТЧИКИ КОМАНД ==========
 @dp.message(Command("start"))
@@ -105,25 +395,20 @@ async def cmd_start(message: types.Message):
     user_id = message.from_user.id
     user_name = message.from_user.first_name
     
-    if user_id not in user_data:
-        user_data[user_id] = {
-            "schedule": [],
-            "deadlines": [],
-            "notes": [],
-            "name": user_name
-        }
-        save_data()
+    if await storage.create_user(user_id, user_name):
+        digest_buckets.assign(user_id, {})
+        usage.record("users")
     
     await message.answer(
         f"👋 Привет, {user_name}!\n\n"
         "Я StudyBuddy - твой помощник в учебе!\n\n"
         "Выбери действие:",
-        reply_markup=get_main_keyboard()
+        reply_markup=MAIN_KEYBOARD
     )
 
 @dp.message(Command("menu"))
 async def cmd_menu(message: types.Message):
-    await message.answer("Главное меню:", reply_markup=get_main_keyboard())
+    await message.answer("Главное меню:", reply_markup=MAIN_KEYBOARD)
 
 @dp.message(Command("help"))
 async def cmd_help(message: types.Message):
@@ -133,29 +418,34 @@ async def cmd_help(message: types.Message):
         "/start - начать\n"
         "/menu - главное меню\n"
         "/today - расписание на сегодня\n"
+        "/timezone - часовой пояс (например: /timezone Europe/Samara)\n"
+        "/digest - время утренней сводки (например: /digest 07:30 или /digest off)\n"
+        "/done - отметить дедлайн выполненным (например: /done 2)\n"
+        "/export - выгрузить все данные файлом (/export csv - в CSV)\n"
+        "/import - загрузить пары, дедлайны и заметки из файла\n"
+        "/status - статус бота\n"
         "/help - справка\n"
         "/ping - проверить работу бота\n\n"
         "Используй кнопки для навигации!\n\n"
         "⚠️ <i>Бот работает на бесплатном хостинге.</i>\n"
         "<i>После 15 минут бездействия он 'засыпает'.</i>\n"
         "<i>Первое сообщение после сна может прийти с задержкой до 50 секунд.</i>",
-        reply_markup=get_main_keyboard()
+        reply_markup=MAIN_KEYBOARD
     )
 
 @dp.message(Command("today"))
 async def cmd_today(message: types.Message):
     user_id = message.from_user.id
     
-    if user_id not in user_data:
+    profile = await storage.get_user(user_id)
+    if profile is None:
         await message.answer("Сначала нажми /start")
         return
     
-    # Простая логика для демонстрации
-    schedule = user_data[user_id].get("schedule", [])
-    if schedule:
-        await message.answer(f"📅 У тебя {len(schedule)} пар в расписании!")
-    else:
-        await message.answer("📭 Расписание пусто. Добавь пары!")
+    timetable = await get_timetable(user_id)
+    await message.answer(
+        render_day(timetable, local_today(user_timezone(profile)), DEADLINE_HORIZON_DAYS)
+    )
 
 @dp.message(Command("ping"))
 async def cmd_ping(message: types.Message):
@@ -174,30 +464,282 @@ async def cmd_ping(message: types.Message):
 @dp.message(Command("status"))
 async def cmd_status(message: types.Message):
     """Команда для проверки статуса бота"""
+    stats = usage.snapshot()
     await message.answer(
         f"🤖 <b>Статус бота</b>\n\n"
         f"✅ Бот работает корректно\n"
-        f"👤 Пользователей в базе: {len(user_data)}\n"
+        f"👤 Пользователей в базе: {await storage.count_users()}, "
+        f"сегодня активны ~{stats['active_today']}\n"
+        f"📝 Заметок на пользователя: {stats['notes_per_user']}\n"
+        f"📅 Дедлайнов на этой неделе: {stats['due_this_week']}\n"
         f"⏰ Время сервера: {datetime.now().strftime('%H:%M:%S')}\n\n"
         f"ℹ️ <i>Бот использует бесплатный Render</i>\n"
         f"<i>При простое >15 минут происходит 'сон'</i>\n"
         f"<i>Пробуждение занимает ~50 секунд</i>"
     )
 
+@dp.message(Command("stats"))
+async def cmd_stats(message: types.Message):
+    """Статистика использования (только для ADMIN_IDS)"""
+    if message.from_user.id not in ADMIN_IDS:
+        await message.answer("⛔ Команда доступна только администраторам")
+        return
+    
+    stats = usage.snapshot()
+    totals, hour, today = stats["totals"], stats["last_hour"], stats["today"]
+    await message.answer(
+        f"📊 <b>Статистика</b>\n\n"
+        f"👤 Пользователей: {totals['users']} (новых сегодня {today['users']})\n"
+        f"🟢 Активны сегодня: ~{stats['active_today']}, за неделю: ~{stats['active_week']}\n"
+        f"📚 Пар: {totals['classes']}\n"
+        f"📅 Дедлайнов: {totals['deadlines']}, открыто {stats['open_deadlines']}, "
+        f"сегодня срок у {stats['due_today']}, на неделе - у {stats['due_this_week']}\n"
+        f"📝 Заметок: {totals['notes']} ({stats['notes_per_user']} на пользователя)\n\n"
+        f"<b>За час:</b> обновлений {hour['updates']}, заметок {hour['notes']}, "
+        f"дедлайнов {hour['deadlines']}, пар {hour['classes']}\n"
+        f"<b>Сегодня:</b> обновлений {today['updates']}, заметок {today['notes']}, "
+        f"дедлайнов {today['deadlines']} (выполнено {today['completed']}), пар {today['classes']}\n\n"
+        f"<i>Ряды по минутам и дням: /stats.json на веб-сервере</i>"
+    )
+
+@dp.message(Command("timezone"))
+async def cmd_timezone(message: types.Message, command: CommandObject):
+    """Настройка часового пояса пользователя"""
+    user_id = message.from_user.id
+    profile = await storage.get_user(user_id)
+    if profile is None:
+        await message.answer("Сначала нажми /start")
+        return
+    
+    if not command.args:
+        await message.answer(
+            f"🌍 Твой часовой пояс: <b>{profile.get('tz') or DEFAULT_TIMEZONE}</b>\n\n"
+            "Изменить: /timezone Europe/Samara или /timezone +5"
+        )
+        return
+    
+    tz_name = parse_timezone(command.args)
+    if tz_name is None:
+        await message.answer("❌ Не знаю такой часовой пояс. Пример: /timezone Europe/Samara или /timezone +5")
+        return
+    
+    await storage.update_user(user_id, {"tz": tz_name})
+    profile = dict(profile, tz=tz_name)
+    digest_buckets.assign(user_id, profile)
+    # Сроки дедлайнов считаются в часовом поясе пользователя - напоминания переносятся
+    for index, deadline in enumerate(await storage.list_deadlines(user_id)):
+        if not deadline.get("completed"):
+            reminders.reschedule(user_id, index, deadline_due_ts(deadline, profile))
+    await message.answer(f"✅ Часовой пояс: <b>{tz_name}</b>")
+
+@dp.message(Command("digest"))
+async def cmd_digest(message: types.Message, command: CommandObject):
+    """Настройка времени утренней сводки"""
+    user_id = message.from_user.id
+    profile = await storage.get_user(user_id)
+    if profile is None:
+        await message.answer("Сначала нажми /start")
+        return
+    
+    current = profile.get("digest_time") or digest_buckets.default_time
+    if not command.args:
+        await message.answer(
+            f"🌅 Утренняя сводка: <b>{'выключена' if current == 'off' else current}</b>\n\n"
+            "Изменить: /digest 07:30, выключить: /digest off"
+        )
+        return
+    
+    arg = command.args.strip().lower()
+    if arg in ("off", "выкл", "нет"):
+        digest_time = "off"
+    else:
+        minutes = parse_time(arg)
+        if minutes is None:
+            await message.answer("❌ Укажи время в формате ЧЧ:ММ, например: /digest 07:30")
+            return
+        digest_time = format_minutes(minutes)
+    
+    await storage.update_user(user_id, {"digest_time": digest_time})
+    profile = dict(profile, digest_time=digest_time)
+    digest_buckets.assign(user_id, profile)
+    if digest_time == "off":
+        await message.answer("🔕 Утренняя сводка выключена")
+    else:
+        await message.answer(f"✅ Утренняя сводка будет приходить в <b>{digest_time}</b>")
+
+@dp.message(Command("done"))
+async def cmd_done(message: types.Message, command: CommandObject):
+    """Отметка дедлайна выполненным"""
+    user_id = message.from_user.id
+    if await storage.get_user(user_id) is None:
+        await message.answer("Сначала нажми /start")
+        return
+    
+    arg = (command.args or "").strip()
+    if not arg.isdigit():
+        await message.answer("Укажи номер дедлайна из списка «📋 Мои дедлайны», например: /done 2")
+        return
+    
+    index = int(arg) - 1
+    # Срок и прежнее состояние - для статистики открытых дедлайнов
+    items = (await storage.list_page(user_id, "deadlines", index, index + 1))[0] if index >= 0 else []
+    was_open = bool(items) and not items[0].get("completed")
+    due = due_iso(items[0]) if items else None
+    if not await storage.complete_deadline(user_id, index):
+        await message.answer("❌ Дедлайна с таким номером нет")
+        return
+    
+    if was_open:
+        usage.record("completed")
+        usage.deadline_due(due, -1)
+    reminders.complete(user_id, index)
+    timetable_index.invalidate(user_id)
+    await message.answer("✅ <b>Дедлайн выполнен!</b> Напоминаний больше не будет.")
+
+# ========== ВЫГРУЗКА И ЗАГРУЗКА ==========
+IMPORT_HELP = (
+    "📥 <b>Загрузка данных</b>\n\n"
+    "Пришлите файл .jsonl или .csv - например, выгрузку /export. "
+    "Каждая запись - пара, дедлайн или заметка:\n"
+    "<code>{\"type\": \"class\", \"day\": \"Понедельник\", \"time\": \"10:30\", \"subject\": \"Физика\"}</code>\n"
+    "<code>{\"type\": \"deadline\", \"name\": \"Курсовая\", \"due_date\": \"20.12.2025\"}</code>\n"
+    "<code>{\"type\": \"note\", \"text\": \"Взять зачётку\"}</code>\n\n"
+    "В CSV - те же поля столбцами, первая строка - заголовок."
+)
+
+@dp.message(Command("export"))
+async def cmd_export(message: types.Message, command: CommandObject):
+    """Выгрузка данных пользователя файлом JSON Lines или CSV"""
+    user_id = message.from_user.id
+    if await storage.get_user(user_id) is None:
+        await message.answer("Сначала нажми /start")
+        return
+    
+    fmt = (command.args or "jsonl").strip().lower()
+    if fmt not in EXPORT_FORMATS:
+        await message.answer("Формат выгрузки: /export (JSON Lines) или /export csv")
+        return
+    
+    lists = {
+        "schedule": await storage.list_schedule(user_id),
+        "deadlines": await storage.list_deadlines(user_id),
+        "notes": await storage.list_notes(user_id),
+    }
+    if not any(lists.values()):
+        await message.answer("📭 Выгружать пока нечего")
+        return
+    
+    # Файл собирается по строкам прямо во время отправки
+    await message.answer_document(
+        StreamInputFile(export_lines(lists, fmt), filename=f"studybuddy.{fmt}"),
+        caption=(
+            f"📦 Пар: {len(lists['schedule'])}, дедлайнов: {len(lists['deadlines'])}, "
+            f"заметок: {len(lists['notes'])}\n\nЗагрузить обратно: /import"
+        )
+    )
+
+@dp.message(Command("import"))
+async def cmd_import(message: types.Message, state: FSMContext):
+    if await storage.get_user(message.from_user.id) is None:
+        await message.answer("Сначала нажми /start")
+        return
+    # Файл с подписью /import загружается сразу
+    if message.document is not None:
+        await import_document(message, state)
+        return
+    await message.answer(IMPORT_HELP, reply_markup=BACK_KEYBOARD)
+    await state.set_state(Form.waiting_for_import)
+
+@dp.message(Form.waiting_for_import)
+async def process_import(message: types.Message, state: FSMContext):
+    if message.text == "↩️ Назад":
+        await state.clear()
+        await message.answer("Главное меню:", reply_markup=MAIN_KEYBOARD)
+        return
+    if message.document is None:
+        await message.answer("Пришлите файл .jsonl или .csv (или ↩️ Назад)")
+        return
+    await import_document(message, state)
+
+async def import_document(message: types.Message, state: FSMContext):
+    """Разбор файла по мере скачивания и добавление всех записей одной пачкой"""
+    user_id = message.from_user.id
+    document = message.document
+    if document.file_size and document.file_size > IMPORT_MAX_BYTES:
+        await message.answer(f"❌ Файл больше {IMPORT_MAX_BYTES // (1024 * 1024)} МБ")
+        return
+    
+    parser = ImportParser(import_format(document.file_name), max_records=IMPORT_MAX_RECORDS)
+    try:
+        file = await bot.get_file(document.file_id)
+        url = bot.session.api.file_url(bot.token, file.file_path)
+        async for chunk in bot.session.stream_content(url, chunk_size=64 * 1024):
+            parser.feed(chunk)
+            if parser.full:
+                break
+        parser.close()
+    except Exception as e:
+        logger.error(f"Ошибка загрузки файла пользователя {user_id}: {e}")
+        await message.answer("❌ Не удалось скачать файл, попробуйте ещё раз")
+        return
+    
+    if parser.too_many:
+        await message.answer(f"❌ В файле больше {IMPORT_MAX_RECORDS} записей")
+        return
+    if parser.error_count:
+        # В причинах бывают значения из файла
+        lines = "\n".join(f"• {html.escape(error)}" for error in parser.errors)
+        more = parser.error_count - len(parser.errors)
+        await message.answer(
+            f"❌ <b>Файл не загружен</b> - ошибок: {parser.error_count}\n\n{lines}"
+            + (f"\n… и ещё {more}" if more > 0 else "")
+            + "\n\nИсправьте файл и пришлите снова."
+        )
+        return
+    if not parser.total:
+        await message.answer("📭 В файле нет записей")
+        return
+    
+    # Все записи - одним изменением на список и одной записью на диск
+    schedule, deadlines, notes = parser.items["schedule"], parser.items["deadlines"], parser.items["notes"]
+    await storage.extend(user_id, "schedule", schedule)
+    deadlines_total = await storage.extend(user_id, "deadlines", deadlines)
+    notes_total = await storage.extend(user_id, "notes", notes)
+    await persistence.flush()
+    
+    timetable_index.invalidate(user_id)
+    first_note = notes_total - len(notes)
+    for offset, note in enumerate(notes):
+        search_index.add_note(user_id, first_note + offset, note["text"])
+    profile = await storage.get_user(user_id) or {}
+    first_deadline = deadlines_total - len(deadlines)
+    for offset, deadline in enumerate(deadlines):
+        if deadline.get("completed"):
+            usage.record("completed")
+            continue
+        usage.deadline_due(due_iso(deadline))
+        due_ts = deadline_due_ts(deadline, profile)
+        if due_ts is not None:
+            reminders.add(user_id, first_deadline + offset, due_ts)
+    usage.record("classes", len(schedule))
+    usage.record("deadlines", len(deadlines))
+    usage.record("notes", len(notes))
+    
+    await state.clear()
+    await message.answer(
+        f"✅ <b>Загружено записей: {parser.total}</b>\n\n"
+        f"Пар: {len(schedule)}, дедлайнов: {len(deadlines)}, заметок: {len(notes)}",
+        reply_markup=MAIN_KEYBOARD
+    )
+
 # ========== ОБРАБОТЧИКИ КНОПОК ==========
-@dp.message(lambda m: m.text == "📅 Расписание")
+@buttons.button("📅 Расписание")
 async def handle_schedule(message: types.Message):
-    buttons = [
-        [KeyboardButton(text="➕ Добавить пару")],
-        [KeyboardButton(text="📋 Посмотреть расписание")],
-        [KeyboardButton(text="↩️ Назад")]
-    ]
-    keyboard = ReplyKeyboardMarkup(keyboard=buttons, resize_keyboard=True)
-    await message.answer("📅 <b>Управление расписанием</b>\n\nВыберите действие:", reply_markup=keyboard)
+    await message.answer("📅 <b>Управление расписанием</b>\n\nВыберите действие:", reply_markup=SCHEDULE_KEYBOARD)
 
-@dp.message(lambda m: m.text == "➕ Добавить пару")
+@buttons.button("➕ Добавить пару")
 async def add_schedule_start(message: types.Message, state: FSMContext):
-    await message.answer("Введите день недели:", reply_markup=get_back_keyboard())
+    await message.answer("Введите день недели:", reply_markup=BACK_KEYBOARD)
     await state.set_state(Form.waiting_for_schedule_day)
 
 @dp.message(Form.waiting_for_schedule_day)
@@ -238,50 +780,38 @@ async def add_schedule_subject(message: types.Message, state: FSMContext):
         "subject": message.text,
         "added": datetime.now().strftime("%d.%m.%Y %H:%M")
     }
+    new_class.update(normalize_class(data["day"], data["time"]))
     
-    user_data[user_id].setdefault("schedule", []).append(new_class)
-    save_data()
+    await storage.append_class(user_id, new_class)
+    timetable_index.add_class(user_id, new_class)
+    usage.record("classes")
     
     await message.answer(f"✅ <b>Пара добавлена!</b>\n\n{data['day']} {data['time']} - {message.text}")
     await state.clear()
 
-@dp.message(lambda m: m.text == "📋 Посмотреть расписание")
+@buttons.button("📋 Посмотреть расписание")
 async def handle_view_schedule(message: types.Message):
     user_id = message.from_user.id
     
-    if user_id not in user_data:
+    if await storage.get_user(user_id) is None:
         await message.answer("Сначала нажмите /start")
         return
     
-    schedule = user_data[user_id].get("schedule", [])
-    
-    if not schedule:
+    page = await list_view(user_id, "s", 0)
+    if page is None:
         await message.answer("📭 <b>Расписание пусто</b>\n\nДобавьте первую пару!")
         return
     
-    response = "📅 <b>Ваше расписание:</b>\n\n"
-    for i, cls in enumerate(schedule, 1):
-        response += f"{i}. {cls.get('day', 'День')} {cls.get('time', 'Время')}\n"
-        response += f"   📚 {cls.get('subject', 'Предмет')}\n"
-        if cls.get('added'):
-            response += f"   📅 Добавлено: {cls['added']}\n"
-        response += "\n"
-    
-    await message.answer(response)
+    text, markup = page
+    await message.answer(text, reply_markup=markup)
 
-@dp.message(lambda m: m.text == "⏰ Дедлайны")
+@buttons.button("⏰ Дедлайны")
 async def handle_deadlines(message: types.Message):
-    buttons = [
-        [KeyboardButton(text="➕ Новый дедлайн")],
-        [KeyboardButton(text="📋 Мои дедлайны")],
-        [KeyboardButton(text="↩️ Назад")]
-    ]
-    keyboard = ReplyKeyboardMarkup(keyboard=buttons, resize_keyboard=True)
-    await message.answer("⏰ <b>Управление дедлайнами</b>\n\nВыберите действие:", reply_markup=keyboard)
+    await message.answer("⏰ <b>Управление дедлайнами</b>\n\nВыберите действие:", reply_markup=DEADLINES_KEYBOARD)
 
-@dp.message(lambda m: m.text == "➕ Новый дедлайн")
+@buttons.button("➕ Новый дедлайн")
 async def add_deadline_start(message: types.Message, state: FSMContext):
-    await message.answer("Введите название задания:", reply_markup=get_back_keyboard())
+    await message.answer("Введите название задания:", reply_markup=BACK_KEYBOARD)
     await state.set_state(Form.waiting_for_deadline_name)
 
 @dp.message(Form.waiting_for_deadline_name)
@@ -311,51 +841,42 @@ async def add_deadline_date(message: types.Message, state: FSMContext):
         "created": datetime.now().strftime("%d.%m.%Y %H:%M"),
         "completed": False
     }
+    new_deadline.update(normalize_deadline(message.text))
     
-    user_data[user_id].setdefault("deadlines", []).append(new_deadline)
-    save_data()
+    total = await storage.append_deadline(user_id, new_deadline)
+    timetable_index.add_deadline(user_id, new_deadline)
+    usage.record("deadlines")
+    usage.deadline_due(due_iso(new_deadline))
+    due_ts = deadline_due_ts(new_deadline, await storage.get_user(user_id) or {})
+    if due_ts is not None:
+        reminders.add(user_id, total - 1, due_ts)
     
     await message.answer(f"✅ <b>Дедлайн добавлен!</b>\n\n{data['name']} - {message.text}")
     await state.clear()
 
-@dp.message(lambda m: m.text == "📋 Мои дедлайны")
+@buttons.button("📋 Мои дедлайны")
 async def handle_view_deadlines(message: types.Message):
     user_id = message.from_user.id
     
-    if user_id not in user_data:
+    if await storage.get_user(user_id) is None:
         await message.answer("Сначала нажмите /start")
         return
     
-    deadlines = user_data[user_id].get("deadlines", [])
-    
-    if not deadlines:
+    page = await list_view(user_id, "d", 0)
+    if page is None:
         await message.answer("📭 <b>Дедлайнов нет</b>\n\nДобавьте первый дедлайн!")
         return
     
-    response = "⏰ <b>Ваши дедлайны:</b>\n\n"
-    for i, dl in enumerate(deadlines, 1):
-        response += f"{i}. {dl.get('name', 'Задание')}\n"
-        if dl.get('due_date'):
-            response += f"   📅 Срок: {dl['due_date']}\n"
-        if dl.get('created'):
-            response += f"   📝 Добавлено: {dl['created']}\n"
-        response += "\n"
-    
-    await message.answer(response)
+    text, markup = page
+    await message.answer(text, reply_markup=markup)
 
-@dp.message(lambda m: m.text == "📝 Заметки")
+@buttons.button("📝 Заметки")
 async def handle_notes(message: types.Message):
-    buttons = [
-        [KeyboardButton(text="➕ Новая заметка")],
-        [KeyboardButton(text="📋 Все заметки")],
-        [KeyboardButton(text="↩️ Назад")]
-    ]
-    keyboard = ReplyKeyboardMarkup(keyboard=buttons, resize_keyboard=True)
-    await message.answer("📝 <b>Управление заметками</b>\n\nВыберите действие:", reply_markup=keyboard)
+    await message.answer("📝 <b>Управление заметками</b>\n\nВыберите действие:", reply_markup=NOTES_KEYBOARD)
 
-@dp.message(lambda m: m.text == "➕ Новая заметка")
+@buttons.button("➕ Новая заметка")
 async def handle_add_note_button(message: types.Message, state: FSMContext):
-    await message.answer("Напишите текст заметки:", reply_markup=get_back_keyboard())
+    await message.answer("Напишите текст заметки:", reply_markup=BACK_KEYBOARD)
     await state.set_state(Form.waiting_for_note_text)
 
 @dp.message(Form.waiting_for_note_text)
@@ -371,91 +892,97 @@ async def add_note_text(message: types.Message, state: FSMContext):
         "created": datetime.now().strftime("%d.%m.%Y %H:%M")
     }
     
-    user_data[user_id].setdefault("notes", []).append(new_note)
-    save_data()
+    total = await storage.append_note(user_id, new_note)
+    search_index.add_note(user_id, total - 1, message.text)
+    usage.record("notes")
     
-    await message.answer(f"✅ <b>Заметка сохранена!</b>\n\nВсего заметок: {len(user_data[user_id]['notes'])}")
+    await message.answer(f"✅ <b>Заметка сохранена!</b>\n\nВсего заметок: {total}")
     await state.clear()
 
-@dp.message(lambda m: m.text == "📋 Все заметки")
+@buttons.button("📋 Все заметки")
 async def handle_view_all_notes(message: types.Message):
     user_id = message.from_user.id
     
-    if user_id not in user_data:
+    if await storage.get_user(user_id) is None:
         await message.answer("Сначала нажмите /start")
         return
     
-    notes = user_data[user_id].get("notes", [])
-    
-    if not notes:
+    page = await list_view(user_id, "n", -1)
+    if page is None:
         await message.answer("📭 <b>Заметок нет</b>\n\nДобавьте первую заметку!")
         return
     
-    response = f"📝 <b>Ваши заметки</b> (всего: {len(notes)})\n\n"
-    for i, note in enumerate(reversed(notes[-10:]), 1):  # Последние 10
-        text = note.get('text', '')
-        preview = text[:50] + "..." if len(text) > 50 else text
-        response += f"{i}. {preview}\n"
-        if note.get('created'):
-            response += f"   📅 {note['created']}\n"
-        response += "\n"
-    
-    await message.answer(response)
+    text, markup = page
+    await message.answer(text, reply_markup=markup)
 
-@dp.message(lambda m: m.text == "🔍 Поиск")
+@buttons.button("🔍 Поиск")
 async def handle_search(message: types.Message, state: FSMContext):
-    await message.answer("🔍 <b>Поиск по заметкам</b>\n\nВведите текст для поиска:", reply_markup=get_back_keyboard())
+    await message.answer("🔍 <b>Поиск по заметкам</b>\n\nВведите текст для поиска:", reply_markup=BACK_KEYBOARD)
     await state.set_state(Form.waiting_for_search_query)
 
 @dp.message(Form.waiting_for_search_query)
 async def process_search(message: types.Message, state: FSMContext):
     if message.text == "↩️ Назад":
         await state.clear()
-        await message.answer("Главное меню:", reply_markup=get_main_keyboard())
+        await message.answer("Главное меню:", reply_markup=MAIN_KEYBOARD)
         return
     
-    user_id = message.from_user.id
-    notes = user_data.get(user_id, {}).get("notes", [])
-    
-    found = [n for n in notes if message.text.lower() in n.get("text", "").lower()]
-    
-    if found:
-        response = f"🔍 <b>Найдено заметок: {len(found)}</b>\n\n"
-        for i, note in enumerate(found[:5], 1):  # Первые 5
-            text = note.get('text', '')
-            preview = text[:80] + "..." if len(text) > 80 else text
-            response += f"{i}. {preview}\n"
-            if note.get('created'):
-                response += f"   📅 {note['created']}\n"
-            response += "\n"
-        
-        if len(found) > 5:
-            response += f"<i>Показано 5 из {len(found)}</i>"
-    else:
-        response = "🔍 <b>Ничего не найдено</b>"
-    
-    await message.answer(response)
+    # Запрос остаётся в данных FSM, чтобы листать результаты
     await state.clear()
+    await state.update_data(search_query=message.text)
+    
+    page = await list_view(message.from_user.id, "q", 0, state)
+    if page is None:
+        await message.answer("🔍 <b>Ничего не найдено</b>")
+        return
+    
+    text, markup = page
+    await message.answer(text, reply_markup=markup)
+
+@dp.callback_query(PageCallback.filter())
+async def handle_page(callback: types.CallbackQuery, callback_data: PageCallback, state: FSMContext):
+    """Листание списка: то же сообщение редактируется на месте"""
+    page = None
+    if isinstance(callback.message, types.Message):
+        page = await list_view(callback.from_user.id, callback_data.view, callback_data.cursor, state)
+    if page is None:
+        await callback.answer("Список устарел - откройте его заново")
+        return
+    
+    text, markup = page
+    try:
+        await callback.message.edit_text(text, reply_markup=markup)
+    except TelegramBadRequest as e:
+        # Повторное нажатие на ту же страницу
+        if "message is not modified" not in str(e):
+            raise
+    await callback.answer()
 
-@dp.message(lambda m: m.text == "📋 Сегодня")
+@buttons.button("📋 Сегодня")
 async def handle_today_button(message: types.Message):
     await cmd_today(message)
 
-@dp.message(lambda m: m.text == "ℹ️ Помощь")
+@buttons.button("ℹ️ Помощь")
 async def handle_help_button(message: types.Message):
     await cmd_help(message)
 
-@dp.message(lambda m: m.text == "↩️ Назад")
+@buttons.button("↩️ Назад")
 async def handle_back(message: types.Message):
-    await message.answer("🏠 <b>Главное меню</b>", reply_markup=get_main_keyboard())
+    await message.answer("🏠 <b>Главное меню</b>", reply_markup=MAIN_KEYBOARD)
 
 # ========== ОБРАБОТЧИК ОСТАЛЬНЫХ СООБЩЕНИЙ ==========
 @dp.message()
-async def handle_other_messages(message: types.Message):
+async def handle_other_messages(message: types.Message, overloaded: bool = False):
     """Обработчик всех остальных сообщений (быстрые заметки)"""
     user_id = message.from_user.id
     
-    if user_id not in user_data:
+    if await storage.get_user(user_id) is None:
+        return
+    
+    # Файлы, фото и стикеры - не заметки; файл без /import - подсказка
+    if message.text is None:
+        if message.document is not None:
+            await message.answer("📥 Чтобы загрузить данные из файла, сначала отправьте /import")
         return
     
     # Проверяем, не является ли сообщение командой
@@ -463,15 +990,7 @@ async def handle_other_messages(message: types.Message):
         return
     
     # Проверяем, не является ли сообщение текстом кнопки
-    button_texts = [
-        "📅 Расписание", "⏰ Дедлайны", "📝 Заметки", "🔍 Поиск",
-        "📋 Сегодня", "ℹ️ Помощь", "↩️ Назад",
-        "➕ Добавить пару", "📋 Посмотреть расписание",
-        "➕ Новый дедлайн", "📋 Мои дедлайны",
-        "➕ Новая заметка", "📋 Все заметки"
-    ]
-    
-    if message.text in button_texts:
+    if message.text in BUTTON_TEXTS:
         return
     
     # Если не команда и не кнопка - сохраняем как быструю заметку
@@ -481,36 +1000,177 @@ async def handle_other_messages(message: types.Message):
         "quick_save": True
     }
     
-    user_data[user_id].setdefault("notes", []).append(new_note)
-    save_data()
+    total = await storage.append_note(user_id, new_note)
+    search_index.add_note(user_id, total - 1, message.text)
+    usage.record("notes")
     
-    # Отправляем подтверждение для коротких сообщений
-    if len(message.text) < 100:
-        await message.answer(f"💾 <b>Сохранено как заметка!</b>\n\nВсего заметок: {len(user_data[user_id]['notes'])}")
+    # Отправляем подтверждение для коротких сообщений (при перегрузке - нет)
+    if len(message.text) < 100 and not overloaded:
+        await message.answer(f"💾 <b>Сохранено как заметка!</b>\n\nВсего заметок: {total}")
 
 # ========== УТРЕННИЕ НАПОМИНАНИЯ ==========
-async def send_digests():
-    """Отправка утренних напоминаний"""
-    logger.info("Отправка утренних напоминаний...")
-    for user_id in user_data:
-        try:
-            await bot.send_message(
-                user_id,
-                "🌅 <b>Доброе утро!</b>\n\nУдачи в учебе сегодня! 🎓\n\n"
-                "Не забудь проверить расписание и дедлайны!"
-            )
-        except Exception as e:
-            logger.error(f"Не удалось отправить сообщение пользователю {user_id}: {e}")
+# Рассылки идут через общий движок: пул воркеров, лимиты Telegram, курсор на диске
+broadcaster = Broadcaster(
+    bot,
+    workers=int(os.getenv("BROADCAST_WORKERS", 16)),
+    # Лимит Telegram общий для бота - делится между воркерами
+    global_rate=float(os.getenv("BROADCAST_RATE", 25)) / SHARD_WORKERS,
+    per_chat_rate=float(os.getenv("BROADCAST_CHAT_RATE", 1))
+)
+
+DIGEST_GREETING = "🌅 <b>Доброе утро!</b>\n\nУдачи в учебе сегодня! 🎓"
+
+async def render_digest(user_id: int):
+    """Персональная сводка: пары на сегодня и ближайшие дедлайны"""
+    profile = await storage.get_user(user_id)
+    if profile is None:
+        return None
+    timetable = await get_timetable(user_id)
+    today = local_today(user_timezone(profile))
+    return f"{DIGEST_GREETING}\n\n{render_day(timetable, today, DEADLINE_HORIZON_DAYS)}"
+
+DIGEST_JOB_PREFIX = "digest-"
+DIGEST_JOB_FORMAT = "%Y-%m-%dT%H:%M"
+# Прерванную рассылку слота имеет смысл продолжать только в течение этого времени
+DIGEST_RESUME_WINDOW = timedelta(hours=3)
+
+async def send_digests(slot_start: datetime = None):
+    """Отправка утренних напоминаний пользователям текущего слота"""
+    if slot_start is None:
+        slot_start = digest_buckets.floor(datetime.now(pytz.utc))
+    users = digest_buckets.due(slot_start)
+    if not users:
+        return
+    logger.info(f"Отправка утренних напоминаний: {len(users)} польз. (слот {slot_start.strftime('%H:%M')} UTC)")
+    await broadcaster.run(
+        DIGEST_JOB_PREFIX + slot_start.strftime(DIGEST_JOB_FORMAT), users, render_digest
+    )
+
+def resume_digests():
+    """Продолжение утренних рассылок, прерванных падением процесса"""
+    now = datetime.now(pytz.utc)
+    for job_id in broadcaster.unfinished_jobs():
+        if not job_id.startswith(DIGEST_JOB_PREFIX):
+            continue
+        slot_start = pytz.utc.localize(
+            datetime.strptime(job_id[len(DIGEST_JOB_PREFIX):], DIGEST_JOB_FORMAT)
+        )
+        if now - slot_start < DIGEST_RESUME_WINDOW:
+            asyncio.create_task(send_digests(slot_start))
+        else:
+            broadcaster.forget(job_id)
+
+# ========== НАПОМИНАНИЯ О ДЕДЛАЙНАХ ==========
+async def send_reminders(batch):
+    """Отправка пачки наступивших напоминаний (одно сообщение на пользователя)"""
+    by_user = {}
+    for user_id, index, label in batch:
+        by_user.setdefault(user_id, []).append((index, label))
+
+    async def render(user_id: int):
+        deadlines = await storage.list_deadlines(user_id)
+        lines = []
+        for index, label in by_user[user_id]:
+            if index < len(deadlines) and not deadlines[index].get("completed"):
+                deadline = deadlines[index]
+                lines.append(
+                    f"• {deadline.get('name', 'Задание')} - срок {deadline.get('due_date', '')} "
+                    f"(осталось {label})"
+                )
+        if not lines:
+            return None
+        return "⏰ <b>Напоминание о дедлайне</b>\n\n" + "\n".join(lines) + "\n\nВыполнено? Отметь: /done номер"
+
+    await broadcaster.run(f"reminders-{int(time.time())}", by_user, render, resumable=False)
+
+reminders = ReminderEngine(send_reminders)
 
 # ========== HEALTH-CHECK СЕРВЕР ДЛЯ RENDER ==========
 async def health_handler(request):
     """Обработчик для health-check от Render"""
-    return web.Response(
-        text=f"✅ StudyBuddy Bot работает\n"
-             f"⏰ Время: {datetime.now().strftime('%H:%M:%S')}\n"
-             f"👤 Пользователей: {len(user_data)}",
-        status=200
+    stats = persistence.metrics()
+    lines = [
+        "✅ StudyBuddy Bot работает",
+        f"⏰ Время: {datetime.now().strftime('%H:%M:%S')}",
+        f"👤 Пользователей: {await storage.count_users()}",
+        f"💾 Сохранений: {stats['flushes']}, "
+        f"задержка {stats['flush_latency_avg_ms']:.1f} мс (макс {stats['flush_latency_max_ms']:.1f}), "
+        f"пачка {stats['batch_size_avg']:.1f} (макс {stats['batch_size_max']}), "
+        f"ожидают записи: {stats['pending_dirty_users']}",
+    ]
+    cache = storage.stats()
+    if "hits" in cache:
+        lines.append(
+            f"🗂 Кэш пользователей ({cache['policy']}): {cache['size']}/{cache['capacity']}, "
+            f"попаданий {cache['hit_ratio'] * 100:.1f}% ({cache['hits']}/{cache['hits'] + cache['misses']}), "
+            f"вытеснений {cache['evictions']}, ждут записи {cache['writeback']}"
+        )
+    load = throttle.stats()
+    lines.append(
+        f"🚦 Обновления: обрабатывается {load['in_flight']}/{throttle.concurrency}, "
+        f"в очереди {load['waiting']}, отброшено по лимиту {load['throttled']} "
+        f"(предупреждений {load['warnings']}), заметок без подтверждения {load['shed']}, "
+        f"отклонено при переполнении очереди {load['rejected']}"
     )
+    sending = outbound.stats()
+    endpoints = sorted(sending["endpoints"].items(), key=lambda item: -item[1]["calls"])[:3]
+    lines.append(
+        f"📤 Запросы к Bot API: выполняется {sending['in_flight']}/{OUTBOUND_CONCURRENCY}, "
+        f"ждут {sending['waiting']['interactive']} + {sending['waiting']['background']} (рассылки)"
+        + "".join(
+            f"; {name} {stat['calls']} шт., {stat['latency_avg_ms']:.0f} мс "
+            f"(макс {stat['latency_max_ms']:.0f}), очередь {stat['wait_avg_ms']:.1f} мс, "
+            f"повторов {stat['retries']}"
+            for name, stat in endpoints
+        )
+    )
+    activity = usage.snapshot()
+    lines.append(
+        f"📊 Активны сегодня ~{activity['active_today']}, за неделю ~{activity['active_week']}; "
+        f"за час: обновлений {activity['last_hour']['updates']}, заметок {activity['last_hour']['notes']}; "
+        f"заметок на пользователя {activity['notes_per_user']}, "
+        f"дедлайнов на неделе {activity['due_this_week']}"
+    )
+    last = broadcaster.last_stats
+    if last is not None:
+        lines.append(
+            f"📣 Рассылка {last.job_id}: {last.sent}/{last.total}, "
+            f"{last.rate:.1f} сообщ./с, {last.elapsed:.1f} с"
+        )
+    return web.Response(text="\n".join(lines), status=200)
+
+async def metrics_handler(request):
+    """Метрики в формате Prometheus"""
+    bot_metrics.users.set(await storage.count_users())
+    bot_metrics.pending_users.set(len(persistence.dirty))
+    for name, value in storage.stats().items():
+        if isinstance(value, (int, float)):
+            bot_metrics.storage.set(value, name)
+    return web.Response(text=bot_metrics.render(), content_type="text/plain", charset="utf-8")
+
+async def stats_handler(request):
+    """Статистика использования в JSON: итоги, активные пользователи, ряды по минутам и дням"""
+    return web.json_response(usage.snapshot(), dumps=lambda data: json.dumps(data, ensure_ascii=False))
+
+async def profiler_handler(request):
+    """Включение и выключение профилировщика: action=start|stop|report"""
+    if not secrets.compare_digest(request.query.get("token", ""), PROFILER_TOKEN):
+        return web.Response(text="Forbidden", status=403)
+    
+    action = request.query.get("action", "report")
+    if action == "start":
+        profiler.start()
+        logger.info("🔬 Профилировщик включён")
+        return web.Response(text="✅ Профилировщик включён\n")
+    if action == "stop":
+        profiler.stop()
+        logger.info("🔬 Профилировщик выключен")
+    elif action != "report":
+        return web.Response(text="action: start, stop или report", status=400)
+    
+    if request.query.get("format") == "collapsed":
+        return web.Response(text=profiler.collapsed())
+    return web.Response(text=profiler.report())
 
 async def wakeup_handler(request):
     """Специальный endpoint для внешних сервисов пробуждения"""
@@ -530,6 +1190,19 @@ async def start_web_server():
     app.router.add_get('/health', health_handler)
     app.router.add_get('/wakeup', wakeup_handler)  # Для внешних сервисов пробуждения
     app.router.add_get('/ping', health_handler)
+    app.router.add_get('/metrics', metrics_handler)
+    app.router.add_get('/stats.json', stats_handler)
+    if PROFILER_TOKEN:
+        app.router.add_get('/profiler', profiler_handler)
+    
+    # Обновления от Telegram в режиме webhook; запросы без верного
+    # X-Telegram-Bot-Api-Secret-Token отклоняются
+    if WEBHOOK_URL:
+        SimpleRequestHandler(
+            dispatcher=dp,
+            bot=bot,
+            secret_token=WEBHOOK_SECRET
+        ).register(app, path=WEBHOOK_PATH)
     
     # Получаем порт из переменной окружения Render
     port = int(os.getenv("PORT", 10000))
@@ -542,47 +1215,152 @@ async def start_web_server():
     logger.info(f"✅ Веб-сервер запущен на порту {port}")
     logger.info(f"✅ Health-check доступен по адресу: /")
     logger.info(f"✅ Wake-up endpoint: /wakeup")
+    logger.info(f"✅ Метрики Prometheus: /metrics")
+    logger.info(f"✅ Статистика использования: /stats.json")
+    if WEBHOOK_URL:
+        logger.info(f"✅ Webhook endpoint: {WEBHOOK_PATH}")
     
     return runner
 
+async def run_webhook():
+    """Режим webhook: Telegram сам присылает обновления на веб-сервер"""
+    await bot.set_webhook(
+        url=WEBHOOK_URL + WEBHOOK_PATH,
+        secret_token=WEBHOOK_SECRET,
+        allowed_updates=dp.resolve_used_update_types(),
+        drop_pending_updates=True
+    )
+    logger.info(f"🚀 Webhook установлен: {WEBHOOK_URL}{WEBHOOK_PATH}")
+    await wait_for_stop()
+
+async def run_polling():
+    """Режим polling: бот сам запрашивает обновления у Telegram"""
+    # Очистка webhook перед запуском polling
+    logger.info("🧹 Очистка webhook...")
+    try:
+        await bot.delete_webhook(drop_pending_updates=True)
+        logger.info("✅ Webhook очищен")
+    except Exception as e:
+        logger.warning(f"⚠️ Не удалось очистить webhook: {e}")
+    
+    # Запуск polling
+    logger.info("🚀 Запуск Telegram polling...")
+    await dp.start_polling(
+        bot,
+        allowed_updates=dp.resolve_used_update_types(),
+        skip_updates=True
+    )
+
+# ========== РАСПРЕДЕЛИТЕЛЬ ШАРДОВ ==========
+async def run_front():
+    """Приём обновлений и передача их SHARD_WORKERS воркерам по user_id"""
+    dirs = await prepare_shards(SHARDS_DIR, SHARD_WORKERS, make_storage)
+    front = ShardFront(
+        BOT_TOKEN,
+        os.path.abspath(__file__),
+        [os.path.abspath(path) for path in dirs],
+        SHARD_BASE_PORT,
+        api_url=TELEGRAM_API_URL or "https://api.telegram.org",
+        allowed_updates=dp.resolve_used_update_types()
+    )
+    tasks = [asyncio.create_task(front.supervise(i)) for i in range(SHARD_WORKERS)]
+    tasks += [asyncio.create_task(link.run()) for link in front.links]
+    
+    app = web.Application()
+    app.router.add_get('/', front.health_handler)
+    app.router.add_get('/health', front.health_handler)
+    app.router.add_get('/ping', front.health_handler)
+    app.router.add_get('/wakeup', wakeup_handler)
+    if WEBHOOK_URL:
+        app.router.add_post(WEBHOOK_PATH, front.webhook_handler(WEBHOOK_SECRET))
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, '0.0.0.0', int(os.getenv("PORT", 10000))).start()
+    
+    try:
+        if WEBHOOK_URL:
+            await front.set_webhook(WEBHOOK_URL + WEBHOOK_PATH, WEBHOOK_SECRET)
+        else:
+            tasks.append(asyncio.create_task(front.poll()))
+        await wait_for_stop()
+    finally:
+        logger.info("👋 Остановка воркеров...")
+        for task in tasks:
+            task.cancel()
+        await front.close()
+        await runner.cleanup()
+        await bot.session.close()
+
+def run_single_shard():
+    """Один процесс после работы с шардами: данные собираются в один шард,
+    и бот перезапускается в его каталоге (иначе прочитал бы устаревшие
+    данные однопроцессного режима в текущем каталоге)"""
+    dirs = asyncio.run(prepare_shards(SHARDS_DIR, 1, make_storage))
+    script = os.path.abspath(__file__)
+    os.chdir(dirs[0])
+    os.environ["SHARD_INDEX"] = "0"
+    sys.stdout.flush()
+    os.execv(sys.executable, [sys.executable, script])
+
 # ========== ГЛАВНАЯ ФУНКЦИЯ ==========
+async def run_background(deferred: bool):
+    """Планировщик утренних рассылок, продолжение прерванных рассылок и напоминания.
+
+    deferred=True (FAST_START) - сначала ждём первое обработанное обновление,
+    но не дольше STARTUP_DEFER_S, и догружаем данные и индексы.
+    """
+    if deferred:
+        try:
+            await asyncio.wait_for(first_update.wait(), STARTUP_DEFER_S)
+        except asyncio.TimeoutError:
+            pass
+        started = time.perf_counter()
+        await storage.materialize()
+        await build_indexes()
+        logger.info(f"📦 Данные догружены за {time.perf_counter() - started:.2f} с")
+    
+    # Настройка планировщика
+    scheduler = AsyncIOScheduler(timezone=pytz.utc)
+    scheduler.add_job(send_digests, "cron", minute=f"*/{digest_buckets.bucket_minutes}")
+    scheduler.add_job(usage.save, "interval", minutes=5)
+    scheduler.start()
+    logger.info(
+        f"📅 Планировщик запущен (утренние напоминания по слотам "
+        f"{digest_buckets.bucket_minutes} мин, групп: {len(digest_buckets.sizes())})"
+    )
+    try:
+        # Продолжаем утренние рассылки, прерванные падением процесса
+        resume_digests()
+        await reminders.run()
+    finally:
+        scheduler.shutdown(wait=False)
+
 async def main():
     """Основная функция запуска бота"""
+    global first_update
     try:
         # Загружаем данные
-        load_data()
+        if FAST_START:
+            first_update = asyncio.Event()
+            await open_storage()
+        else:
+            await load_data()
         logger.info("🤖 Бот запускается...")
+        background_task = asyncio.create_task(run_background(deferred=FAST_START))
         
-        # Настройка планировщика
-        scheduler = AsyncIOScheduler(timezone="Europe/Moscow")
-        scheduler.add_job(send_digests, "cron", hour=8, minute=0)
-        scheduler.start()
-        logger.info("📅 Планировщик запущен (утренние напоминания в 8:00)")
-        
-        # Запуск health-check сервера
-        health_runner = await start_web_server()
-        
-        # Даем время на запуск веб-сервера
-        await asyncio.sleep(1)
-        
-        # Очистка webhook перед запуском polling
-        logger.info("🧹 Очистка webhook...")
-        try:
-            await bot.delete_webhook(drop_pending_updates=True)
-            logger.info("✅ Webhook очищен")
-        except Exception as e:
-            logger.warning(f"⚠️ Не удалось очистить webhook: {e}")
-        
-        # Пауза перед запуском polling
-        await asyncio.sleep(2)
-        
-        # Запуск polling
-        logger.info("🚀 Запуск Telegram polling...")
-        await dp.start_polling(
-            bot,
-            allowed_updates=dp.resolve_used_update_types(),
-            skip_updates=True
-        )
+        if SHARD_PORT:
+            # Воркер шарда: обновления приходят от распределителя
+            shard_server = await serve_shard(dp, bot, SHARD_PORT)
+            await wait_for_stop()
+            shard_server.close()
+        else:
+            # Запуск health-check сервера
+            health_runner = await start_web_server()
+            
+            if WEBHOOK_URL:
+                await run_webhook()
+            else:
+                await run_polling()
         
     except Exception as e:
         logger.error(f"❌ Критическая ошибка при запуске: {e}")
@@ -591,6 +1369,12 @@ async def main():
         # Корректное завершение
         logger.info("👋 Завершение работы бота...")
         try:
+            if 'background_task' in locals():
+                background_task.cancel()
+            await persistence.flush()
+            usage.save()
+            await fsm_storage.close()
+            await storage.close()
             if 'health_runner' in locals():
                 await health_runner.cleanup()
             await bot.session.close()
@@ -610,11 +1394,19 @@ if __name__ == "__main__":
     
     print(f"✅ Токен получен")
     print(f"✅ Порт: {os.getenv('PORT', 10000)}")
+    print(f"✅ Режим: {'webhook' if WEBHOOK_URL else 'polling'}")
     print("=" * 60)
     
     # Запускаем бота
     try:
-        asyncio.run(main())
+        if SHARD_WORKERS > 1 and SHARD_INDEX is None:
+            print(f"✅ Воркеров: {SHARD_WORKERS}")
+            asyncio.run(run_front())
+        elif SHARD_INDEX is None and read_manifest(SHARDS_DIR) is not None:
+            print(f"✅ Данные в {SHARDS_DIR}: один воркер")
+            run_single_shard()
+        else:
+            asyncio.run(main())
     except KeyboardInterrupt:
         print("\n👋 Бот остановлен вручную")
     except Exception as e:
@@ -0,0 +1,329 @@
+import os
+import sys
+import threading
+import time
+from bisect import bisect_left
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Sequence, Tuple
+
+from aiogram import BaseMiddleware
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+from aiogram.types import TelegramObject, Update
+
+# Границы корзин гистограмм задержки, секунды
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+Labels = Tuple[str, ...]
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(names: Sequence[str], values: Labels, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(value)
+
+
+# ========== МЕТРИКИ ==========
+class Counter:
+    """Счётчик Prometheus с метками"""
+
+    kind = "counter"
+
+    def __init__(self, name: str, help_text: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.help = help_text
+        self.labels = tuple(labels)
+        self.values: Dict[Labels, float] = {}
+
+    def inc(self, *labels: str, amount: float = 1.0):
+        self.values[labels] = self.values.get(labels, 0.0) + amount
+
+    def samples(self) -> List[str]:
+        return [
+            f"{self.name}{_format_labels(self.labels, labels)} {_format_value(value)}"
+            for labels, value in sorted(self.values.items())
+        ]
+
+
+class Gauge(Counter):
+    """Текущее значение (пользователи, очередь записи и т.п.)"""
+
+    kind = "gauge"
+
+    def set(self, value: float, *labels: str):
+        self.values[labels] = value
+
+
+class Histogram:
+    """Гистограмма Prometheus: накопительные корзины, сумма и число наблюдений"""
+
+    kind = "histogram"
+
+    def __init__(self, name: str, help_text: str, labels: Sequence[str] = (),
+                 buckets: Sequence[float] = LATENCY_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        # метки -> [счётчики корзин (последняя - +Inf), сумма]
+        self.values: Dict[Labels, List[Any]] = {}
+
+    def observe(self, value: float, *labels: str):
+        series = self.values.get(labels)
+        if series is None:
+            series = self.values[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+        series[0][bisect_left(self.buckets, value)] += 1
+        series[1] += value
+
+    def samples(self) -> List[str]:
+        lines = []
+        for labels, (counts, total) in sorted(self.values.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else _format_value(bound)
+                bucket_labels = _format_labels(self.labels, labels, 'le="' + le + '"')
+                lines.append(f"{self.name}_bucket{bucket_labels} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labels, labels)} {total!r}")
+            lines.append(f"{self.name}_count{_format_labels(self.labels, labels)} {cumulative}")
+        return lines
+
+
+class Registry:
+    """Набор метрик и вывод в текстовом формате Prometheus"""
+
+    def __init__(self, prefix: str = ""):
+        self.prefix = prefix
+        self.metrics: List[Any] = []
+
+    def counter(self, name: str, help_text: str, labels: Sequence[str] = ()) -> Counter:
+        return self._add(Counter(self.prefix + name, help_text, labels))
+
+    def gauge(self, name: str, help_text: str, labels: Sequence[str] = ()) -> Gauge:
+        return self._add(Gauge(self.prefix + name, help_text, labels))
+
+    def histogram(self, name: str, help_text: str, labels: Sequence[str] = (),
+                  buckets: Sequence[float] = LATENCY_BUCKETS) -> Histogram:
+        return self._add(Histogram(self.prefix + name, help_text, labels, buckets))
+
+    def _add(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in self.metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.samples())
+        return "\n".join(lines) + "\n"
+
+
+class BotMetrics:
+    """Метрики бота: обновления, обработчики, сохранения, запросы к Bot API"""
+
+    def __init__(self, prefix: str = "studybuddy_"):
+        self.registry = Registry(prefix)
+        r = self.registry
+
+        self.updates = r.counter("updates_total", "Обновления по типу", ["type"])
+        self.update_latency = r.histogram(
+            "update_latency_seconds", "Полное время обработки обновления", ["type"])
+        self.update_errors = r.counter(
+            "update_errors_total", "Обновления, завершившиеся исключением", ["type"])
+
+        self.handler_calls = r.counter("handler_calls_total", "Вызовы обработчиков", ["handler"])
+        self.handler_latency = r.histogram(
+            "handler_latency_seconds", "Время работы обработчика", ["handler"])
+        self.handler_errors = r.counter(
+            "handler_errors_total", "Исключения в обработчиках", ["handler", "error"])
+
+        self.flushes = r.counter("save_total", "Сбросы данных на диск", ["result"])
+        self.flush_latency = r.histogram("save_duration_seconds", "Длительность сброса на диск")
+        self.flush_batch = r.histogram(
+            "save_batch_mutations", "Изменений в одном сбросе",
+            buckets=(1, 2, 5, 10, 25, 50, 100, 250, 500, 1000))
+
+        self.api_calls = r.counter("api_requests_total", "Запросы к Bot API", ["method"])
+        self.api_latency = r.histogram(
+            "api_request_latency_seconds", "Время запроса к Bot API", ["method"])
+        self.api_errors = r.counter(
+            "api_errors_total", "Ошибки запросов к Bot API", ["method", "error"])
+        self.api_queue_wait = r.histogram(
+            "api_queue_wait_seconds", "Ожидание места в очереди исходящих запросов", ["priority"])
+        self.api_flood_retries = r.counter(
+            "api_flood_retries_total", "Повторы запросов после 429 Flood control", ["method"])
+
+        self.users = r.gauge("users", "Пользователей в хранилище")
+        self.pending_users = r.gauge("save_pending_users", "Пользователей с несохранёнными изменениями")
+        self.storage = r.gauge(
+            "storage_stat", "Счётчики хранилища (кэш пользователей, чтения и записи)", ["name"])
+
+    def observe_flush(self, latency: float, mutations: int, ok: bool):
+        """Учёт сброса на диск (PersistenceScheduler.on_flush)"""
+        self.flushes.inc("ok" if ok else "error")
+        if ok:
+            self.flush_latency.observe(latency)
+            self.flush_batch.observe(mutations)
+
+    def render(self) -> str:
+        return self.registry.render()
+
+
+# ========== MIDDLEWARE ==========
+class UpdateMetricsMiddleware(BaseMiddleware):
+    """Внешний middleware обновлений: число и полное время обработки по типу"""
+
+    def __init__(self, metrics: BotMetrics):
+        self.metrics = metrics
+
+    async def __call__(self, handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+                       event: TelegramObject, data: Dict[str, Any]) -> Any:
+        update_type = event.event_type if isinstance(event, Update) else type(event).__name__
+        start = time.perf_counter()
+        try:
+            return await handler(event, data)
+        except Exception:
+            self.metrics.update_errors.inc(update_type)
+            raise
+        finally:
+            self.metrics.updates.inc(update_type)
+            self.metrics.update_latency.observe(time.perf_counter() - start, update_type)
+
+
+class HandlerMetricsMiddleware(BaseMiddleware):
+    """Внутренний middleware: время и число вызовов каждого обработчика.
+
+    Регистрируется как inner middleware наблюдателя (dp.message и т.п.),
+    где уже известен выбранный обработчик.
+    """
+
+    def __init__(self, metrics: BotMetrics):
+        self.metrics = metrics
+
+    async def __call__(self, handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+                       event: TelegramObject, data: Dict[str, Any]) -> Any:
+        handler_object = data.get("handler")
+        name = getattr(getattr(handler_object, "callback", None), "__name__", "unknown")
+        start = time.perf_counter()
+        try:
+            return await handler(event, data)
+        except Exception as e:
+            self.metrics.handler_errors.inc(name, type(e).__name__)
+            raise
+        finally:
+            self.metrics.handler_calls.inc(name)
+            self.metrics.handler_latency.observe(time.perf_counter() - start, name)
+
+
+class RequestMetricsMiddleware(BaseRequestMiddleware):
+    """Middleware сессии бота: задержка и ошибки исходящих запросов к Bot API"""
+
+    def __init__(self, metrics: BotMetrics):
+        self.metrics = metrics
+
+    async def __call__(self, make_request, bot, method):
+        name = getattr(method, "__api_method__", type(method).__name__)
+        start = time.perf_counter()
+        try:
+            return await make_request(bot, method)
+        except Exception as e:
+            self.metrics.api_errors.inc(name, type(e).__name__)
+            raise
+        finally:
+            self.metrics.api_calls.inc(name)
+            self.metrics.api_latency.observe(time.perf_counter() - start, name)
+
+
+# ========== ПРОФИЛИРОВАНИЕ ==========
+class SamplingProfiler:
+    """Сэмплирующий профилировщик потока с циклом событий.
+
+    Отдельный поток раз в interval секунд снимает стек целевого потока
+    через sys._current_frames; сам цикл событий не замедляется, поэтому
+    профилировщик можно включать на работающем боте под реальной нагрузкой.
+    """
+
+    def __init__(self, interval: float = 0.01, max_depth: int = 40):
+        self.interval = interval
+        self.max_depth = max_depth
+        self.stacks: Dict[Tuple[str, ...], int] = {}
+        self.samples = 0
+        self.started: Optional[float] = None
+        self.stopped: Optional[float] = None
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, thread_id: Optional[int] = None):
+        """Начало сэмплирования потока thread_id (по умолчанию - текущего)"""
+        if self.running:
+            return
+        target = thread_id if thread_id is not None else threading.get_ident()
+        self.stacks = {}
+        self.samples = 0
+        self.started = time.time()
+        self.stopped = None
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, args=(target,),
+                                        name="sampling-profiler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
+        self.stopped = time.time()
+
+    def _run(self, target: int):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(target)
+            if frame is None:
+                continue
+            stack = []
+            while frame is not None and len(stack) < self.max_depth:
+                code = frame.f_code
+                stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                frame = frame.f_back
+            key = tuple(reversed(stack))
+            self.stacks[key] = self.stacks.get(key, 0) + 1
+            self.samples += 1
+
+    def collapsed(self) -> str:
+        """Стеки в формате flamegraph.pl: «кадр;кадр;кадр число»"""
+        return "\n".join(
+            f"{';'.join(stack)} {count}"
+            for stack, count in sorted(self.stacks.items(), key=lambda item: -item[1])
+        ) + "\n"
+
+    def report(self, limit: int = 25) -> str:
+        """Функции с наибольшей долей сэмплов: собственной и включительной"""
+        own: Dict[str, int] = {}
+        inclusive: Dict[str, int] = {}
+        for stack, count in self.stacks.items():
+            own[stack[-1]] = own.get(stack[-1], 0) + count
+            for frame in set(stack):
+                inclusive[frame] = inclusive.get(frame, 0) + count
+
+        total = self.samples or 1
+        duration = (self.stopped or time.time()) - (self.started or time.time())
+        lines = [f"Сэмплов: {self.samples} за {duration:.1f} с (интервал {self.interval * 1000:.0f} мс)", ""]
+        for title, table in (("Собственное время", own), ("Включая вызовы", inclusive)):
+            lines.append(title)
+            for frame, count in sorted(table.items(), key=lambda item: -item[1])[:limit]:
+                lines.append(f"{count * 100 / total:6.1f}%  {count:7d}  {frame}")
+            lines.append("")
+        return "\n".join(lines)
+
@@ -0,0 +1,57 @@
+"""Импорт user_data.json (снапшот + журнал изменений) в базу SQLite
+или в файлы на пользователя (STORAGE_BACKEND=files).
+
+Пример:
+    python migrate_json.py user_data.json studybuddy.db
+    python migrate_json.py user_data.json user_data --to files
+"""
+import argparse
+import logging
+import sqlite3
+import sys
+
+from storage import WriteAheadLog, export_user_files, import_users, init_schema
+
+logger = logging.getLogger(__name__)
+
+
+def migrate(json_path: str, db_path: str) -> int:
+    """Перенос всех пользователей из JSON-хранилища в SQLite"""
+    data = WriteAheadLog(json_path).load()
+    conn = sqlite3.connect(db_path)
+    try:
+        init_schema(conn)
+        return import_users(conn, data)
+    finally:
+        conn.close()
+
+
+def migrate_files(json_path: str, root: str) -> int:
+    """Перенос всех пользователей из JSON-хранилища в файлы на пользователя"""
+    return export_user_files(WriteAheadLog(json_path).load(), root)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Импорт user_data.json в SQLite или файлы пользователей")
+    parser.add_argument("json_path", nargs="?", default="user_data.json")
+    parser.add_argument("db_path", nargs="?", default=None,
+                        help="база SQLite (studybuddy.db) или каталог файлов (user_data)")
+    parser.add_argument("--to", choices=("sqlite", "files"), default="sqlite")
+    args = parser.parse_args()
+    if args.db_path is None:
+        args.db_path = "user_data" if args.to == "files" else "studybuddy.db"
+
+    logging.basicConfig(level=logging.INFO, format="%(levelname)s - %(message)s")
+    try:
+        if args.to == "files":
+            count = migrate_files(args.json_path, args.db_path)
+        else:
+            count = migrate(args.json_path, args.db_path)
+    except Exception as e:
+        logger.error(f"Ошибка миграции: {e}")
+        sys.exit(1)
+    logger.info(f"Перенесено пользователей: {count} ({args.json_path} -> {args.db_path})")
+
+
+if __name__ == "__main__":
+    main()
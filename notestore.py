@@ -0,0 +1,165 @@
+import base64
+import hashlib
+import zlib
+from array import array
+from typing import Any, Dict, List, Optional, Tuple, Union
+
+from records import NOTE_BODIES, NoteRecord, StringArena
+
+# Тексты от REF_MIN_BYTES байт хранятся один раз по хешу содержимого,
+# от COMPRESS_MIN_BYTES - ещё и сжатыми zlib (если сжатие даёт хотя бы треть)
+REF_MIN_BYTES = 128
+COMPRESS_MIN_BYTES = 1024
+# Начало текста для превью: render.preview показывает до 80 символов и
+# многоточие, если текст длиннее, - этого хватает 81 символа
+HEAD_CHARS = 81
+
+# Текст в note_bodies снапшота: строка или {"z": zlib в base64, "head": начало}
+Body = Union[str, Dict[str, str]]
+
+
+def _digest(data: bytes) -> int:
+    return int.from_bytes(hashlib.blake2b(data, digest_size=8).digest(), "little")
+
+
+def _span(span: int) -> Tuple[int, int]:
+    return span >> 32, span & 0xFFFFFFFF
+
+
+class NoteStore(StringArena):
+    """Тексты заметок с дедупликацией и сжатием.
+
+    Короткие тексты лежат в буфере подряд, как в StringArena, ссылка на них -
+    смещение и длина (>= 0). Длинные адресуются хешем содержимого: повторно
+    вставленный текст хранится один раз, ссылка - ~номер блока (< 0). Блоки
+    от compress_min байт сжимаются, их начало для превью хранится отдельно,
+    поэтому head() никогда не распаковывает текст целиком.
+    """
+
+    def __init__(self, ref_min: int = REF_MIN_BYTES, compress_min: int = COMPRESS_MIN_BYTES):
+        super().__init__()
+        self.ref_min = ref_min
+        self.compress_min = compress_min
+        # Хеш -> номер блока; у блока - хеш, место в буфере и (если сжат) начало текста
+        self.ids: Dict[int, int] = {}
+        self.digests = array("Q")
+        self.spans = array("Q")
+        self.heads: Dict[int, int] = {}
+        self.dedup_hits = 0
+
+    def _append(self, data: bytes) -> int:
+        offset = len(self.buffer)
+        self.buffer += data
+        return offset << 32 | len(data)
+
+    def _bytes(self, span: int) -> bytes:
+        offset, size = _span(span)
+        return bytes(self.buffer[offset:offset + size])
+
+    def _add_blob(self, digest: int, data: bytes, head: Optional[str] = None) -> int:
+        blob = len(self.spans)
+        self.digests.append(digest)
+        self.spans.append(self._append(data))
+        if head is not None:
+            self.heads[blob] = self._append(head.encode("utf-8"))
+        # При совпадении хеша у разных текстов второй блок не адресуется
+        self.ids.setdefault(digest, blob)
+        return blob
+
+    def _data(self, blob: int) -> bytes:
+        data = self._bytes(self.spans[blob])
+        return zlib.decompress(data) if blob in self.heads else data
+
+    # ---------- запись и чтение ----------
+    def put(self, text: str) -> int:
+        data = text.encode("utf-8")
+        if len(data) < self.ref_min:
+            return self._append(data)
+        digest = _digest(data)
+        blob = self.ids.get(digest)
+        if blob is not None and self._data(blob) == data:
+            self.dedup_hits += 1
+            return ~blob
+        if len(data) >= self.compress_min:
+            compressed = zlib.compress(data)
+            if len(compressed) * 3 < len(data) * 2:
+                return ~self._add_blob(digest, compressed, text[:HEAD_CHARS])
+        return ~self._add_blob(digest, data)
+
+    def get(self, ref: int) -> str:
+        if ref >= 0:
+            return super().get(ref)
+        return self._data(~ref).decode("utf-8")
+
+    def head(self, ref: int) -> str:
+        """Первые HEAD_CHARS символов текста (для превью) без распаковки"""
+        if ref < 0 and ~ref in self.heads:
+            return self._bytes(self.heads[~ref]).decode("utf-8")
+        offset, size = _span(ref if ref >= 0 else self.spans[~ref])
+        # Символ UTF-8 - не больше 4 байт; обрезанный последний символ отбрасывается
+        data = self.buffer[offset:offset + min(size, HEAD_CHARS * 4)]
+        return data.decode("utf-8", "ignore")[:HEAD_CHARS]
+
+    # ---------- формат снапшота ----------
+    def pack(self, ref: int) -> Optional[Tuple[str, Body]]:
+        """Ключ и текст для note_bodies снапшота; None - текст остаётся в заметке"""
+        if ref >= 0:
+            return None
+        blob = ~ref
+        digest = self.digests[blob]
+        if self.ids.get(digest) != blob:
+            return None
+        key = f"{digest:016x}"
+        data = self._bytes(self.spans[blob])
+        if blob in self.heads:
+            return key, {"z": base64.b64encode(data).decode("ascii"), "head": self.head(ref)}
+        return key, data.decode("utf-8")
+
+    def put_packed(self, key: str, body: Body) -> int:
+        """Текст из note_bodies снапшота; сжатый не распаковывается"""
+        if isinstance(body, str):
+            return self.put(body)
+        digest = int(key, 16)
+        blob = self.ids.get(digest)
+        if blob is not None:
+            self.dedup_hits += 1
+            return ~blob
+        return ~self._add_blob(digest, base64.b64decode(body["z"]), body["head"])
+
+    def pack_notes(self, notes: List[NoteRecord]) -> Tuple[List[Dict[str, Any]], Dict[str, Body]]:
+        """Заметки для снапшота: длинные тексты - ссылками ref на общий словарь"""
+        items, bodies = [], {}
+        for note in notes:
+            packed = self.pack(note.text) if note.text is not None else None
+            if packed is None:
+                items.append(note.to_dict(self))
+                continue
+            key, bodies[key] = packed
+            item = {"ref": key}
+            item.update(note.to_dict(self, skip=frozenset({"text"})))
+            items.append(item)
+        return items, bodies
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "note_blobs": len(self.spans),
+            "note_blobs_compressed": len(self.heads),
+            "note_dedup_hits": self.dedup_hits,
+        }
+
+
+def unpack_body(body: Body) -> str:
+    if isinstance(body, str):
+        return body
+    return zlib.decompress(base64.b64decode(body["z"])).decode("utf-8")
+
+
+def unpack_user(user: Dict[str, Any]) -> Dict[str, Any]:
+    """Пользователь снапшота с текстами заметок на месте ссылок ref (на месте)"""
+    bodies = user.pop(NOTE_BODIES, None)
+    if bodies:
+        for note in user.get("notes", []):
+            key = note.pop("ref", None)
+            if key is not None:
+                note["text"] = unpack_body(bodies[key])
+    return user
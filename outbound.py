@@ -0,0 +1,191 @@
+import asyncio
+import logging
+import time
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Callable, Deque, Dict, Iterator, Optional, Tuple
+
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+from aiogram.exceptions import TelegramRetryAfter
+
+from render import CachedMarkupSession
+
+logger = logging.getLogger(__name__)
+
+# Приоритеты исходящих запросов: ответы пользователям идут раньше рассылок
+INTERACTIVE, BACKGROUND = 0, 1
+PRIORITY_NAMES = ("interactive", "background")
+
+_priority: ContextVar[int] = ContextVar("outbound_priority", default=INTERACTIVE)
+
+# Долгие запросы, которым не нужно занимать место в очереди отправки
+UNGATED = frozenset({"getUpdates"})
+
+
+@contextmanager
+def background() -> Iterator[None]:
+    """Запросы внутри блока уступают очередь ответам пользователям"""
+    token = _priority.set(BACKGROUND)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+class OutboundSession(CachedMarkupSession):
+    """Сессия бота с настроенным пулом соединений к Bot API.
+
+    pool_size - соединений всего и к одному хосту (все запросы идут на один
+    адрес Bot API, поэтому лимит на хост совпадает с общим); keepalive -
+    сколько секунд держать простаивающее соединение, чтобы пики после пауз
+    не начинались с новых TCP/TLS-рукопожатий.
+    """
+
+    def __init__(self, pool_size: int = 100, keepalive: float = 60.0, **kwargs: Any):
+        super().__init__(limit=pool_size, **kwargs)
+        self._connector_init.update(limit_per_host=pool_size, keepalive_timeout=keepalive)
+
+
+class EndpointStats:
+    """Счётчики запросов одного метода Bot API"""
+
+    __slots__ = ("calls", "errors", "retries", "total_latency", "max_latency", "total_wait")
+
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.retries = 0
+        self.total_latency = 0.0
+        self.max_latency = 0.0
+        self.total_wait = 0.0
+
+    def as_dict(self) -> Dict[str, Any]:
+        calls = self.calls or 1
+        return {
+            "calls": self.calls,
+            "errors": self.errors,
+            "retries": self.retries,
+            "latency_avg_ms": self.total_latency / calls * 1000,
+            "latency_max_ms": self.max_latency * 1000,
+            "wait_avg_ms": self.total_wait / calls * 1000,
+        }
+
+
+class OutboundGate(BaseRequestMiddleware):
+    """Очередь исходящих запросов с приоритетами и обработкой 429.
+
+    Middleware сессии бота: одновременно выполняется не больше concurrency
+    запросов, освободившееся место достаётся сначала ожидающему ответу
+    пользователю, затем фоновой отправке (см. background()).
+
+    На ответ 429 (Flood control) фоновые запросы приостанавливаются на
+    retry_after секунд; ответ пользователю повторяется после паузы до
+    max_retries раз, если пауза не длиннее max_retry_after. Фоновый запрос
+    получает исключение как есть - повтор с учётом лимитов делает Broadcaster.
+    """
+
+    def __init__(self, concurrency: int = 64, max_retries: int = 3, max_retry_after: float = 30.0):
+        self.concurrency = concurrency
+        self.max_retries = max_retries
+        self.max_retry_after = max_retry_after
+
+        self.free = concurrency
+        self.waiters: Tuple[Deque[asyncio.Future], Deque[asyncio.Future]] = (deque(), deque())
+        self.background_until = 0.0
+        self.endpoints: Dict[str, EndpointStats] = {}
+        # Внешний учёт: ожидание места (приоритет, секунды) и повтор после 429 (метод)
+        self.on_wait: Optional[Callable[[str, float], None]] = None
+        self.on_retry: Optional[Callable[[str], None]] = None
+
+    # ---------- места ----------
+    async def _acquire(self, priority: int):
+        if priority == BACKGROUND:
+            while True:
+                pause = self.background_until - time.monotonic()
+                if pause <= 0:
+                    break
+                await asyncio.sleep(pause)
+
+        # Свободное место можно занять, только если его не ждут запросы того же или высшего приоритета
+        if self.free > 0 and not any(self.waiters[level] for level in range(priority + 1)):
+            self.free -= 1
+            return
+
+        waiter = asyncio.get_running_loop().create_future()
+        self.waiters[priority].append(waiter)
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                # Место уже передано - возвращаем его следующему
+                self._release()
+            else:
+                self.waiters[priority].remove(waiter)
+            raise
+
+    def _release(self):
+        for queue in self.waiters:
+            while queue:
+                waiter = queue.popleft()
+                if not waiter.done():
+                    waiter.set_result(None)
+                    return
+        self.free += 1
+
+    def pause_background(self, seconds: float):
+        self.background_until = max(self.background_until, time.monotonic() + seconds)
+
+    # ---------- запросы ----------
+    def _endpoint(self, name: str) -> EndpointStats:
+        stats = self.endpoints.get(name)
+        if stats is None:
+            stats = self.endpoints[name] = EndpointStats()
+        return stats
+
+    async def __call__(self, make_request, bot, method):
+        name = getattr(method, "__api_method__", type(method).__name__)
+        if name in UNGATED:
+            return await make_request(bot, method)
+
+        priority = _priority.get()
+        stats = self._endpoint(name)
+        for attempt in range(self.max_retries + 1):
+            queued = time.perf_counter()
+            await self._acquire(priority)
+            started = time.perf_counter()
+            stats.total_wait += started - queued
+            if self.on_wait is not None:
+                self.on_wait(PRIORITY_NAMES[priority], started - queued)
+            try:
+                return await make_request(bot, method)
+            except TelegramRetryAfter as e:
+                self.pause_background(e.retry_after)
+                if (priority == BACKGROUND or attempt == self.max_retries
+                        or e.retry_after > self.max_retry_after):
+                    stats.errors += 1
+                    raise
+                retry_after = e.retry_after
+            except Exception:
+                stats.errors += 1
+                raise
+            finally:
+                latency = time.perf_counter() - started
+                stats.calls += 1
+                stats.total_latency += latency
+                stats.max_latency = max(stats.max_latency, latency)
+                self._release()
+
+            stats.retries += 1
+            if self.on_retry is not None:
+                self.on_retry(name)
+            logger.warning(f"Лимит Telegram на {name}, повтор через {retry_after} с")
+            await asyncio.sleep(retry_after)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "in_flight": self.concurrency - self.free,
+            "waiting": {PRIORITY_NAMES[level]: len(queue) for level, queue in enumerate(self.waiters)},
+            "background_paused_s": max(0.0, self.background_until - time.monotonic()),
+            "endpoints": {name: stats.as_dict() for name, stats in self.endpoints.items()},
+        }
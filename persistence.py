@@ -0,0 +1,125 @@
+import asyncio
+import logging
+import time
+from typing import Callable, Dict, Optional, Set
+
+from storage import StorageBackend
+
+logger = logging.getLogger(__name__)
+
+
+class PersistenceScheduler:
+    """Отложенная запись изменений на диск.
+
+    Хранилище сообщает о каждом изменении через mark_dirty, а сброс на диск
+    происходит одной пачкой: через delay секунд после первого изменения или
+    сразу при накоплении max_pending изменений.
+    """
+
+    def __init__(self, backend: StorageBackend, delay: float = 0.2, max_pending: int = 500):
+        self.backend = backend
+        self.delay = delay
+        self.max_pending = max_pending
+
+        self.dirty: Set[int] = set()
+        self.pending = 0
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._task: Optional[asyncio.Task] = None
+        self._lock: Optional[asyncio.Lock] = None
+
+        # Метрики
+        self.flushes = 0
+        self.errors = 0
+        self.mutations_flushed = 0
+        self.last_latency = 0.0
+        self.max_latency = 0.0
+        self.total_latency = 0.0
+        self.last_batch = 0
+        self.max_batch = 0
+        # Внешний учёт каждого сброса: (длительность, число изменений, успех)
+        self.on_flush: Optional[Callable[[float, int, bool], None]] = None
+
+        backend.on_dirty = self.mark_dirty
+
+    def mark_dirty(self, user_id: int):
+        """Отметка изменения пользователя"""
+        self.dirty.add(user_id)
+        self.pending += 1
+        if self.pending >= self.max_pending:
+            self._flush_soon()
+        elif self._timer is None:
+            self._timer = asyncio.get_running_loop().call_later(self.delay, self._flush_soon)
+
+    def _flush_soon(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if self._task is None or self._task.done():
+            self._task = asyncio.ensure_future(self.flush())
+
+    async def flush(self):
+        """Сброс всех накопленных изменений одной операцией"""
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+
+        async with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            if not self.pending:
+                return
+
+            users, mutations = self.dirty, self.pending
+            self.dirty = set()
+            self.pending = 0
+
+            start = time.perf_counter()
+            try:
+                await self.backend.flush()
+            except Exception as e:
+                # Изменения остаются в буфере хранилища - повторим следующей пачкой
+                self.errors += 1
+                self.dirty |= users
+                self.pending += mutations
+                logger.error(f"Ошибка сохранения данных: {e}")
+                self._notify(time.perf_counter() - start, mutations, False)
+            else:
+                latency = time.perf_counter() - start
+                self._record(len(users), mutations, latency)
+                self._notify(latency, mutations, True)
+
+        # Изменения, пришедшие во время записи, уходят следующей пачкой
+        if self.pending and self._timer is None:
+            self._timer = asyncio.get_running_loop().call_later(self.delay, self._flush_soon)
+
+    def _record(self, users: int, mutations: int, latency: float):
+        self.flushes += 1
+        self.mutations_flushed += mutations
+        self.last_latency = latency
+        self.max_latency = max(self.max_latency, latency)
+        self.total_latency += latency
+        self.last_batch = mutations
+        self.max_batch = max(self.max_batch, mutations)
+        logger.debug(f"Сохранено изменений: {mutations} (пользователей: {users}) за {latency * 1000:.1f} мс")
+
+    def _notify(self, latency: float, mutations: int, ok: bool):
+        if self.on_flush is not None:
+            try:
+                self.on_flush(latency, mutations, ok)
+            except Exception as e:
+                logger.warning(f"Ошибка учёта сохранения: {e}")
+
+    def metrics(self) -> Dict[str, float]:
+        """Задержка сброса, размер пачек и число ожидающих записи пользователей"""
+        return {
+            "flushes": self.flushes,
+            "flush_errors": self.errors,
+            "flush_latency_last_ms": self.last_latency * 1000,
+            "flush_latency_avg_ms": self.total_latency / self.flushes * 1000 if self.flushes else 0.0,
+            "flush_latency_max_ms": self.max_latency * 1000,
+            "batch_size_last": self.last_batch,
+            "batch_size_avg": self.mutations_flushed / self.flushes if self.flushes else 0.0,
+            "batch_size_max": self.max_batch,
+            "pending_dirty_users": len(self.dirty),
+            "pending_mutations": self.pending,
+        }
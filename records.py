@@ -0,0 +1,213 @@
+import calendar
+import sys
+import time
+from typing import Any, Dict, FrozenSet, List, Optional, Tuple, Union
+
+# Формат отметок времени в JSON (added, created)
+STAMP_FORMAT = "%d.%m.%Y %H:%M"
+# Длинные тексты заметок пользователя в снапшоте: ключ -> текст (notestore.NoteStore),
+# заметка ссылается на текст полем ref вместо text
+NOTE_BODIES = "note_bodies"
+
+
+def parse_stamp(text: Any) -> Union[int, Any]:
+    """«ДД.ММ.ГГГГ ЧЧ:ММ» -> целое число секунд от эпохи.
+
+    Время в строке наивное (серверное), поэтому хранится как UTC без сдвига.
+    Строки другого вида остаются как есть, чтобы преобразование было обратимым.
+    """
+    if not isinstance(text, str) or len(text) != 16:
+        return text
+    try:
+        stamp = calendar.timegm((int(text[6:10]), int(text[3:5]), int(text[0:2]),
+                                 int(text[11:13]), int(text[14:16]), 0))
+    except ValueError:
+        return text
+    return stamp if format_stamp(stamp) == text else text
+
+
+def format_stamp(stamp: int) -> str:
+    return time.strftime(STAMP_FORMAT, time.gmtime(stamp))
+
+
+class StringArena:
+    """Общий буфер текстов заметок.
+
+    Текст хранится UTF-8 байтами в одном bytearray, запись держит только
+    число-ссылку (смещение << 32 | длина) вместо отдельного объекта str.
+    Заметки не удаляются, поэтому буфер только растёт.
+    """
+
+    def __init__(self):
+        self.buffer = bytearray()
+
+    def put(self, text: str) -> int:
+        data = text.encode("utf-8")
+        offset = len(self.buffer)
+        self.buffer += data
+        return offset << 32 | len(data)
+
+    def get(self, ref: int) -> str:
+        offset, size = ref >> 32, ref & 0xFFFFFFFF
+        return self.buffer[offset:offset + size].decode("utf-8")
+
+    def __len__(self) -> int:
+        return len(self.buffer)
+
+
+# ========== ЗАПИСИ ==========
+class Record:
+    """Элемент списка пользователя на __slots__ вместо dict.
+
+    FIELDS - известные ключи JSON; отсутствующий ключ хранится как None.
+    STAMPS - отметки времени (int), INTERNED - часто повторяющиеся строки,
+    ARENA - тексты в StringArena. Прочие ключи сохраняются в extra.
+    """
+
+    __slots__ = ("extra",)
+
+    FIELDS: Tuple[str, ...] = ()
+    STAMPS: FrozenSet[str] = frozenset()
+    INTERNED: FrozenSet[str] = frozenset()
+    ARENA: FrozenSet[str] = frozenset()
+    FIELD_SET: FrozenSet[str] = frozenset()
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls.FIELD_SET = frozenset(cls.FIELDS)
+
+    @classmethod
+    def from_dict(cls, item: Dict[str, Any], arena: StringArena) -> "Record":
+        record = cls.__new__(cls)
+        for field in cls.FIELDS:
+            value = item.get(field)
+            if value is not None:
+                if field in cls.STAMPS:
+                    value = parse_stamp(value)
+                elif field in cls.ARENA:
+                    value = arena.put(value)
+                elif field in cls.INTERNED and isinstance(value, str):
+                    value = sys.intern(value)
+            setattr(record, field, value)
+        record.extra = None
+        if not item.keys() <= cls.FIELD_SET:
+            record.extra = {key: value for key, value in item.items() if key not in cls.FIELD_SET}
+        return record
+
+    def to_dict(self, arena: StringArena, skip: FrozenSet[str] = frozenset()) -> Dict[str, Any]:
+        item = {}
+        for field in self.FIELDS:
+            value = getattr(self, field)
+            if value is None or field in skip:
+                continue
+            if field in self.STAMPS and type(value) is int:
+                value = format_stamp(value)
+            elif field in self.ARENA:
+                value = arena.get(value)
+            item[field] = value
+        if self.extra:
+            item.update(self.extra)
+        return item
+
+
+class ClassRecord(Record):
+    __slots__ = ("day", "time", "subject", "added", "weekday", "minutes")
+    FIELDS = __slots__
+    STAMPS = frozenset({"added"})
+    INTERNED = frozenset({"day", "time", "subject"})
+
+
+class DeadlineRecord(Record):
+    __slots__ = ("name", "due_date", "created", "completed", "due")
+    FIELDS = __slots__
+    STAMPS = frozenset({"created"})
+    INTERNED = frozenset({"due"})
+
+
+class NoteRecord(Record):
+    __slots__ = ("text", "created", "quick_save")
+    FIELDS = __slots__
+    STAMPS = frozenset({"created"})
+    ARENA = frozenset({"text"})
+
+
+# Ключ списка пользователя -> класс его элементов
+ITEM_RECORDS = {
+    "schedule": ClassRecord,
+    "deadlines": DeadlineRecord,
+    "notes": NoteRecord,
+}
+
+
+class UserRecord:
+    """Пользователь: профиль и списки записей"""
+
+    __slots__ = ("name", "tz", "digest_time", "schedule", "deadlines", "notes", "extra")
+
+    PROFILE = ("name", "tz", "digest_time")
+
+    def __init__(self, name: Optional[str] = None):
+        self.name = name
+        self.tz: Optional[str] = None
+        self.digest_time: Optional[str] = None
+        self.schedule: List[ClassRecord] = []
+        self.deadlines: List[DeadlineRecord] = []
+        self.notes: List[NoteRecord] = []
+        self.extra: Optional[Dict[str, Any]] = None
+
+    @classmethod
+    def from_dict(cls, user: Dict[str, Any], arena: StringArena) -> "UserRecord":
+        record = cls()
+        bodies = user.get(NOTE_BODIES)
+        for key, value in user.items():
+            if key == NOTE_BODIES:
+                continue
+            if key == "notes" and bodies:
+                record.notes = [cls._note(item, bodies, arena) for item in value]
+            else:
+                record.set(key, value, arena)
+        return record
+
+    @staticmethod
+    def _note(item: Dict[str, Any], bodies: Dict[str, Any], arena: StringArena) -> NoteRecord:
+        """Заметка снапшота: текст по ссылке ref - из note_bodies"""
+        if "ref" not in item:
+            return NoteRecord.from_dict(item, arena)
+        note = NoteRecord.from_dict({key: value for key, value in item.items() if key != "ref"}, arena)
+        note.text = arena.put_packed(item["ref"], bodies[item["ref"]])
+        return note
+
+    def set(self, key: str, value: Any, arena: StringArena):
+        if key in ITEM_RECORDS:
+            setattr(self, key, [ITEM_RECORDS[key].from_dict(item, arena) for item in value])
+        elif key in self.PROFILE:
+            setattr(self, key, sys.intern(value) if key == "tz" and isinstance(value, str) else value)
+        else:
+            if self.extra is None:
+                self.extra = {}
+            self.extra[key] = value
+
+    def items(self, key: str) -> List[Record]:
+        return getattr(self, key)
+
+    def profile(self) -> Dict[str, Any]:
+        return {key: getattr(self, key) for key in self.PROFILE if getattr(self, key) is not None}
+
+    def to_dict(self, arena: StringArena, packed: bool = False) -> Dict[str, Any]:
+        """Пользователь в формате user_data.json.
+
+        packed - формат снапшота: длинные тексты заметок один раз в
+        NOTE_BODIES (arena - notestore.NoteStore).
+        """
+        user: Dict[str, Any] = {
+            key: [record.to_dict(arena) for record in getattr(self, key)]
+            for key in ITEM_RECORDS if not (packed and key == "notes")
+        }
+        if packed:
+            user["notes"], bodies = arena.pack_notes(self.notes)
+            if bodies:
+                user[NOTE_BODIES] = bodies
+        user.update(self.profile())
+        if self.extra:
+            user.update(self.extra)
+        return user
@@ -0,0 +1,130 @@
+import asyncio
+import heapq
+import logging
+import time
+from typing import Awaitable, Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+# За сколько секунд до срока напоминать и подпись напоминания
+DEFAULT_OFFSETS: Sequence[Tuple[int, str]] = ((24 * 3600, "24 ч"), (3600, "1 ч"))
+
+# (пользователь, номер дедлайна в его списке, подпись напоминания)
+Reminder = Tuple[int, int, str]
+
+
+class ReminderEngine:
+    """Напоминания о дедлайнах всех пользователей на одной min-куче.
+
+    Куча хранит (время срабатывания, user_id, номер дедлайна, подпись,
+    версия). Добавление - O(log n); отмена напоминаний дедлайна - O(1):
+    увеличивается его версия, а записи прежних версий выбрасываются при
+    извлечении из кучи. Цикл run спит до ближайшего напоминания и отдаёт
+    наступившие напоминания пачкой.
+    """
+
+    def __init__(self, dispatch: Callable[[List[Reminder]], Awaitable[None]],
+                 offsets: Sequence[Tuple[int, str]] = DEFAULT_OFFSETS,
+                 batch_window: float = 1.0):
+        self.dispatch = dispatch
+        self.offsets = offsets
+        self.batch_window = batch_window
+
+        self.heap: List[Tuple[float, int, int, str, int]] = []
+        # Сколько записей каждого дедлайна осталось в куче и текущая версия
+        # его напоминаний (пока в куче есть его записи)
+        self.live: Dict[Tuple[int, int], int] = {}
+        self.versions: Dict[Tuple[int, int], int] = {}
+        self.sent = 0
+        self._wakeup: Optional[asyncio.Event] = None
+        self._tasks = set()
+
+    def _entries(self, user_id: int, index: int, due_ts: float, now: float, version: int = 0):
+        for offset, label in self.offsets:
+            fire_ts = due_ts - offset
+            if fire_ts > now:
+                yield (fire_ts, user_id, index, label, version)
+
+    def rebuild(self, deadlines: Iterable[Tuple[int, int, float]], now: Optional[float] = None):
+        """Построение кучи за один проход: (user_id, номер дедлайна, срок)"""
+        now = now if now is not None else time.time()
+        self.heap = []
+        self.live.clear()
+        self.versions.clear()
+        for user_id, index, due_ts in deadlines:
+            for entry in self._entries(user_id, index, due_ts, now):
+                self.heap.append(entry)
+                self.live[(user_id, index)] = self.live.get((user_id, index), 0) + 1
+        heapq.heapify(self.heap)
+        self._wake()
+
+    def add(self, user_id: int, index: int, due_ts: float):
+        """Напоминания для нового дедлайна"""
+        head = self.heap[0][0] if self.heap else None
+        version = self.versions.get((user_id, index), 0)
+        for entry in self._entries(user_id, index, due_ts, time.time(), version):
+            heapq.heappush(self.heap, entry)
+            self.live[(user_id, index)] = self.live.get((user_id, index), 0) + 1
+        if self.heap and (head is None or self.heap[0][0] < head):
+            self._wake()
+
+    def complete(self, user_id: int, index: int):
+        """Отмена напоминаний выполненного дедлайна"""
+        key = (user_id, index)
+        if key in self.live:
+            self.versions[key] = self.versions.get(key, 0) + 1
+
+    def reschedule(self, user_id: int, index: int, due_ts: Optional[float]):
+        """Замена напоминаний дедлайна (например, после смены часового пояса)"""
+        self.complete(user_id, index)
+        if due_ts is not None:
+            self.add(user_id, index, due_ts)
+
+    def __len__(self) -> int:
+        return len(self.heap)
+
+    def _wake(self):
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    def _pop_due(self, now: float) -> List[Reminder]:
+        batch = []
+        while self.heap and self.heap[0][0] <= now + self.batch_window:
+            _, user_id, index, label, version = heapq.heappop(self.heap)
+            key = (user_id, index)
+            current = version == self.versions.get(key, 0)
+            self.live[key] -= 1
+            if not self.live[key]:
+                del self.live[key]
+                self.versions.pop(key, None)
+            if current:
+                batch.append((user_id, index, label))
+        return batch
+
+    async def _send(self, batch: List[Reminder]):
+        try:
+            await self.dispatch(batch)
+            self.sent += len(batch)
+        except Exception as e:
+            logger.error(f"Ошибка отправки напоминаний: {e}")
+
+    async def run(self):
+        """Цикл: сон до ближайшего напоминания и отправка наступивших"""
+        self._wakeup = asyncio.Event()
+        while True:
+            now = time.time()
+            batch = self._pop_due(now)
+            if batch:
+                # Отправка пачки не задерживает следующие напоминания
+                task = asyncio.create_task(self._send(batch))
+                self._tasks.add(task)
+                task.add_done_callback(self._tasks.discard)
+                continue
+
+            # Сон ограничен минутой, чтобы не зависеть от перевода системных часов
+            timeout = min(self.heap[0][0] - now, 60.0) if self.heap else 60.0
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
@@ -0,0 +1,209 @@
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from aiogram import Bot
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.filters.callback_data import CallbackData
+from aiogram.methods import TelegramMethod
+from aiogram.types import InlineKeyboardButton, InlineKeyboardMarkup, KeyboardButton, ReplyKeyboardMarkup
+from aiohttp import FormData
+
+# Лимит длины текста сообщения Telegram
+MESSAGE_LIMIT = 4096
+
+# Клавиатуры, собранные при импорте: id -> клавиатура
+_prebuilt: Dict[int, ReplyKeyboardMarkup] = {}
+
+
+def keyboard(*rows: Iterable[str]) -> ReplyKeyboardMarkup:
+    """Клавиатура из строк кнопок; собирается один раз и не должна изменяться"""
+    markup = ReplyKeyboardMarkup(
+        keyboard=[[KeyboardButton(text=text) for text in row] for row in rows],
+        resize_keyboard=True
+    )
+    _prebuilt[id(markup)] = markup
+    return markup
+
+
+MAIN_KEYBOARD = keyboard(
+    ["📅 Расписание", "⏰ Дедлайны"],
+    ["📝 Заметки", "🔍 Поиск"],
+    ["📋 Сегодня", "ℹ️ Помощь"],
+)
+BACK_KEYBOARD = keyboard(["↩️ Назад"])
+SCHEDULE_KEYBOARD = keyboard(["➕ Добавить пару"], ["📋 Посмотреть расписание"], ["↩️ Назад"])
+DEADLINES_KEYBOARD = keyboard(["➕ Новый дедлайн"], ["📋 Мои дедлайны"], ["↩️ Назад"])
+NOTES_KEYBOARD = keyboard(["➕ Новая заметка"], ["📋 Все заметки"], ["↩️ Назад"])
+
+# Тексты всех кнопок: такие сообщения не сохраняются как быстрые заметки
+BUTTON_TEXTS = frozenset(
+    button.text
+    for markup in _prebuilt.values()
+    for row in markup.keyboard
+    for button in row
+)
+
+
+class CachedMarkupSession(AiohttpSession):
+    """Сессия, которая сериализует заранее собранные клавиатуры один раз.
+
+    Обычно aiogram при каждой отправке превращает reply_markup в словарь
+    и JSON; для клавиатур из keyboard() готовая строка берётся из кэша.
+    """
+
+    def __init__(self, **kwargs: Any):
+        super().__init__(**kwargs)
+        self._markup_json: Dict[int, str] = {}
+
+    def _cached_markup(self, bot: Bot, markup: Any) -> Optional[str]:
+        key = id(markup)
+        if markup is None or _prebuilt.get(key) is not markup:
+            return None
+        payload = self._markup_json.get(key)
+        if payload is None:
+            payload = self._markup_json[key] = self.prepare_value(
+                markup.model_dump(warnings=False), bot=bot, files={}
+            )
+        return payload
+
+    def build_form_data(self, bot: Bot, method: TelegramMethod) -> FormData:
+        payload = self._cached_markup(bot, getattr(method, "reply_markup", None))
+        if payload is None:
+            return super().build_form_data(bot, method)
+
+        form = FormData(quote_fields=False)
+        files: Dict[str, Any] = {}
+        for key, value in method.model_dump(warnings=False, exclude={"reply_markup"}).items():
+            value = self.prepare_value(value, bot=bot, files=files)
+            if value:
+                form.add_field(key, value)
+        form.add_field("reply_markup", payload)
+        for key, value in files.items():
+            form.add_field(key, value.read(bot), filename=value.filename or key)
+        return form
+
+
+# ---------- списки ----------
+# Элементов на странице списка и результатов поиска
+PAGE_SIZE = 10
+SEARCH_PAGE_SIZE = 5
+
+
+class PageCallback(CallbackData, prefix="pg"):
+    """Листание списка: view - какой список, cursor - позиция страницы"""
+    view: str
+    cursor: int
+
+
+def page_keyboard(view: str, prev_cursor: Optional[int],
+                  next_cursor: Optional[int]) -> Optional[InlineKeyboardMarkup]:
+    buttons = []
+    if prev_cursor is not None:
+        buttons.append(InlineKeyboardButton(
+            text="◀️ Назад", callback_data=PageCallback(view=view, cursor=prev_cursor).pack()
+        ))
+    if next_cursor is not None:
+        buttons.append(InlineKeyboardButton(
+            text="Дальше ▶️", callback_data=PageCallback(view=view, cursor=next_cursor).pack()
+        ))
+    return InlineKeyboardMarkup(inline_keyboard=[buttons]) if buttons else None
+
+
+def fit_blocks(blocks: Iterable[str], room: int) -> List[str]:
+    """Блоки по порядку, пока они помещаются в room символов (хотя бы один).
+
+    blocks может быть генератором: лишние блоки не строятся.
+    """
+    fitted: List[str] = []
+    size = 0
+    for block in blocks:
+        if size + len(block) + 2 > room:
+            if fitted:
+                break
+            block = block[:room - 5] + "..."
+        fitted.append(block)
+        size += len(block) + 2
+    return fitted
+
+
+def _message(header: str, fitted: List[str], footer: str) -> str:
+    return "\n\n".join([header, *fitted, footer] if footer else [header, *fitted])
+
+
+def _range(first: int, last: int, total: int) -> str:
+    return f" ({first}–{last} из {total})" if last - first + 1 < total else ""
+
+
+def _room(header: str, footer: str = "") -> int:
+    # Запас под диапазон в заголовке
+    return MESSAGE_LIMIT - len(header) - len(footer) - 40
+
+
+def schedule_page(items: List[dict], start: int, total: int) -> Tuple[str, int]:
+    """Страница расписания с пары номер start; (текст, число показанных пар)"""
+    def blocks():
+        for i, cls in enumerate(items, start + 1):
+            lines = [
+                f"{i}. {cls.get('day', 'День')} {cls.get('time', 'Время')}",
+                f"   📚 {cls.get('subject', 'Предмет')}",
+            ]
+            if cls.get("added"):
+                lines.append(f"   📅 Добавлено: {cls['added']}")
+            yield "\n".join(lines)
+
+    header = "📅 <b>Ваше расписание:</b>"
+    fitted = fit_blocks(blocks(), _room(header))
+    return _message(header + _range(start + 1, start + len(fitted), total), fitted, ""), len(fitted)
+
+
+def deadlines_page(items: List[dict], start: int, total: int) -> Tuple[str, int]:
+    """Страница дедлайнов; номера сквозные - по ним работает /done"""
+    def blocks():
+        for i, dl in enumerate(items, start + 1):
+            mark = "✅ " if dl.get("completed") else ""
+            lines = [f"{i}. {mark}{dl.get('name', 'Задание')}"]
+            if dl.get("due_date"):
+                lines.append(f"   📅 Срок: {dl['due_date']}")
+            if dl.get("created"):
+                lines.append(f"   📝 Добавлено: {dl['created']}")
+            yield "\n".join(lines)
+
+    header = "⏰ <b>Ваши дедлайны:</b>"
+    footer = "Отметить выполненным: /done номер"
+    fitted = fit_blocks(blocks(), _room(header, footer))
+    return _message(header + _range(start + 1, start + len(fitted), total), fitted, footer), len(fitted)
+
+
+def preview(text: str, length: int) -> str:
+    return text[:length] + "..." if len(text) > length else text
+
+
+def _note_blocks(notes: Iterable[dict], first: int, length: int) -> Iterator[str]:
+    for i, note in enumerate(notes, first):
+        lines = [f"{i}. {preview(note.get('text', ''), length)}"]
+        if note.get("created"):
+            lines.append(f"   📅 {note['created']}")
+        yield "\n".join(lines)
+
+
+def notes_page(newest_first: List[dict], first: int, total: int) -> Tuple[str, int]:
+    """Страница заметок от новых к старым; first - номер первой на странице"""
+    header = "📝 <b>Ваши заметки</b>"
+    fitted = fit_blocks(_note_blocks(newest_first, first, 50), _room(header))
+    shown = _range(first, first + len(fitted) - 1, total) or f" (всего: {total})"
+    return _message(header + shown, fitted, ""), len(fitted)
+
+
+def search_page(found: List[dict], offset: int, total: Optional[int]) -> Tuple[str, int]:
+    """Страница результатов поиска с результата номер offset.
+
+    total - число найденных заметок, если оно известно (при поиске
+    подстроки заметки перебираются только до конца страницы).
+    """
+    header = f"🔍 <b>Найдено заметок: {total}</b>" if total is not None else "🔍 <b>Результаты поиска</b>"
+    fitted = fit_blocks(_note_blocks(found, offset + 1, 80), _room(header))
+    last = offset + len(fitted)
+    if total is not None:
+        shown = _range(offset + 1, last, total)
+    else:
+        shown = f" ({offset + 1}–{last})" if offset or len(fitted) < len(found) else ""
+    return _message(header + shown, fitted, ""), len(fitted)
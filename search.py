@@ -0,0 +1,136 @@
+import re
+from bisect import bisect_left, insort
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+
+from cache import BoundedCache
+
+# Слова: буквы и цифры любого алфавита
+TOKEN_RE = re.compile(r"\w+")
+
+# Кириллические варианты, которые пользователи пишут по-разному
+CYRILLIC_FOLD = str.maketrans({"ё": "е", "й": "и"})
+
+
+def normalize(text: str) -> str:
+    """Приведение текста к единому виду: регистр, ё/е, й/и"""
+    return text.casefold().translate(CYRILLIC_FOLD)
+
+
+def tokenize(text: str) -> List[str]:
+    """Разбиение текста на нормализованные слова"""
+    return TOKEN_RE.findall(normalize(text))
+
+
+class NoteIndex:
+    """Инвертированный индекс заметок одного пользователя.
+
+    Документ - позиция заметки в списке заметок пользователя. Слова хранятся
+    в отсортированном списке, поэтому поиск по префиксу - это бинарный поиск,
+    а не перебор всех заметок.
+    """
+
+    def __init__(self):
+        self.postings: Dict[str, Dict[int, int]] = {}
+        self.tokens: List[str] = []
+        self.size = 0
+
+    def add(self, doc_id: int, text: str):
+        """Добавление заметки в индекс"""
+        for token in tokenize(text):
+            docs = self.postings.get(token)
+            if docs is None:
+                docs = self.postings[token] = {}
+                insort(self.tokens, token)
+            docs[doc_id] = docs.get(doc_id, 0) + 1
+        self.size = max(self.size, doc_id + 1)
+
+    def _expand(self, term: str) -> Iterable[str]:
+        """Слова индекса, начинающиеся с term"""
+        start = bisect_left(self.tokens, term)
+        for i in range(start, len(self.tokens)):
+            token = self.tokens[i]
+            if not token.startswith(term):
+                break
+            yield token
+
+    def search(self, query: str) -> List[int]:
+        """Заметки, содержащие все слова запроса (слово или его начало).
+
+        Полное совпадение слова весит больше совпадения по префиксу,
+        при равном весе выше более новые заметки.
+        """
+        terms = tokenize(query)
+        if not terms:
+            return []
+
+        # Сначала самые редкие слова: дальше считаем только уже найденные заметки
+        expanded = []
+        for term in set(terms):
+            tokens = list(self._expand(term))
+            if not tokens:
+                return []
+            expanded.append((sum(len(self.postings[t]) for t in tokens), term, tokens))
+        expanded.sort()
+
+        scores: Optional[Dict[int, float]] = None
+        for _, term, tokens in expanded:
+            term_scores: Dict[int, float] = {}
+            for token in tokens:
+                weight = 2.0 if token == term else 1.0
+                for doc_id, count in self.postings[token].items():
+                    if scores is not None and doc_id not in scores:
+                        continue
+                    term_scores[doc_id] = term_scores.get(doc_id, 0.0) + weight * count
+            if scores is not None:
+                for doc_id in term_scores:
+                    term_scores[doc_id] += scores[doc_id]
+            scores = term_scores
+            if not scores:
+                return []
+
+        return sorted(scores, key=lambda doc_id: (-scores[doc_id], -doc_id))
+
+
+class SearchIndex:
+    """Индексы заметок всех пользователей.
+
+    Индекс пользователя строится лениво при первом поиске и дальше
+    обновляется инкрементально при добавлении заметок. В памяти - не больше
+    capacity индексов: давно не искавших пользователей вытесняет LRU.
+    """
+
+    def __init__(self, capacity: int = 1000):
+        self.indexes = BoundedCache(capacity)
+
+    def build(self, user_id: int, notes: List[dict]) -> NoteIndex:
+        index = NoteIndex()
+        for doc_id, note in enumerate(notes):
+            index.add(doc_id, note.get("text", ""))
+        self.indexes.put(user_id, index)
+        return index
+
+    def get(self, user_id: int) -> Optional[NoteIndex]:
+        return self.indexes.get(user_id)
+
+    def add_note(self, user_id: int, doc_id: int, text: str):
+        """Добавление заметки, если индекс пользователя уже построен"""
+        index = self.indexes.peek(user_id)
+        if index is None:
+            return
+        if doc_id != index.size:
+            # Индекс отстал от списка заметок - перестроим при следующем поиске
+            self.indexes.pop(user_id)
+            return
+        index.add(doc_id, text)
+
+    def clear(self):
+        self.indexes = BoundedCache(self.indexes.capacity)
+
+    def stats(self) -> Dict[str, Any]:
+        return self.indexes.stats()
+
+
+def iter_substring_search(notes: List[dict], query: str) -> Iterator[int]:
+    """Прежний режим: поиск подстроки без учёта регистра, по мере надобности"""
+    needle = query.lower()
+    return (i for i, note in enumerate(notes) if needle in note.get("text", "").lower())
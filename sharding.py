@@ -0,0 +1,373 @@
+"""Несколько процессов-воркеров с закреплением пользователей за шардами.
+
+Процесс-распределитель получает обновления (polling или webhook) и
+пересылает каждое воркеру, которому принадлежит пользователь:
+jump_hash(from_user.id, число шардов). Воркер - обычный main.py, запущенный
+в каталоге своего шарда, поэтому все его файлы (user_data.json, базы SQLite,
+курсоры рассылок) относятся только к его пользователям, а состояние и порядок
+обработки обновлений пользователя принадлежат одному процессу.
+
+Раскладка на диске:
+    shards/manifest.json          {"count": N, "generation": G}
+    shards/g<G>/shard<i>/...      данные воркера i
+
+При запуске с другим числом воркеров пользователи перекладываются в новое
+поколение каталогов; manifest.json переписывается только после успешного
+переноса, а старое поколение удаляется последним. После первого запуска
+с шардами данные живут только в shards/: однопроцессный режим тоже
+работает в каталоге шарда (count = 1), а не с данными в текущем каталоге.
+"""
+import asyncio
+import json
+import logging
+import os
+import shutil
+import signal
+import sys
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from aiohttp import ClientSession, ClientTimeout, web
+
+from storage import StorageBackend
+
+logger = logging.getLogger(__name__)
+
+MANIFEST = "manifest.json"
+# Максимальная длина строки протокола (одно обновление в JSON)
+LINE_LIMIT = 16 * 1024 * 1024
+
+
+def jump_hash(key: int, buckets: int) -> int:
+    """Согласованное хэширование Jump (Lamping, Veach).
+
+    При переходе от N к N+1 шардам меняют владельца только ~1/(N+1) ключей.
+    """
+    key &= 0xFFFFFFFFFFFFFFFF
+    b, j = -1, 0
+    while j < buckets:
+        b = j
+        key = (key * 2862933555777941757 + 1) & 0xFFFFFFFFFFFFFFFF
+        j = int((b + 1) * ((1 << 31) / ((key >> 33) + 1)))
+    return b
+
+
+def update_user_id(update: Dict[str, Any]) -> Optional[int]:
+    """Пользователь, от которого пришло обновление (или чат, если пользователя нет)"""
+    for key, event in update.items():
+        if not isinstance(event, dict):
+            continue
+        user = event.get("from") or event.get("user")
+        if isinstance(user, dict) and "id" in user:
+            return user["id"]
+        chat = event.get("chat") or (event.get("message") or {}).get("chat")
+        if isinstance(chat, dict) and "id" in chat:
+            return chat["id"]
+    return None
+
+
+def shard_of(update: Dict[str, Any], shards: int) -> int:
+    user_id = update_user_id(update)
+    return jump_hash(user_id if user_id is not None else update.get("update_id", 0), shards)
+
+
+# ========== ВОРКЕР ==========
+class KeyedSerializer:
+    """Обновления одного пользователя обрабатываются по очереди, разных - параллельно"""
+
+    def __init__(self):
+        self.tails: Dict[int, asyncio.Future] = {}
+
+    def submit(self, key: int, job: Callable[[], Awaitable[Any]]):
+        previous = self.tails.get(key)
+        task = asyncio.ensure_future(self._run(previous, job))
+        self.tails[key] = task
+        task.add_done_callback(lambda done: self.tails.pop(key) if self.tails.get(key) is done else None)
+
+    @staticmethod
+    async def _run(previous: Optional[asyncio.Future], job: Callable[[], Awaitable[Any]]):
+        if previous is not None:
+            await asyncio.wait([previous])
+        try:
+            await job()
+        except Exception as e:
+            logger.error(f"Ошибка обработки обновления: {e}")
+
+
+async def serve_shard(dp, bot, port: int) -> asyncio.AbstractServer:
+    """Приём обновлений от распределителя: строки JSON по TCP на 127.0.0.1:port"""
+    serializer = KeyedSerializer()
+
+    async def handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                update = json.loads(line)
+                serializer.submit(update_user_id(update) or 0,
+                                  lambda update=update: dp.feed_raw_update(bot, update))
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    server = await asyncio.start_server(handle, "127.0.0.1", port, limit=LINE_LIMIT)
+    logger.info(f"🧩 Шард {os.getenv('SHARD_INDEX')}: приём обновлений на порту {port}")
+    return server
+
+
+# ========== РАСПРЕДЕЛИТЕЛЬ ==========
+class ShardLink:
+    """Очередь и соединение распределителя с одним воркером"""
+
+    def __init__(self, index: int, port: int, max_queue: int = 10000):
+        self.index = index
+        self.port = port
+        self.queue: "asyncio.Queue[bytes]" = asyncio.Queue(max_queue)
+        self.forwarded = 0
+        self.connected = False
+
+    async def run(self):
+        """Отправка очереди воркеру; переподключение, пока воркер (пере)запускается"""
+        item: Optional[bytes] = None
+        while True:
+            try:
+                _, writer = await asyncio.open_connection("127.0.0.1", self.port)
+            except OSError:
+                await asyncio.sleep(0.2)
+                continue
+            self.connected = True
+            try:
+                while True:
+                    if item is None:
+                        item = await self.queue.get()
+                    writer.write(item + b"\n")
+                    item = None
+                    self.forwarded += 1
+                    if self.queue.empty():
+                        await writer.drain()
+            except (ConnectionError, OSError) as e:
+                logger.warning(f"Соединение с шардом {self.index} потеряно: {e}")
+            finally:
+                self.connected = False
+                writer.close()
+
+
+class ShardFront:
+    """Распределитель: запуск воркеров, получение обновлений и маршрутизация"""
+
+    def __init__(self, token: str, script: str, dirs: List[str], base_port: int,
+                 api_url: str = "https://api.telegram.org", allowed_updates: Optional[List[str]] = None):
+        self.token = token
+        self.script = script
+        self.dirs = dirs
+        self.api_url = api_url.rstrip("/")
+        self.allowed_updates = allowed_updates
+        self.links = [ShardLink(i, base_port + i) for i in range(len(dirs))]
+        self.processes: List[Optional[asyncio.subprocess.Process]] = [None] * len(dirs)
+        self.restarts = [0] * len(dirs)
+        self.received = 0
+        self.started = time.time()
+        self.stopping = False
+        self._session: Optional[ClientSession] = None
+
+    @property
+    def shards(self) -> int:
+        return len(self.links)
+
+    # ---------- воркеры ----------
+    async def supervise(self, index: int):
+        """Запуск воркера и перезапуск после падения"""
+        env = dict(
+            os.environ,
+            SHARD_INDEX=str(index),
+            SHARD_PORT=str(self.links[index].port),
+            SHARD_WORKERS=str(self.shards),
+        )
+        while not self.stopping:
+            process = await asyncio.create_subprocess_exec(
+                sys.executable, self.script, cwd=self.dirs[index], env=env
+            )
+            self.processes[index] = process
+            code = await process.wait()
+            if self.stopping:
+                break
+            self.restarts[index] += 1
+            logger.error(f"Воркер {index} завершился с кодом {code}, перезапуск")
+            await asyncio.sleep(min(30, 2 ** min(self.restarts[index], 5)))
+
+    async def stop_workers(self):
+        self.stopping = True
+        for process in self.processes:
+            if process is not None and process.returncode is None:
+                process.terminate()
+        for process in self.processes:
+            if process is not None:
+                await process.wait()
+
+    # ---------- маршрутизация ----------
+    async def route(self, raw: bytes, update: Dict[str, Any]):
+        """Передача обновления воркеру-владельцу (ждёт, если его очередь полна)"""
+        self.received += 1
+        await self.links[shard_of(update, self.shards)].queue.put(raw)
+
+    async def _api(self, method: str, **params) -> Any:
+        if self._session is None:
+            self._session = ClientSession(timeout=ClientTimeout(total=None))
+        url = f"{self.api_url}/bot{self.token}/{method}"
+        async with self._session.post(url, json=params) as response:
+            payload = await response.json()
+        if not payload.get("ok"):
+            raise RuntimeError(f"{method}: {payload.get('description')}")
+        return payload["result"]
+
+    async def poll(self, timeout: int = 30):
+        """Long polling getUpdates с пересылкой без разбора в объекты aiogram"""
+        await self._api("deleteWebhook", drop_pending_updates=True)
+        offset = None
+        logger.info(f"🚀 Распределитель: polling, шардов {self.shards}")
+        while not self.stopping:
+            params: Dict[str, Any] = {"timeout": timeout}
+            if offset is not None:
+                params["offset"] = offset
+            if self.allowed_updates is not None:
+                params["allowed_updates"] = self.allowed_updates
+            try:
+                updates = await self._api("getUpdates", **params)
+            except Exception as e:
+                logger.warning(f"Ошибка getUpdates: {e}")
+                await asyncio.sleep(1)
+                continue
+            for update in updates:
+                offset = update["update_id"] + 1
+                await self.route(json.dumps(update, ensure_ascii=False).encode("utf-8"), update)
+
+    def webhook_handler(self, secret: str) -> Callable[[web.Request], Awaitable[web.Response]]:
+        async def handler(request: web.Request) -> web.Response:
+            if request.headers.get("X-Telegram-Bot-Api-Secret-Token") != secret:
+                return web.Response(status=401)
+            raw = await request.read()
+            await self.route(raw.replace(b"\n", b" "), json.loads(raw))
+            return web.Response()
+        return handler
+
+    async def set_webhook(self, url: str, secret: str):
+        await self._api("setWebhook", url=url, secret_token=secret,
+                        allowed_updates=self.allowed_updates, drop_pending_updates=True)
+        logger.info(f"🚀 Распределитель: webhook {url}, шардов {self.shards}")
+
+    async def health_handler(self, request: web.Request) -> web.Response:
+        lines = [f"✅ StudyBuddy Bot: распределитель, шардов {self.shards}",
+                 f"📨 Получено обновлений: {self.received}"]
+        for link, process, restarts in zip(self.links, self.processes, self.restarts):
+            alive = process is not None and process.returncode is None
+            lines.append(
+                f"{'🟢' if alive and link.connected else '🔴'} шард {link.index}: "
+                f"передано {link.forwarded}, в очереди {link.queue.qsize()}, перезапусков {restarts}"
+            )
+        return web.Response(text="\n".join(lines))
+
+    async def close(self):
+        await self.stop_workers()
+        if self._session is not None:
+            await self._session.close()
+
+
+# ========== ПЕРЕРАСПРЕДЕЛЕНИЕ ==========
+def read_manifest(root: str) -> Optional[Dict[str, int]]:
+    try:
+        with open(os.path.join(root, MANIFEST), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def write_manifest(root: str, manifest: Dict[str, int]):
+    path = os.path.join(root, MANIFEST)
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(manifest, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(path + ".tmp", path)
+
+
+def shard_dirs(root: str, generation: int, count: int) -> List[str]:
+    return [os.path.join(root, f"g{generation}", f"shard{i}") for i in range(count)]
+
+
+async def copy_users(sources: List[StorageBackend], targets: List[StorageBackend]) -> int:
+    """Перенос всех пользователей по владельцам через интерфейс хранилища"""
+    moved = 0
+    for source in sources:
+        await source.start()
+        for user_id in await source.user_ids():
+            profile = await source.get_user(user_id) or {}
+            target = targets[jump_hash(user_id, len(targets))]
+            await target.create_user(user_id, profile.get("name", ""))
+            fields = {key: value for key, value in profile.items() if key != "name"}
+            if fields:
+                await target.update_user(user_id, fields)
+            for item in await source.list_schedule(user_id):
+                await target.append_class(user_id, item)
+            for item in await source.list_deadlines(user_id):
+                await target.append_deadline(user_id, item)
+            for item in await source.list_notes(user_id):
+                await target.append_note(user_id, item)
+            moved += 1
+        await source.close()
+    return moved
+
+
+async def prepare_shards(root: str, count: int,
+                         open_backend: Callable[[str], StorageBackend]) -> List[str]:
+    """Каталоги шардов для count воркеров; перенос пользователей, если число изменилось.
+
+    Без manifest.json источником считаются данные однопроцессного режима
+    в текущем каталоге (они остаются на месте как резервная копия и больше
+    не читаются). count = 1 - обычное число шардов: все пользователи
+    собираются в одном каталоге шарда.
+    """
+    manifest = read_manifest(root)
+    if manifest is not None and manifest["count"] == count:
+        return shard_dirs(root, manifest["generation"], count)
+
+    if manifest is None:
+        generation, sources = 0, ["."]
+    else:
+        generation = manifest["generation"] + 1
+        sources = shard_dirs(root, manifest["generation"], manifest["count"])
+
+    targets = shard_dirs(root, generation, count)
+    # Остатки прерванного переноса в это же поколение
+    shutil.rmtree(os.path.join(root, f"g{generation}"), ignore_errors=True)
+    for path in targets:
+        os.makedirs(path)
+
+    backends = [open_backend(path) for path in targets]
+    for backend in backends:
+        await backend.start()
+    moved = await copy_users([open_backend(path) for path in sources], backends)
+    for backend in backends:
+        await backend.close()
+
+    write_manifest(root, {"count": count, "generation": generation})
+    if manifest is not None:
+        shutil.rmtree(os.path.join(root, f"g{manifest['generation']}"), ignore_errors=True)
+    logger.info(
+        f"🧩 Пользователи распределены по {count} шардам: {moved} "
+        f"(было шардов: {manifest['count'] if manifest else 1})"
+    )
+    return targets
+
+
+async def wait_for_stop():
+    """Ожидание SIGTERM/SIGINT (на Windows - Ctrl+C)"""
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        try:
+            loop.add_signal_handler(sig, stop.set)
+        except (NotImplementedError, RuntimeError):
+            pass
+    await stop.wait()
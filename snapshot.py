@@ -0,0 +1,89 @@
+import json
+import mmap
+import os
+import struct
+from typing import Any, Dict, Iterable, Optional, Tuple
+
+# Двоичный снапшот пользователей:
+#   заголовок  MAGIC, seq журнала, число пользователей, смещение оглавления
+#   данные     JSON каждого пользователя подряд
+#   оглавление (user_id, смещение, длина) на каждого пользователя
+MAGIC = b"SBSNAP1\0"
+HEADER = struct.Struct("<8sQQQ")
+ENTRY = struct.Struct("<qQI")
+
+Entry = Tuple[int, int]
+
+
+def write_snapshot(path: str, view: Dict[int, Dict[str, Any]], seq: int):
+    """Запись снапшота через временный файл с fsync"""
+    tmp_path = path + ".tmp"
+    index = []
+    with open(tmp_path, "wb") as f:
+        f.write(HEADER.pack(MAGIC, seq, 0, 0))
+        offset = HEADER.size
+        for user_id, user in view.items():
+            data = json.dumps(user, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+            f.write(data)
+            index.append(ENTRY.pack(user_id, offset, len(data)))
+            offset += len(data)
+        f.write(b"".join(index))
+        f.seek(0)
+        f.write(HEADER.pack(MAGIC, seq, len(index), offset))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def read_seq(path: str) -> int:
+    """Номер последней записи журнала в снапшоте (только заголовок)"""
+    with open(path, "rb") as f:
+        magic, seq, _, _ = HEADER.unpack(f.read(HEADER.size))
+    if magic != MAGIC:
+        raise ValueError(f"{path}: не снапшот StudyBuddy")
+    return seq
+
+
+class SnapshotReader:
+    """Снапшот, отображённый в память: при открытии читается только оглавление,
+    пользователь разбирается из JSON при первом обращении (read)"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file = open(path, "rb")
+        try:
+            self._map: Optional[mmap.mmap] = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+            magic, self.seq, count, index_offset = HEADER.unpack_from(self._map, 0)
+            if magic != MAGIC:
+                raise ValueError(f"{path}: не снапшот StudyBuddy")
+            view = memoryview(self._map)[index_offset:index_offset + count * ENTRY.size]
+            self.entries: Dict[int, Entry] = {
+                user_id: (offset, size) for user_id, offset, size in ENTRY.iter_unpack(view)
+            }
+            view.release()
+        except Exception:
+            self.close()
+            raise
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def __contains__(self, user_id: int) -> bool:
+        return user_id in self.entries
+
+    def ids(self) -> Iterable[int]:
+        return self.entries.keys()
+
+    def read_entry(self, entry: Entry) -> Dict[str, Any]:
+        offset, size = entry
+        return json.loads(self._map[offset:offset + size])
+
+    def read(self, user_id: int) -> Optional[Dict[str, Any]]:
+        entry = self.entries.get(user_id)
+        return self.read_entry(entry) if entry is not None else None
+
+    def close(self):
+        if getattr(self, "_map", None) is not None:
+            self._map.close()
+            self._map = None
+        self._file.close()
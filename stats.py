@@ -0,0 +1,252 @@
+import base64
+import hashlib
+import json
+import logging
+import math
+import os
+import time
+from datetime import date, datetime
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject
+
+logger = logging.getLogger(__name__)
+
+# События активности: обновления от пользователей и изменения данных
+EVENTS = ("updates", "users", "classes", "deadlines", "completed", "notes")
+# Накопительные итоги по данным (пересчитываются при запуске, дальше - по событиям)
+TOTALS = ("users", "classes", "deadlines", "completed", "notes")
+
+
+class HyperLogLog:
+    """Приблизительное число различных значений в 2**precision байтах.
+
+    Погрешность около 1.04 / sqrt(2**precision): 1.6% при precision=12.
+    """
+
+    def __init__(self, precision: int = 12, registers: Optional[bytes] = None):
+        self.precision = precision
+        self.size = 1 << precision
+        self.registers = bytearray(registers) if registers is not None else bytearray(self.size)
+
+    def add(self, value: int):
+        digest = hashlib.blake2b(value.to_bytes(8, "little", signed=True), digest_size=8).digest()
+        x = int.from_bytes(digest, "little")
+        index = x & (self.size - 1)
+        rest = x >> self.precision
+        rank = (64 - self.precision) - rest.bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def merge(self, other: "HyperLogLog"):
+        self.registers = bytearray(map(max, self.registers, other.registers))
+
+    def count(self) -> int:
+        m = self.size
+        estimate = 0.7213 / (1 + 1.079 / m) * m * m / sum(2.0 ** -r for r in self.registers)
+        zeros = self.registers.count(0)
+        if estimate <= 2.5 * m and zeros:
+            # Мало значений - точнее линейный подсчёт по пустым регистрам
+            estimate = m * math.log(m / zeros)
+        return round(estimate)
+
+
+class RingSeries:
+    """Счётчики событий за последние size периодов по period секунд.
+
+    Ячейка периода переиспользуется по кругу: память не растёт, старые
+    периоды обнуляются при первой записи в их ячейку.
+    """
+
+    def __init__(self, size: int, period: int):
+        self.size = size
+        self.period = period
+        self.stamps: List[int] = [-1] * size
+        self.slots: List[Dict[str, int]] = [{} for _ in range(size)]
+
+    def _slot(self, index: int) -> Dict[str, int]:
+        position = index % self.size
+        if self.stamps[position] != index:
+            self.stamps[position] = index
+            self.slots[position] = {}
+        return self.slots[position]
+
+    def add(self, index: int, event: str, amount: int = 1):
+        slot = self._slot(index)
+        slot[event] = slot.get(event, 0) + amount
+
+    def get(self, index: int, event: str) -> int:
+        position = index % self.size
+        return self.slots[position].get(event, 0) if self.stamps[position] == index else 0
+
+    def window(self, last: int, event: str, periods: int) -> List[int]:
+        """Значения event за periods периодов до last включительно, от старых к новым"""
+        return [self.get(index, event) for index in range(last - periods + 1, last + 1)]
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {"stamps": self.stamps, "slots": self.slots}
+
+    def restore(self, data: Dict[str, Any]):
+        if len(data.get("stamps", ())) == self.size:
+            self.stamps = list(data["stamps"])
+            self.slots = [dict(slot) for slot in data["slots"]]
+
+
+class UsageStats:
+    """Статистика использования, обновляемая на каждом событии.
+
+    Итоги (пользователи, пары, дедлайны, заметки) и открытые дедлайны по
+    дням срока - словари; активность - кольцевые буферы по минутам (сутки)
+    и по дням (days); активные пользователи за день и неделю - HyperLogLog
+    на день. snapshot() не зависит от числа пользователей.
+
+    Ряды и HyperLogLog сохраняются в path (save/load); итоги при запуске
+    пересчитываются из хранилища (seed).
+    """
+
+    def __init__(self, path: str = "stats.json", tz=None, days: int = 30, week: int = 7):
+        self.path = path
+        self.tz = tz
+        self.week = week
+        self.totals: Dict[str, int] = dict.fromkeys(TOTALS, 0)
+        self.minutes = RingSeries(24 * 60, 60)
+        self.days = RingSeries(days, 86400)
+        # Открытые дедлайны: день срока (ordinal) -> количество
+        self.due: Dict[int, int] = {}
+        # HyperLogLog активных пользователей за последние week дней
+        self.active: Dict[int, HyperLogLog] = {}
+        self.started = time.time()
+
+    # ---------- время ----------
+    def _today(self) -> int:
+        return datetime.now(self.tz).date().toordinal()
+
+    # ---------- события ----------
+    def record(self, event: str, amount: int = 1, user_id: Optional[int] = None):
+        """Событие активности; user_id - учесть пользователя как активного сегодня"""
+        today = self._today()
+        self.minutes.add(int(time.time() // 60), event, amount)
+        self.days.add(today, event, amount)
+        if event in self.totals:
+            self.totals[event] += amount
+        if user_id is not None:
+            hll = self.active.get(today)
+            if hll is None:
+                hll = self.active[today] = HyperLogLog()
+                for day in [day for day in self.active if day <= today - self.week]:
+                    del self.active[day]
+            hll.add(user_id)
+
+    def deadline_due(self, due: Optional[str], amount: int = 1):
+        """Открытый дедлайн со сроком due (YYYY-MM-DD) добавлен (+1) или закрыт (-1)"""
+        if not due:
+            return
+        try:
+            day = date.fromisoformat(due).toordinal()
+        except ValueError:
+            return
+        count = self.due.get(day, 0) + amount
+        if count > 0:
+            self.due[day] = count
+        else:
+            self.due.pop(day, None)
+
+    def seed(self, counts: Dict[str, int], open_dues: List[Optional[str]]):
+        """Итоги из хранилища при запуске: counts - users, classes, deadlines, completed, notes"""
+        self.totals = {key: int(counts.get(key, 0)) for key in TOTALS}
+        self.due = {}
+        for due in open_dues:
+            self.deadline_due(due)
+
+    # ---------- чтение ----------
+    def _due_between(self, first: int, last: int) -> int:
+        # Дней в окне немного, словарь сроков может быть большим - считаем по дням
+        return sum(self.due.get(day, 0) for day in range(first, last + 1))
+
+    def active_users(self, days: int = 1) -> int:
+        today = self._today()
+        merged = HyperLogLog()
+        for day in range(today - days + 1, today + 1):
+            hll = self.active.get(day)
+            if hll is not None:
+                merged.merge(hll)
+        return merged.count()
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Вся статистика для /stats; фиксированный объём работы"""
+        today = self._today()
+        minute = int(time.time() // 60)
+        first_day = date.fromordinal(today - self.days.size + 1)
+        users = self.totals["users"]
+        return {
+            "totals": dict(self.totals),
+            "notes_per_user": round(self.totals["notes"] / users, 2) if users else 0.0,
+            "open_deadlines": self.totals["deadlines"] - self.totals["completed"],
+            "due_today": self._due_between(today, today),
+            "due_this_week": self._due_between(today, today + 6),
+            "overdue_last_week": self._due_between(today - 7, today - 1),
+            "active_today": self.active_users(1),
+            "active_week": self.active_users(self.week),
+            "last_hour": {event: sum(self.minutes.window(minute, event, 60)) for event in EVENTS},
+            "today": {event: self.days.get(today, event) for event in EVENTS},
+            "per_minute": {
+                "to": datetime.fromtimestamp(minute * 60, self.tz).isoformat(timespec="minutes"),
+                "updates": self.minutes.window(minute, "updates", 60),
+            },
+            "per_day": {
+                "from": first_day.isoformat(),
+                **{event: self.days.window(today, event, self.days.size) for event in EVENTS},
+            },
+            "uptime_s": round(time.time() - self.started),
+        }
+
+    # ---------- сохранение ----------
+    def _dump(self) -> Dict[str, Any]:
+        return {
+            "minutes": self.minutes.as_dict(),
+            "days": self.days.as_dict(),
+            "active": {
+                str(day): base64.b64encode(bytes(hll.registers)).decode("ascii")
+                for day, hll in self.active.items()
+            },
+        }
+
+    def save(self):
+        """Запись рядов и HyperLogLog через временный файл"""
+        tmp_path = self.path + ".tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(self._dump(), f, separators=(",", ":"))
+            os.replace(tmp_path, self.path)
+        except Exception as e:
+            logger.error(f"Ошибка сохранения статистики: {e}")
+
+    def load(self):
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return
+        except Exception as e:
+            logger.warning(f"Не удалось прочитать статистику: {e}")
+            return
+        self.minutes.restore(data.get("minutes", {}))
+        self.days.restore(data.get("days", {}))
+        self.active = {
+            int(day): HyperLogLog(registers=base64.b64decode(registers))
+            for day, registers in data.get("active", {}).items()
+        }
+
+
+class UsageMiddleware(BaseMiddleware):
+    """Outer middleware обновлений: счётчик обновлений и активные пользователи"""
+
+    def __init__(self, stats: UsageStats):
+        self.stats = stats
+
+    async def __call__(self, handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+                       event: TelegramObject, data: Dict[str, Any]) -> Any:
+        user = data.get("event_from_user")
+        self.stats.record("updates", user_id=user.id if user is not None else None)
+        return await handler(event, data)
@@ -0,0 +1,1290 @@
+import asyncio
+import json
+import logging
+import os
+import queue
+import sqlite3
+import threading
+from itertools import islice
+from abc import ABC, abstractmethod
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
+
+from cache import BoundedCache
+from notestore import HEAD_CHARS, NoteStore, unpack_user
+from records import ITEM_RECORDS, UserRecord
+from snapshot import SnapshotReader, read_seq, write_snapshot
+from timetable import due_iso
+
+logger = logging.getLogger(__name__)
+
+# Служебный ключ снапшота: номер последней записи журнала, вошедшей в снапшот
+SEQ_KEY = "_seq"
+
+# Итоги по спискам пользователей (item_counts)
+ITEM_COUNTS = ("schedule", "deadlines", "completed", "notes")
+
+# Поля профиля пользователя: имя, часовой пояс, время утренней рассылки
+PROFILE_FIELDS = ("name", "tz", "digest_time")
+
+
+def apply_record(data: Dict[int, Dict[str, Any]], record: Dict[str, Any]):
+    """Применение одной записи журнала к данным пользователей"""
+    op = record["op"]
+    user_id = record["u"]
+
+    if op == "put":
+        data[user_id] = record["v"]
+    elif op == "append":
+        data.setdefault(user_id, {}).setdefault(record["k"], []).append(record["v"])
+    elif op == "extend":
+        data.setdefault(user_id, {}).setdefault(record["k"], []).extend(record["v"])
+    elif op == "set":
+        data.setdefault(user_id, {})[record["k"]] = record["v"]
+    elif op == "update":
+        data[user_id][record["k"]][record["i"]].update(record["v"])
+    else:
+        raise ValueError(f"Неизвестная операция журнала: {op}")
+
+
+class WriteAheadLog:
+    """Снапшот + append-only журнал изменений.
+
+    Каждое изменение - одна компактная JSON-строка в журнале, поэтому стоимость
+    записи зависит от размера изменения, а не от размера базы. Записи копятся
+    в буфере и сбрасываются на диск пачкой (flush), а снапшот периодически
+    пересобирается в фоновом потоке.
+
+    binary=True - снапшот пишется в двоичном формате (snapshot.py, файл .bin
+    рядом с path), который можно читать по одному пользователю (load_lazy).
+    Читается снапшот любого формата - тот, что записан последним.
+
+    Изменение пользователя записывается в журнал (append) до того, как оно
+    применено к данным: пока идёт сжатие, append сохраняет для снапшота
+    прежнее состояние пользователя (копирование при записи).
+    """
+
+    def __init__(self, path: str, compact_every: int = 5000, binary: bool = False):
+        self.snapshot_path = path
+        self.binary_path = os.path.splitext(path)[0] + ".bin"
+        self.log_path = path + ".wal"
+        self.rotated_path = path + ".wal.1"
+        self.compact_every = compact_every
+        self.binary = binary
+
+        self.seq = 0
+        self.records_since_compact = 0
+        self._pending: List[str] = []
+        self._file = None
+        # asyncio-примитивы создаются лениво внутри работающего цикла событий
+        self._io_lock: Optional[asyncio.Lock] = None
+        self._compacting = False
+        self._compaction: Optional[asyncio.Future] = None
+        # Сжатие: данные, функция экспорта, ещё не выгруженные пользователи и снимок
+        self._source: Optional[Dict[int, Any]] = None
+        self._export: Callable[[Any], Dict[str, Any]] = _copy_user
+        self._unexported: Set[int] = set()
+        self._view: Dict[int, Dict[str, Any]] = {}
+
+    def _lock(self) -> asyncio.Lock:
+        if self._io_lock is None:
+            self._io_lock = asyncio.Lock()
+        return self._io_lock
+
+    # ---------- чтение ----------
+    def load(self) -> Dict[int, Dict[str, Any]]:
+        """Чтение снапшота и проигрывание журнала поверх него; тексты заметок - на месте"""
+        data, reader = self.load_lazy()
+        if reader is not None:
+            try:
+                for user_id in reader.ids():
+                    if user_id not in data:
+                        data[user_id] = reader.read(user_id)
+            finally:
+                reader.close()
+        for user in data.values():
+            unpack_user(user)
+        return data
+
+    def load_lazy(self) -> Tuple[Dict[int, Dict[str, Any]], Optional[SnapshotReader]]:
+        """Чтение с отложенной загрузкой пользователей двоичного снапшота.
+
+        Возвращает пользователей, изменённых после снапшота (или всех, если
+        снапшот JSON), и открытый двоичный снапшот с остальными (или None).
+        """
+        data: Dict[int, Dict[str, Any]] = {}
+        reader: Optional[SnapshotReader] = None
+        snapshot_seq = 0
+
+        json_snapshot = os.path.exists(self.snapshot_path)
+        if os.path.exists(self.binary_path):
+            # Оба снапшота остаются только при сбое между записью одного и удалением другого
+            if not json_snapshot or read_seq(self.binary_path) >= self._json_seq():
+                reader = SnapshotReader(self.binary_path)
+                snapshot_seq = reader.seq
+                json_snapshot = False
+
+        if json_snapshot:
+            with open(self.snapshot_path, "r", encoding="utf-8") as f:
+                content = f.read().strip()
+            if content:
+                raw = json.loads(content)
+                snapshot_seq = int(raw.pop(SEQ_KEY, 0))
+                data = {int(k): v for k, v in raw.items()}
+
+        self.seq = snapshot_seq
+        replayed = 0
+        for path in (self.rotated_path, self.log_path):
+            replayed += self._replay(path, data, snapshot_seq, reader)
+
+        self.records_since_compact = replayed
+        if replayed:
+            logger.info(f"Из журнала восстановлено изменений: {replayed}")
+        return data, reader
+
+    def _json_seq(self) -> int:
+        with open(self.snapshot_path, "r", encoding="utf-8") as f:
+            content = f.read().strip()
+        return int(json.loads(content).get(SEQ_KEY, 0)) if content else 0
+
+    def _replay(self, path: str, data: Dict[int, Dict[str, Any]], after_seq: int,
+                reader: Optional[SnapshotReader] = None) -> int:
+        if not os.path.exists(path):
+            return 0
+
+        replayed = 0
+        with open(path, "r", encoding="utf-8") as f:
+            for line_no, line in enumerate(f, 1):
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # Оборванная последняя строка после аварийного завершения
+                    logger.warning(f"Пропущена повреждённая запись журнала {path}:{line_no}")
+                    continue
+                if record["s"] <= after_seq:
+                    continue
+                if reader is not None and record["u"] not in data and record["u"] in reader:
+                    data[record["u"]] = reader.read(record["u"])
+                apply_record(data, record)
+                self.seq = max(self.seq, record["s"])
+                replayed += 1
+        return replayed
+
+    # ---------- запись ----------
+    def append(self, op: str, user_id: int, key: Optional[str] = None,
+               value: Any = None, index: Optional[int] = None):
+        """Добавление записи в буфер журнала (без обращения к диску)"""
+        if user_id in self._unexported:
+            # Пользователь меняется во время сжатия - в снапшот идёт прежнее состояние
+            self._unexported.discard(user_id)
+            self._view[user_id] = self._export(self._source[user_id])
+        self.seq += 1
+        record: Dict[str, Any] = {"s": self.seq, "op": op, "u": user_id}
+        if key is not None:
+            record["k"] = key
+        if index is not None:
+            record["i"] = index
+        if value is not None:
+            record["v"] = value
+
+        self._pending.append(json.dumps(record, ensure_ascii=False, separators=(",", ":")))
+        self.records_since_compact += 1
+
+    @property
+    def pending(self) -> int:
+        return len(self._pending)
+
+    @property
+    def needs_compaction(self) -> bool:
+        return self.records_since_compact >= self.compact_every and not self._compacting
+
+    def _write(self, lines: List[str]):
+        if self._file is None:
+            self._file = open(self.log_path, "a", encoding="utf-8")
+        self._file.write("\n".join(lines) + "\n")
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    async def flush(self):
+        """Запись накопленных изменений пачкой с одним fsync"""
+        async with self._lock():
+            if not self._pending:
+                return
+            lines, self._pending = self._pending, []
+            try:
+                await asyncio.to_thread(self._write, lines)
+            except Exception:
+                self._pending[:0] = lines
+                raise
+
+    def _rotate(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        if not os.path.exists(self.log_path):
+            return
+        if os.path.exists(self.rotated_path):
+            # Предыдущее сжатие не завершилось - дописываем журнал к старому сегменту
+            with open(self.log_path, "r", encoding="utf-8") as src, \
+                    open(self.rotated_path, "a", encoding="utf-8") as dst:
+                dst.write(src.read())
+            os.remove(self.log_path)
+        else:
+            os.replace(self.log_path, self.rotated_path)
+
+    def _write_snapshot(self, view: Dict[int, Dict[str, Any]], seq: int):
+        if self.binary:
+            write_snapshot(self.binary_path, view, seq)
+            stale = self.snapshot_path
+        else:
+            tmp_path = self.snapshot_path + ".tmp"
+            payload = {SEQ_KEY: seq}
+            payload.update(view)
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(payload, f, ensure_ascii=False, separators=(",", ":"))
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.snapshot_path)
+            stale = self.binary_path
+        # Снапшот другого формата устарел
+        if os.path.exists(stale):
+            os.remove(stale)
+        if os.path.exists(self.rotated_path):
+            os.remove(self.rotated_path)
+
+    async def compact(self, data: Dict[int, Any],
+                      export: Optional[Callable[[Any], Dict[str, Any]]] = None, batch: int = 200):
+        """Сжатие журнала в новый снапшот без остановки обработки обновлений.
+
+        export переводит пользователя в формат снапшота; по умолчанию
+        данные уже в нём и копируются только списки. Пользователи выгружаются
+        пачками по batch между обработкой обновлений; снапшот соответствует
+        моменту начала сжатия (seq): изменённого за это время пользователя
+        append выгружает до изменения. Запись файла - в фоновом потоке.
+        """
+        if self._compacting:
+            return
+        self._compacting = True
+        try:
+            async with self._lock():
+                lines, self._pending = self._pending, []
+                if lines:
+                    await asyncio.to_thread(self._write, lines)
+                await asyncio.to_thread(self._rotate)
+                # Без await: список пользователей снапшота согласован с self.seq
+                seq = self.seq
+                self._source, self._export, self._view = data, export or _copy_user, {}
+                self._unexported = set(data)
+                self.records_since_compact = 0
+
+            pending = list(self._unexported)
+            for start in range(0, len(pending), batch):
+                for user_id in pending[start:start + batch]:
+                    if user_id in self._unexported:
+                        self._unexported.discard(user_id)
+                        self._view[user_id] = self._export(data[user_id])
+                await asyncio.sleep(0)
+            view = self._view
+
+            await asyncio.to_thread(self._write_snapshot, view, seq)
+            logger.info(f"Журнал сжат в снапшот (пользователей: {len(view)}, seq={seq})")
+        except Exception as e:
+            logger.error(f"Ошибка сжатия журнала: {e}")
+        finally:
+            self._source, self._export, self._unexported, self._view = None, _copy_user, set(), {}
+            self._compacting = False
+
+    def compact_soon(self, data: Dict[int, Any],
+                     export: Optional[Callable[[Any], Dict[str, Any]]] = None):
+        """Сжатие в фоновой задаче; close дождётся её завершения"""
+        self._compaction = asyncio.ensure_future(self.compact(data, export))
+
+    async def close(self):
+        if self._compaction is not None:
+            await self._compaction
+            self._compaction = None
+        await self.flush()
+        async with self._lock():
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+
+def _copy_user(user: Dict[str, Any]) -> Dict[str, Any]:
+    return {k: list(v) if isinstance(v, list) else v for k, v in user.items()}
+
+
+# ========== ИНТЕРФЕЙС ХРАНИЛИЩА ==========
+# Метод добавления одного элемента для каждого списка пользователя
+APPEND_METHODS = {"schedule": "append_class", "deadlines": "append_deadline", "notes": "append_note"}
+
+
+class StorageBackend(ABC):
+    """Асинхронный интерфейс хранилища данных пользователей.
+
+    Обработчики обращаются к данным только через эти методы, поэтому
+    реализацию можно заменить без изменения логики бота. Изменения
+    буферизуются до вызова flush; о каждом изменении хранилище сообщает
+    через on_dirty (см. PersistenceScheduler).
+    """
+
+    on_dirty: Optional[Callable[[int], None]] = None
+
+    def _mark_dirty(self, user_id: int):
+        if self.on_dirty is not None:
+            self.on_dirty(user_id)
+
+    async def start(self):
+        """Открытие хранилища и загрузка данных"""
+
+    async def materialize(self):
+        """Загрузка данных, отложенных при start (см. MemoryBackend)"""
+
+    async def flush(self):
+        """Принудительная запись накопленных изменений на диск"""
+
+    async def close(self):
+        """Запись изменений и освобождение ресурсов"""
+        await self.flush()
+
+    def stats(self) -> Dict[str, Any]:
+        """Счётчики хранилища для /health и /metrics"""
+        return {}
+
+    @abstractmethod
+    async def get_user(self, user_id: int) -> Optional[Dict[str, Any]]:
+        """Профиль пользователя (как минимум name) или None"""
+
+    @abstractmethod
+    async def create_user(self, user_id: int, name: str) -> bool:
+        """Создание пользователя; False, если он уже существует"""
+
+    @abstractmethod
+    async def update_user(self, user_id: int, fields: Dict[str, Any]):
+        """Изменение полей профиля (PROFILE_FIELDS)"""
+
+    @abstractmethod
+    async def user_profiles(self) -> Dict[int, Dict[str, Any]]:
+        """Профили всех пользователей без их списков"""
+
+    @abstractmethod
+    async def append_class(self, user_id: int, item: Dict[str, Any]) -> int:
+        """Добавление пары; возвращает размер расписания"""
+
+    @abstractmethod
+    async def append_deadline(self, user_id: int, item: Dict[str, Any]) -> int:
+        """Добавление дедлайна; возвращает число дедлайнов"""
+
+    @abstractmethod
+    async def append_note(self, user_id: int, item: Dict[str, Any]) -> int:
+        """Добавление заметки; возвращает число заметок"""
+
+    async def extend(self, user_id: int, key: str, items: List[Dict[str, Any]]) -> int:
+        """Добавление нескольких элементов в список key (schedule, deadlines, notes)
+        одним изменением; возвращает длину списка"""
+        append = getattr(self, APPEND_METHODS[key])
+        total = 0
+        for item in items:
+            total = await append(user_id, item)
+        return total
+
+    @abstractmethod
+    async def complete_deadline(self, user_id: int, index: int) -> bool:
+        """Отметка дедлайна (по номеру в списке) выполненным"""
+
+    @abstractmethod
+    async def all_deadlines(self) -> List[Tuple[int, int, Dict[str, Any]]]:
+        """Дедлайны всех пользователей: (user_id, номер в списке, дедлайн)"""
+
+    @abstractmethod
+    async def list_schedule(self, user_id: int) -> List[Dict[str, Any]]:
+        """Расписание пользователя в порядке добавления"""
+
+    @abstractmethod
+    async def list_deadlines(self, user_id: int) -> List[Dict[str, Any]]:
+        """Дедлайны пользователя в порядке добавления"""
+
+    @abstractmethod
+    async def list_notes(self, user_id: int) -> List[Dict[str, Any]]:
+        """Заметки пользователя в порядке добавления"""
+
+    async def list_page(self, user_id: int, key: str, start: int, stop: int) -> Tuple[List[Dict[str, Any]], int]:
+        """Элементы списка key (schedule, deadlines, notes) с номерами [start, stop) и длина списка"""
+        items = await getattr(self, f"list_{key}")(user_id)
+        return items[start:stop], len(items)
+
+    async def note_previews(self, user_id: int, start: int, stop: int) -> Tuple[List[Dict[str, Any]], int]:
+        """Заметки [start, stop) с началом текста (HEAD_CHARS символов) для превью и число заметок"""
+        items, total = await self.list_page(user_id, "notes", start, stop)
+        return [dict(item, text=item.get("text", "")[:HEAD_CHARS]) for item in items], total
+
+    async def item_counts(self) -> Dict[str, int]:
+        """Сколько всего пар, дедлайнов (и выполненных) и заметок у всех пользователей"""
+        counts = dict.fromkeys(ITEM_COUNTS, 0)
+        for user_id in await self.user_ids():
+            for key in ("schedule", "notes"):
+                counts[key] += (await self.list_page(user_id, key, 0, 0))[1]
+            deadlines = await self.list_deadlines(user_id)
+            counts["deadlines"] += len(deadlines)
+            counts["completed"] += sum(1 for deadline in deadlines if deadline.get("completed"))
+        return counts
+
+    @abstractmethod
+    async def count_users(self) -> int:
+        """Количество пользователей"""
+
+    @abstractmethod
+    async def user_ids(self) -> List[int]:
+        """Идентификаторы всех пользователей"""
+
+
+# ========== ХРАНЕНИЕ В ПАМЯТИ ==========
+class MemoryBackend(StorageBackend):
+    """Все данные в памяти процесса, изменения - в журнал WriteAheadLog.
+
+    Пользователи хранятся компактными записями (records.UserRecord), наружу
+    и в журнал отдаются в прежнем формате словарей user_data.json. Тексты
+    заметок - в NoteStore: длинные хранятся один раз и сжимаются, в снапшоте
+    они тоже записаны один раз на пользователя (note_bodies).
+
+    С двоичным снапшотом start читает только его оглавление: пользователь
+    загружается при первом обращении, остальные - в materialize().
+    Обход всех пользователей (user_profiles, all_deadlines) сначала
+    загружает всех; журнал не сжимается, пока загружены не все.
+    """
+
+    def __init__(self, wal: WriteAheadLog):
+        self.wal = wal
+        self.arena = NoteStore()
+        self.users: Dict[int, UserRecord] = {}
+        # Пользователи снапшота, ещё не загруженные в память
+        self.snapshot: Optional[SnapshotReader] = None
+        self.cold: Dict[int, Tuple[int, int]] = {}
+
+    async def start(self):
+        try:
+            self.users, self.snapshot = await asyncio.to_thread(self._load)
+        except Exception as e:
+            logger.error(f"Ошибка загрузки данных: {e}")
+            self.users, self.snapshot = {}, None
+        if self.snapshot is not None:
+            self.cold = {
+                user_id: entry for user_id, entry in self.snapshot.entries.items()
+                if user_id not in self.users
+            }
+            if not self.cold:
+                self._close_snapshot()
+        elif self.wal.binary and self.users:
+            # Первый запуск после включения двоичного снапшота
+            self.wal.compact_soon(self.users, self._export)
+
+    def _load(self) -> Tuple[Dict[int, UserRecord], Optional[SnapshotReader]]:
+        data, reader = self.wal.load_lazy()
+        users = {user_id: UserRecord.from_dict(user, self.arena) for user_id, user in data.items()}
+        return users, reader
+
+    def _user(self, user_id: int) -> Optional[UserRecord]:
+        user = self.users.get(user_id)
+        if user is None and user_id in self.cold:
+            user = self.users[user_id] = UserRecord.from_dict(
+                self.snapshot.read_entry(self.cold.pop(user_id)), self.arena
+            )
+            if not self.cold:
+                self._close_snapshot()
+        return user
+
+    def _close_snapshot(self):
+        if self.snapshot is not None:
+            self.snapshot.close()
+            self.snapshot = None
+
+    async def materialize(self, batch: int = 100):
+        """Загрузка всех отложенных пользователей пачками, не задерживая обработку обновлений"""
+        while self.cold:
+            for user_id in list(islice(self.cold, batch)):
+                self._user(user_id)
+            await asyncio.sleep(0)
+
+    def _export(self, user: UserRecord) -> Dict[str, Any]:
+        return user.to_dict(self.arena, packed=True)
+
+    async def flush(self):
+        await self.wal.flush()
+        if self.wal.needs_compaction and not self.cold:
+            self.wal.compact_soon(self.users, self._export)
+
+    async def close(self):
+        await self.wal.close()
+        self._close_snapshot()
+
+    def stats(self) -> Dict[str, Any]:
+        return {"arena_bytes": len(self.arena), "cold_users": len(self.cold), **self.arena.stats()}
+
+    async def get_user(self, user_id: int) -> Optional[Dict[str, Any]]:
+        user = self._user(user_id)
+        return user.profile() if user is not None else None
+
+    async def create_user(self, user_id: int, name: str) -> bool:
+        if self._user(user_id) is not None:
+            return False
+        user = self.users[user_id] = UserRecord(name)
+        self.wal.append("put", user_id, value=user.to_dict(self.arena))
+        self._mark_dirty(user_id)
+        return True
+
+    async def update_user(self, user_id: int, fields: Dict[str, Any]):
+        user = self._user(user_id)
+        for key, value in fields.items():
+            self.wal.append("set", user_id, key, value)
+            user.set(key, value, self.arena)
+        self._mark_dirty(user_id)
+
+    async def user_profiles(self) -> Dict[int, Dict[str, Any]]:
+        await self.materialize()
+        return {user_id: user.profile() for user_id, user in self.users.items()}
+
+    def _append(self, user_id: int, key: str, item: Dict[str, Any]) -> int:
+        items = self._user(user_id).items(key)
+        record = ITEM_RECORDS[key].from_dict(item, self.arena)
+        self.wal.append("append", user_id, key, item)
+        items.append(record)
+        self._mark_dirty(user_id)
+        return len(items)
+
+    async def append_class(self, user_id: int, item: Dict[str, Any]) -> int:
+        return self._append(user_id, "schedule", item)
+
+    async def append_deadline(self, user_id: int, item: Dict[str, Any]) -> int:
+        return self._append(user_id, "deadlines", item)
+
+    async def append_note(self, user_id: int, item: Dict[str, Any]) -> int:
+        return self._append(user_id, "notes", item)
+
+    async def extend(self, user_id: int, key: str, items: List[Dict[str, Any]]) -> int:
+        records = self._user(user_id).items(key)
+        if items:
+            added = [ITEM_RECORDS[key].from_dict(item, self.arena) for item in items]
+            self.wal.append("extend", user_id, key, items)
+            records.extend(added)
+            self._mark_dirty(user_id)
+        return len(records)
+
+    async def complete_deadline(self, user_id: int, index: int) -> bool:
+        user = self._user(user_id)
+        if user is None or not 0 <= index < len(user.deadlines):
+            return False
+        self.wal.append("update", user_id, "deadlines", {"completed": True}, index=index)
+        user.deadlines[index].completed = True
+        self._mark_dirty(user_id)
+        return True
+
+    async def all_deadlines(self) -> List[Tuple[int, int, Dict[str, Any]]]:
+        await self.materialize()
+        return [
+            (user_id, index, deadline.to_dict(self.arena))
+            for user_id, user in self.users.items()
+            for index, deadline in enumerate(user.deadlines)
+        ]
+
+    def _list(self, user_id: int, key: str) -> List[Dict[str, Any]]:
+        user = self._user(user_id)
+        if user is None:
+            return []
+        return [record.to_dict(self.arena) for record in user.items(key)]
+
+    async def list_schedule(self, user_id: int) -> List[Dict[str, Any]]:
+        return self._list(user_id, "schedule")
+
+    async def list_deadlines(self, user_id: int) -> List[Dict[str, Any]]:
+        return self._list(user_id, "deadlines")
+
+    async def list_notes(self, user_id: int) -> List[Dict[str, Any]]:
+        return self._list(user_id, "notes")
+
+    async def list_page(self, user_id: int, key: str, start: int, stop: int) -> Tuple[List[Dict[str, Any]], int]:
+        # В словари превращается только нужный срез
+        user = self._user(user_id)
+        if user is None:
+            return [], 0
+        items = user.items(key)
+        return [record.to_dict(self.arena) for record in items[start:stop]], len(items)
+
+    async def note_previews(self, user_id: int, start: int, stop: int) -> Tuple[List[Dict[str, Any]], int]:
+        # Начало текста читается без распаковки сжатых заметок
+        user = self._user(user_id)
+        if user is None:
+            return [], 0
+        previews = []
+        for note in user.notes[start:stop]:
+            item = note.to_dict(self.arena, skip=frozenset({"text"}))
+            item["text"] = self.arena.head(note.text) if note.text is not None else ""
+            previews.append(item)
+        return previews, len(user.notes)
+
+    async def item_counts(self) -> Dict[str, int]:
+        await self.materialize()
+        counts = dict.fromkeys(ITEM_COUNTS, 0)
+        for user in self.users.values():
+            counts["schedule"] += len(user.schedule)
+            counts["notes"] += len(user.notes)
+            counts["deadlines"] += len(user.deadlines)
+            counts["completed"] += sum(1 for deadline in user.deadlines if deadline.completed)
+        return counts
+
+    async def count_users(self) -> int:
+        return len(self.users) + len(self.cold)
+
+    async def user_ids(self) -> List[int]:
+        return list(self.users) + list(self.cold)
+
+
+# ========== ФАЙЛ НА ПОЛЬЗОВАТЕЛЯ ==========
+# Списки пользователя, которые лежат в его файле
+USER_LISTS = ("schedule", "deadlines", "notes")
+
+
+def list_counts(user: Dict[str, List]) -> Dict[str, int]:
+    """Длины списков пользователя и число выполненных дедлайнов"""
+    counts = {key: len(user.get(key, [])) for key in USER_LISTS}
+    counts["completed"] = sum(1 for deadline in user.get("deadlines", []) if deadline.get("completed"))
+    return counts
+
+
+def pending_due(deadlines: List[Dict[str, Any]]) -> List[List[Any]]:
+    """[номер, срок ГГГГ-ММ-ДД] невыполненных дедлайнов с известным сроком"""
+    due = []
+    for index, deadline in enumerate(deadlines):
+        if not deadline.get("completed"):
+            iso = due_iso(deadline)
+            if iso:
+                due.append([index, iso])
+    return due
+
+
+def _write_files(files: List[Tuple[str, str]]):
+    for path, content in files:
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(content)
+        os.replace(tmp_path, path)
+
+
+class LazyFileBackend(StorageBackend):
+    """Файл на пользователя и ограниченный кэш активных пользователей.
+
+    При старте читается только индекс (профили, сроки невыполненных
+    дедлайнов и длины списков, журнал WriteAheadLog); списки пользователя загружаются из
+    users/<id>.json при первом обращении и держатся в кэше не больше
+    cache_size пользователей. Изменённый пользователь, вытесненный из кэша
+    до записи, ждёт очередного flush в буфере обратной записи.
+    """
+
+    def __init__(self, root: str, cache_size: int = 1000, policy: str = "lru",
+                 compact_every: int = 5000):
+        self.root = root
+        self.users_dir = os.path.join(root, "users")
+        self.index_wal = WriteAheadLog(os.path.join(root, "index.json"), compact_every=compact_every)
+        self.index: Dict[int, Dict[str, Any]] = {}
+        self.cache = BoundedCache(cache_size, policy)
+
+        self.dirty = set()
+        self.writeback: Dict[int, Dict[str, List]] = {}
+        self.disk_reads = 0
+        self.disk_writes = 0
+        self._loading: Dict[int, asyncio.Future] = {}
+
+    def user_path(self, user_id: int) -> str:
+        return os.path.join(self.users_dir, f"{user_id}.json")
+
+    async def start(self):
+        os.makedirs(self.users_dir, exist_ok=True)
+        try:
+            self.index = await asyncio.to_thread(self.index_wal.load)
+        except Exception as e:
+            logger.error(f"Ошибка загрузки индекса пользователей: {e}")
+            self.index = {}
+
+    # ---------- загрузка и кэш ----------
+    def _read_user(self, user_id: int) -> Dict[str, List]:
+        try:
+            with open(self.user_path(user_id), "r", encoding="utf-8") as f:
+                user = json.load(f)
+        except FileNotFoundError:
+            user = {}
+        return {key: user.get(key, []) for key in USER_LISTS}
+
+    async def _user(self, user_id: int) -> Optional[Dict[str, List]]:
+        """Списки пользователя: из кэша, буфера обратной записи или с диска"""
+        if user_id not in self.index:
+            return None
+        user = self.cache.get(user_id)
+        if user is not None:
+            return user
+
+        user = self.writeback.pop(user_id, None)
+        if user is None:
+            # Одновременные обращения к одному пользователю ждут одно чтение
+            future = self._loading.get(user_id)
+            if future is None:
+                future = self._loading[user_id] = asyncio.ensure_future(
+                    asyncio.to_thread(self._read_user, user_id)
+                )
+                future.add_done_callback(lambda _: self._loading.pop(user_id, None))
+                self.disk_reads += 1
+            user = await future
+            cached = self.cache.peek(user_id)
+            if cached is not None:
+                return cached
+        self._cache_put(user_id, user)
+        return user
+
+    def _cache_put(self, user_id: int, user: Dict[str, List]):
+        for evicted_id, evicted in self.cache.put(user_id, user):
+            if evicted_id in self.dirty:
+                self.writeback[evicted_id] = evicted
+
+    def _index_due(self, user_id: int, deadlines: List[Dict[str, Any]]):
+        """Сроки невыполненных дедлайнов пользователя в индексе"""
+        due = pending_due(deadlines)
+        self.index_wal.append("set", user_id, "due", due)
+        self.index[user_id]["due"] = due
+
+    def _index_counts(self, user_id: int, user: Dict[str, List]):
+        """Длины списков пользователя в индексе (для item_counts без чтения файлов)"""
+        counts = list_counts(user)
+        self.index_wal.append("set", user_id, "counts", counts)
+        self.index[user_id]["counts"] = counts
+
+    def _changed(self, user_id: int):
+        self.dirty.add(user_id)
+        self._mark_dirty(user_id)
+
+    # ---------- запись ----------
+    async def flush(self):
+        batch = list(self.dirty)
+        self.dirty.clear()
+        files = []
+        for user_id in batch:
+            user = self.cache.peek(user_id) or self.writeback.get(user_id)
+            if user is not None:
+                files.append((self.user_path(user_id),
+                              json.dumps(user, ensure_ascii=False, separators=(",", ":"))))
+        try:
+            if files:
+                await asyncio.to_thread(_write_files, files)
+            await self.index_wal.flush()
+        except Exception:
+            self.dirty.update(batch)
+            raise
+        self.disk_writes += len(files)
+
+        for user_id in batch:
+            if user_id not in self.dirty:
+                self.writeback.pop(user_id, None)
+        if self.index_wal.needs_compaction:
+            self.index_wal.compact_soon(self.index)
+
+    async def close(self):
+        await self.flush()
+        await self.index_wal.close()
+
+    def stats(self) -> Dict[str, Any]:
+        stats = self.cache.stats()
+        stats.update({
+            "writeback": len(self.writeback),
+            "disk_reads": self.disk_reads,
+            "disk_writes": self.disk_writes,
+        })
+        return stats
+
+    # ---------- профиль (только индекс) ----------
+    async def get_user(self, user_id: int) -> Optional[Dict[str, Any]]:
+        entry = self.index.get(user_id)
+        if entry is None:
+            return None
+        return {key: entry[key] for key in PROFILE_FIELDS if key in entry}
+
+    async def create_user(self, user_id: int, name: str) -> bool:
+        if user_id in self.index:
+            return False
+        self.index[user_id] = {"name": name, "due": [], "counts": dict.fromkeys(ITEM_COUNTS, 0)}
+        self.index_wal.append("put", user_id, value=self.index[user_id])
+        self._cache_put(user_id, {key: [] for key in USER_LISTS})
+        self._changed(user_id)
+        return True
+
+    async def update_user(self, user_id: int, fields: Dict[str, Any]):
+        entry = self.index[user_id]
+        for key, value in fields.items():
+            if key not in PROFILE_FIELDS:
+                raise ValueError(f"Неизвестное поле профиля: {key}")
+            self.index_wal.append("set", user_id, key, value)
+            entry[key] = value
+        self._mark_dirty(user_id)
+
+    async def user_profiles(self) -> Dict[int, Dict[str, Any]]:
+        return {
+            user_id: {key: entry[key] for key in PROFILE_FIELDS if key in entry}
+            for user_id, entry in self.index.items()
+        }
+
+    # ---------- списки (загрузка по требованию) ----------
+    async def _append(self, user_id: int, key: str, item: Dict[str, Any]) -> int:
+        user = await self._user(user_id)
+        if user is None:
+            raise KeyError(user_id)
+        user[key].append(item)
+        if key == "deadlines":
+            self._index_due(user_id, user[key])
+        self._index_counts(user_id, user)
+        self._changed(user_id)
+        return len(user[key])
+
+    async def append_class(self, user_id: int, item: Dict[str, Any]) -> int:
+        return await self._append(user_id, "schedule", item)
+
+    async def append_deadline(self, user_id: int, item: Dict[str, Any]) -> int:
+        return await self._append(user_id, "deadlines", item)
+
+    async def append_note(self, user_id: int, item: Dict[str, Any]) -> int:
+        return await self._append(user_id, "notes", item)
+
+    async def extend(self, user_id: int, key: str, items: List[Dict[str, Any]]) -> int:
+        user = await self._user(user_id)
+        if user is None:
+            raise KeyError(user_id)
+        if items:
+            user[key].extend(items)
+            if key == "deadlines":
+                self._index_due(user_id, user[key])
+            self._index_counts(user_id, user)
+            self._changed(user_id)
+        return len(user[key])
+
+    async def complete_deadline(self, user_id: int, index: int) -> bool:
+        user = await self._user(user_id)
+        if user is None or not 0 <= index < len(user["deadlines"]):
+            return False
+        user["deadlines"][index]["completed"] = True
+        self._index_due(user_id, user["deadlines"])
+        self._index_counts(user_id, user)
+        self._changed(user_id)
+        return True
+
+    async def item_counts(self) -> Dict[str, int]:
+        """Из индекса; файлы читаются только у пользователей индекса без длин списков"""
+        missing = [user_id for user_id, entry in self.index.items() if "counts" not in entry]
+        if missing:
+            # Индекс записан до появления длин списков: читаем файлы один раз, мимо кэша
+            loaded = {
+                user_id: self.cache.peek(user_id) or self.writeback.get(user_id)
+                for user_id in missing
+            }
+            unread = [user_id for user_id, user in loaded.items() if user is None]
+            loaded.update(await asyncio.to_thread(
+                lambda: {user_id: self._read_user(user_id) for user_id in unread}
+            ))
+            self.disk_reads += len(unread)
+            for user_id, user in loaded.items():
+                # Пока файлы читались, изменённый пользователь мог получить длины сам
+                if "counts" not in self.index.get(user_id, {"counts": None}):
+                    self._index_counts(user_id, user)
+            logger.info(f"В индекс добавлены длины списков пользователей: {len(loaded)}")
+        counts = dict.fromkeys(ITEM_COUNTS, 0)
+        for entry in self.index.values():
+            for key, value in entry.get("counts", {}).items():
+                counts[key] += value
+        return counts
+
+    async def all_deadlines(self) -> List[Tuple[int, int, Dict[str, Any]]]:
+        """Из индекса, без загрузки пользователей: только невыполненные и только срок due"""
+        return [
+            (user_id, index, {"due": due})
+            for user_id, entry in self.index.items()
+            for index, due in entry.get("due", [])
+        ]
+
+    async def _list(self, user_id: int, key: str) -> List[Dict[str, Any]]:
+        user = await self._user(user_id)
+        return user[key] if user is not None else []
+
+    async def list_schedule(self, user_id: int) -> List[Dict[str, Any]]:
+        return await self._list(user_id, "schedule")
+
+    async def list_deadlines(self, user_id: int) -> List[Dict[str, Any]]:
+        return await self._list(user_id, "deadlines")
+
+    async def list_notes(self, user_id: int) -> List[Dict[str, Any]]:
+        return await self._list(user_id, "notes")
+
+    async def count_users(self) -> int:
+        return len(self.index)
+
+    async def user_ids(self) -> List[int]:
+        return list(self.index)
+
+
+def export_user_files(data: Dict[int, Dict[str, Any]], root: str) -> int:
+    """Раскладка пользователей из user_data.json в файлы LazyFileBackend"""
+    backend = LazyFileBackend(root)
+    os.makedirs(backend.users_dir, exist_ok=True)
+    index = backend.index_wal.load()
+    files = []
+    for user_id, user in data.items():
+        lists = {key: user.get(key, []) for key in USER_LISTS}
+        files.append((backend.user_path(user_id), json.dumps(lists, ensure_ascii=False)))
+        index[user_id] = {key: user[key] for key in PROFILE_FIELDS if key in user}
+        index[user_id]["due"] = pending_due(lists["deadlines"])
+        index[user_id]["counts"] = list_counts(lists)
+    _write_files(files)
+    backend.index_wal._write_snapshot(index, backend.index_wal.seq)
+    return len(data)
+
+
+# ========== SQLITE ==========
+# Колонки таблиц со списками пользователя (кроме id и user_id)
+TABLES = {
+    "schedule": ("day", "time", "subject", "added", "weekday", "minutes"),
+    "deadlines": ("name", "due_date", "created", "completed", "due"),
+    "notes": ("text", "created", "quick_save"),
+}
+BOOL_COLUMNS = {"completed", "quick_save"}
+# Тип колонок, добавленных после первой версии схемы
+COLUMN_TYPES = {"weekday": "INTEGER", "minutes": "INTEGER", "due": "TEXT"}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS users (
+    id INTEGER PRIMARY KEY,
+    name TEXT, tz TEXT, digest_time TEXT
+);
+CREATE TABLE IF NOT EXISTS schedule (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id INTEGER NOT NULL,
+    day TEXT, time TEXT, subject TEXT, added TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_schedule_user ON schedule(user_id, id);
+CREATE TABLE IF NOT EXISTS deadlines (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id INTEGER NOT NULL,
+    name TEXT, due_date TEXT, created TEXT, completed INTEGER
+);
+CREATE INDEX IF NOT EXISTS idx_deadlines_user ON deadlines(user_id, id);
+CREATE TABLE IF NOT EXISTS notes (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id INTEGER NOT NULL,
+    text TEXT, created TEXT, quick_save INTEGER
+);
+CREATE INDEX IF NOT EXISTS idx_notes_user ON notes(user_id, id);
+"""
+
+INDEXES = """
+CREATE INDEX IF NOT EXISTS idx_schedule_weekday ON schedule(user_id, weekday, minutes);
+CREATE INDEX IF NOT EXISTS idx_deadlines_due ON deadlines(user_id, due);
+"""
+
+# Тексты запросов неизменны, поэтому sqlite3 держит их скомпилированными в кэше
+# подготовленных выражений соединения
+INSERT_SQL = {
+    table: f"INSERT INTO {table} (user_id, {', '.join(cols)}) VALUES (?{', ?' * len(cols)})"
+    for table, cols in TABLES.items()
+}
+SELECT_SQL = {
+    table: f"SELECT {', '.join(cols)} FROM {table} WHERE user_id = ? ORDER BY id"
+    for table, cols in TABLES.items()
+}
+COUNT_SQL = {
+    table: f"SELECT COUNT(*) FROM {table} WHERE user_id = ?"
+    for table in TABLES
+}
+PROFILE_SELECT_SQL = f"SELECT {', '.join(PROFILE_FIELDS)} FROM users WHERE id = ?"
+PROFILE_INSERT_SQL = (
+    f"INSERT OR REPLACE INTO users (id, {', '.join(PROFILE_FIELDS)}) "
+    f"VALUES (?{', ?' * len(PROFILE_FIELDS)})"
+)
+
+
+def init_schema(conn: sqlite3.Connection):
+    """Создание таблиц и индексов"""
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.executescript(SCHEMA)
+    for table, cols in list(TABLES.items()) + [("users", PROFILE_FIELDS)]:
+        existing = {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}
+        for col in cols:
+            if col not in existing:
+                conn.execute(f"ALTER TABLE {table} ADD COLUMN {col} {COLUMN_TYPES.get(col, 'TEXT')}")
+    conn.executescript(INDEXES)
+
+
+def _row_values(table: str, user_id: int, item: Dict[str, Any]) -> tuple:
+    return (user_id,) + tuple(item.get(col) for col in TABLES[table])
+
+
+def _row_to_profile(row: tuple) -> Dict[str, Any]:
+    return {key: value for key, value in zip(PROFILE_FIELDS, row) if value is not None}
+
+
+def _row_to_item(table: str, row: tuple) -> Dict[str, Any]:
+    item = {}
+    for col, value in zip(TABLES[table], row):
+        if value is None:
+            continue
+        item[col] = bool(value) if col in BOOL_COLUMNS else value
+    return item
+
+
+def import_users(conn: sqlite3.Connection, data: Dict[int, Dict[str, Any]]) -> int:
+    """Загрузка данных в формате user_data.json одной транзакцией"""
+    with conn:
+        for user_id, user in data.items():
+            conn.execute(
+                PROFILE_INSERT_SQL,
+                (int(user_id),) + tuple(user.get(key) for key in PROFILE_FIELDS)
+            )
+            for table in TABLES:
+                conn.execute(f"DELETE FROM {table} WHERE user_id = ?", (int(user_id),))
+                conn.executemany(
+                    INSERT_SQL[table],
+                    [_row_values(table, int(user_id), item) for item in user.get(table, [])]
+                )
+    return len(data)
+
+
+class SQLiteWorker:
+    """Выделенный поток с собственным соединением SQLite.
+
+    Все обращения к базе выполняются последовательно в этом потоке,
+    цикл событий только ждёт результат.
+    """
+
+    def __init__(self, path: str, init: Optional[Callable[[sqlite3.Connection], None]] = None):
+        self.path = path
+        self.init = init
+        self._queue: "queue.Queue" = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+        self._ready = threading.Event()
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="sqlite-writer", daemon=True)
+        self._thread.start()
+        self._ready.wait()
+
+    def _run(self):
+        conn = sqlite3.connect(self.path, check_same_thread=False, cached_statements=256)
+        try:
+            if self.init is not None:
+                self.init(conn)
+        finally:
+            self._ready.set()
+
+        while True:
+            job = self._queue.get()
+            if job is None:
+                break
+            fn, args, future, loop = job
+            try:
+                result = fn(conn, *args)
+            except Exception as e:
+                loop.call_soon_threadsafe(_resolve, future, None, e)
+            else:
+                loop.call_soon_threadsafe(_resolve, future, result, None)
+        conn.close()
+
+    async def call(self, fn: Callable, *args):
+        """Выполнение fn(conn, *args) в потоке базы"""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._queue.put((fn, args, future, loop))
+        return await future
+
+    async def close(self):
+        if self._thread is None:
+            return
+        self._queue.put(None)
+        await asyncio.to_thread(self._thread.join)
+        self._thread = None
+
+
+def _resolve(future: asyncio.Future, result, error):
+    if future.cancelled():
+        return
+    if error is not None:
+        future.set_exception(error)
+    else:
+        future.set_result(result)
+
+
+class SQLiteBackend(StorageBackend):
+    """Хранение в SQLite: индексированные таблицы, построчный доступ по user_id"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.worker = SQLiteWorker(path, init=init_schema)
+
+    async def start(self):
+        await asyncio.to_thread(self.worker.start)
+
+    async def flush(self):
+        # Изменения копятся в открытой транзакции, flush - один COMMIT
+        await self.worker.call(lambda conn: conn.commit())
+
+    async def close(self):
+        if self.worker.running:
+            await self.flush()
+        await self.worker.close()
+
+    # Функции ниже выполняются в потоке базы
+    @staticmethod
+    def _get_user(conn: sqlite3.Connection, user_id: int):
+        row = conn.execute(PROFILE_SELECT_SQL, (user_id,)).fetchone()
+        return _row_to_profile(row) if row else None
+
+    @staticmethod
+    def _update_user(conn: sqlite3.Connection, user_id: int, fields: Dict[str, Any]):
+        for key, value in fields.items():
+            if key not in PROFILE_FIELDS:
+                raise ValueError(f"Неизвестное поле профиля: {key}")
+            conn.execute(f"UPDATE users SET {key} = ? WHERE id = ?", (value, user_id))
+
+    @staticmethod
+    def _user_profiles(conn: sqlite3.Connection) -> Dict[int, Dict[str, Any]]:
+        rows = conn.execute(f"SELECT id, {', '.join(PROFILE_FIELDS)} FROM users")
+        return {row[0]: _row_to_profile(row[1:]) for row in rows}
+
+    @staticmethod
+    def _create_user(conn: sqlite3.Connection, user_id: int, name: str) -> bool:
+        cursor = conn.execute(
+            "INSERT OR IGNORE INTO users (id, name) VALUES (?, ?)", (user_id, name)
+        )
+        return cursor.rowcount > 0
+
+    @staticmethod
+    def _append(conn: sqlite3.Connection, table: str, user_id: int, item: Dict[str, Any]) -> int:
+        conn.execute(INSERT_SQL[table], _row_values(table, user_id, item))
+        return conn.execute(COUNT_SQL[table], (user_id,)).fetchone()[0]
+
+    @staticmethod
+    def _extend(conn: sqlite3.Connection, table: str, user_id: int, items: List[Dict[str, Any]]) -> int:
+        conn.executemany(INSERT_SQL[table], [_row_values(table, user_id, item) for item in items])
+        return conn.execute(COUNT_SQL[table], (user_id,)).fetchone()[0]
+
+    @staticmethod
+    def _complete_deadline(conn: sqlite3.Connection, user_id: int, index: int) -> bool:
+        cursor = conn.execute(
+            "UPDATE deadlines SET completed = 1 WHERE id = "
+            "(SELECT id FROM deadlines WHERE user_id = ? ORDER BY id LIMIT 1 OFFSET ?)",
+            (user_id, index)
+        )
+        return cursor.rowcount > 0
+
+    @staticmethod
+    def _all_deadlines(conn: sqlite3.Connection) -> List[Tuple[int, int, Dict[str, Any]]]:
+        cols = TABLES["deadlines"]
+        rows = conn.execute(f"SELECT user_id, {', '.join(cols)} FROM deadlines ORDER BY user_id, id")
+        result = []
+        previous_user, index = None, 0
+        for row in rows:
+            index = index + 1 if row[0] == previous_user else 0
+            previous_user = row[0]
+            result.append((row[0], index, _row_to_item("deadlines", row[1:])))
+        return result
+
+    @staticmethod
+    def _list(conn: sqlite3.Connection, table: str, user_id: int) -> List[Dict[str, Any]]:
+        rows = conn.execute(SELECT_SQL[table], (user_id,)).fetchall()
+        return [_row_to_item(table, row) for row in rows]
+
+    @staticmethod
+    def _list_page(conn: sqlite3.Connection, table: str, user_id: int,
+                   start: int, stop: int) -> Tuple[List[Dict[str, Any]], int]:
+        total = conn.execute(COUNT_SQL[table], (user_id,)).fetchone()[0]
+        rows = conn.execute(
+            SELECT_SQL[table] + " LIMIT ? OFFSET ?", (user_id, max(0, stop - start), start)
+        ).fetchall()
+        return [_row_to_item(table, row) for row in rows], total
+
+    async def get_user(self, user_id: int) -> Optional[Dict[str, Any]]:
+        return await self.worker.call(self._get_user, user_id)
+
+    async def create_user(self, user_id: int, name: str) -> bool:
+        created = await self.worker.call(self._create_user, user_id, name)
+        if created:
+            self._mark_dirty(user_id)
+        return created
+
+    async def update_user(self, user_id: int, fields: Dict[str, Any]):
+        await self.worker.call(self._update_user, user_id, fields)
+        self._mark_dirty(user_id)
+
+    async def user_profiles(self) -> Dict[int, Dict[str, Any]]:
+        return await self.worker.call(self._user_profiles)
+
+    async def _append_row(self, table: str, user_id: int, item: Dict[str, Any]) -> int:
+        total = await self.worker.call(self._append, table, user_id, item)
+        self._mark_dirty(user_id)
+        return total
+
+    async def append_class(self, user_id: int, item: Dict[str, Any]) -> int:
+        return await self._append_row("schedule", user_id, item)
+
+    async def append_deadline(self, user_id: int, item: Dict[str, Any]) -> int:
+        return await self._append_row("deadlines", user_id, item)
+
+    async def append_note(self, user_id: int, item: Dict[str, Any]) -> int:
+        return await self._append_row("notes", user_id, item)
+
+    async def extend(self, user_id: int, key: str, items: List[Dict[str, Any]]) -> int:
+        total = await self.worker.call(self._extend, key, user_id, items)
+        if items:
+            self._mark_dirty(user_id)
+        return total
+
+    async def complete_deadline(self, user_id: int, index: int) -> bool:
+        if index < 0:
+            return False
+        completed = await self.worker.call(self._complete_deadline, user_id, index)
+        if completed:
+            self._mark_dirty(user_id)
+        return completed
+
+    async def all_deadlines(self) -> List[Tuple[int, int, Dict[str, Any]]]:
+        return await self.worker.call(self._all_deadlines)
+
+    async def list_schedule(self, user_id: int) -> List[Dict[str, Any]]:
+        return await self.worker.call(self._list, "schedule", user_id)
+
+    async def list_deadlines(self, user_id: int) -> List[Dict[str, Any]]:
+        return await self.worker.call(self._list, "deadlines", user_id)
+
+    async def list_notes(self, user_id: int) -> List[Dict[str, Any]]:
+        return await self.worker.call(self._list, "notes", user_id)
+
+    async def list_page(self, user_id: int, key: str, start: int, stop: int) -> Tuple[List[Dict[str, Any]], int]:
+        if key not in TABLES:
+            raise ValueError(f"Неизвестный список: {key}")
+        return await self.worker.call(self._list_page, key, user_id, start, stop)
+
+    async def item_counts(self) -> Dict[str, int]:
+        def count(conn: sqlite3.Connection) -> Dict[str, int]:
+            counts = {table: conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0] for table in TABLES}
+            counts["completed"] = conn.execute(
+                "SELECT COUNT(*) FROM deadlines WHERE completed = 1"
+            ).fetchone()[0]
+            return counts
+        return await self.worker.call(count)
+
+    async def count_users(self) -> int:
+        return await self.worker.call(
+            lambda conn: conn.execute("SELECT COUNT(*) FROM users").fetchone()[0]
+        )
+
+    async def user_ids(self) -> List[int]:
+        return await self.worker.call(
+            lambda conn: [row[0] for row in conn.execute("SELECT id FROM users")]
+        )
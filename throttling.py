@@ -0,0 +1,152 @@
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict, Optional, Set
+
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject, Update
+
+from broadcast import TokenBucket
+from cache import BoundedCache
+from outbound import background
+
+logger = logging.getLogger(__name__)
+
+THROTTLE_TEXT = "⏳ Слишком много сообщений подряд - подождите пару секунд"
+
+LowPriority = Callable[[Update, Dict[str, Any]], bool]
+
+
+class UserLimit(TokenBucket):
+    """Лимит обновлений одного пользователя"""
+
+    def __init__(self, rate: float, burst: float):
+        super().__init__(rate, burst)
+        # Предупреждение уже отправлено и лимит с тех пор не восстанавливался
+        self.warned = False
+
+
+class UpdateThrottle(BaseMiddleware):
+    """Ограничение нагрузки на обработку обновлений (outer middleware dp.update).
+
+    1. У каждого пользователя своя корзина токенов: rate обновлений в секунду,
+       до burst подряд (rate=0 - без ограничения). Лишние обновления
+       отбрасываются, пользователь один раз получает предупреждение.
+       Низкоприоритетные (is_low_priority, например быстрые заметки) - это
+       данные пользователя, они не отбрасываются, а обрабатываются с
+       data["overloaded"] = True: обработчик выполняет только необходимое
+       (сохраняет заметку) и не отправляет подтверждение. Корзины хранятся
+       для users последних пользователей.
+    2. Одновременно обрабатывается не больше concurrency обновлений,
+       остальные ждут своей очереди по порядку.
+    3. Если ждут queue_limit обновлений и больше, низкоприоритетные тоже
+       получают data["overloaded"] = True.
+    4. Если ждут max_waiting обновлений и больше, новые обновления, кроме
+       низкоприоритетных, отклоняются; пользователь получает то же
+       предупреждение - один раз, пока очередь не разгрузится.
+    """
+
+    def __init__(self, rate: float = 1.0, burst: float = 10, concurrency: int = 64,
+                 queue_limit: int = 100, max_waiting: int = 1000,
+                 is_low_priority: Optional[LowPriority] = None, users: int = 10000):
+        self.rate = rate
+        self.burst = burst
+        self.concurrency = concurrency
+        self.queue_limit = queue_limit
+        self.max_waiting = max_waiting
+        self.is_low_priority = is_low_priority
+        self.limits = BoundedCache(users)
+
+        self.in_flight = 0
+        self.waiting = 0
+        self._slots: Optional[asyncio.Semaphore] = None
+        # Пользователи, предупреждённые об отклонении при переполнении очереди
+        self.rejected_users: Set[int] = set()
+
+        # Счётчики для /health
+        self.throttled = 0
+        self.warnings = 0
+        self.shed = 0
+        self.rejected = 0
+
+    def _limit(self, user_id: int) -> UserLimit:
+        limit = self.limits.get(user_id)
+        if limit is None:
+            limit = UserLimit(self.rate, self.burst)
+            self.limits.put(user_id, limit)
+        return limit
+
+    async def _warn(self, event: Update, data: Dict[str, Any]):
+        bot = data["bot"]
+        chat = data.get("event_chat")
+        try:
+            with background():
+                if event.callback_query is not None:
+                    await bot.answer_callback_query(event.callback_query.id, text=THROTTLE_TEXT)
+                elif chat is not None:
+                    await bot.send_message(chat.id, THROTTLE_TEXT)
+                else:
+                    return
+            self.warnings += 1
+        except Exception as e:
+            logger.warning(f"Не удалось предупредить о лимите: {e}")
+
+    async def __call__(self, handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+                       event: Update, data: Dict[str, Any]) -> Any:
+        user = data.get("event_from_user")
+        low_priority = self.is_low_priority is not None and self.is_low_priority(event, data)
+        overloaded = False
+        if user is not None and self.rate > 0:
+            limit = self._limit(user.id)
+            if limit.try_acquire():
+                limit.warned = False
+            elif low_priority:
+                overloaded = True
+            else:
+                self.throttled += 1
+                if not limit.warned:
+                    limit.warned = True
+                    await self._warn(event, data)
+                return None
+
+        if low_priority:
+            overloaded = overloaded or self.waiting >= self.queue_limit
+        elif self.waiting >= self.max_waiting:
+            self.rejected += 1
+            if not self.rejected_users:
+                logger.warning(f"Очередь обновлений переполнена ({self.waiting}), новые обновления отклоняются")
+            user_id = user.id if user is not None else 0
+            if user_id not in self.rejected_users:
+                self.rejected_users.add(user_id)
+                await self._warn(event, data)
+            return None
+        elif self.rejected_users:
+            logger.info(f"Очередь обновлений разгружена, отклонено: {self.rejected}")
+            self.rejected_users.clear()
+        if overloaded:
+            self.shed += 1
+            data["overloaded"] = True
+
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.concurrency)
+        self.waiting += 1
+        try:
+            await self._slots.acquire()
+        finally:
+            self.waiting -= 1
+        self.in_flight += 1
+        try:
+            return await handler(event, data)
+        finally:
+            self.in_flight -= 1
+            self._slots.release()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "in_flight": self.in_flight,
+            "waiting": self.waiting,
+            "throttled": self.throttled,
+            "warnings": self.warnings,
+            "shed": self.shed,
+            "rejected": self.rejected,
+            "users": len(self.limits),
+        }
@@ -0,0 +1,225 @@
+import html
+import re
+from bisect import bisect_left, bisect_right, insort
+from datetime import date, datetime, time, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+
+from cache import BoundedCache
+
+WEEKDAY_NAMES = ["Понедельник", "Вторник", "Среда", "Четверг", "Пятница", "Суббота", "Воскресенье"]
+
+# Начала названий дней недели, от длинных к коротким
+WEEKDAY_PREFIXES = sorted([
+    ("пон", 0), ("пн", 0), ("mon", 0),
+    ("вто", 1), ("вт", 1), ("tue", 1),
+    ("сре", 2), ("ср", 2), ("wed", 2),
+    ("чет", 3), ("чт", 3), ("thu", 3),
+    ("пят", 4), ("пт", 4), ("fri", 4),
+    ("суб", 5), ("сб", 5), ("sat", 5),
+    ("вос", 6), ("вс", 6), ("sun", 6),
+], key=lambda item: -len(item[0]))
+
+TIME_RE = re.compile(r"(\d{1,2})(?:[:.](\d{2}))?")
+DATE_RE = re.compile(r"(\d{1,2})[./-](\d{1,2})(?:[./-](\d{2,4}))?")
+
+
+# ========== РАЗБОР ВВОДА ==========
+def parse_weekday(text: str) -> Optional[int]:
+    """День недели (0 - понедельник) из свободного текста"""
+    word = text.strip().casefold()
+    if word.isdigit() and 1 <= int(word) <= 7:
+        return int(word) - 1
+    for prefix, weekday in WEEKDAY_PREFIXES:
+        if word.startswith(prefix):
+            return weekday
+    return None
+
+
+def parse_time(text: str) -> Optional[int]:
+    """Время начала пары в минутах от полуночи"""
+    match = TIME_RE.search(text)
+    if not match:
+        return None
+    hours, minutes = int(match.group(1)), int(match.group(2) or 0)
+    if hours > 23 or minutes > 59:
+        return None
+    return hours * 60 + minutes
+
+
+def parse_date(text: str, today: Optional[date] = None) -> Optional[date]:
+    """Дата в формате ДД.ММ.ГГГГ (год можно опустить)"""
+    match = DATE_RE.search(text)
+    if not match:
+        return None
+    day, month, year = match.group(1), match.group(2), match.group(3)
+    if year is None:
+        year = (today or date.today()).year
+    elif len(year) == 2:
+        year = 2000 + int(year)
+    try:
+        return date(int(year), int(month), int(day))
+    except ValueError:
+        return None
+
+
+def normalize_class(day: str, time: str) -> Dict[str, int]:
+    """Структурированные поля пары: weekday и minutes (если удалось разобрать)"""
+    fields = {}
+    weekday = parse_weekday(day)
+    if weekday is not None:
+        fields["weekday"] = weekday
+    minutes = parse_time(time)
+    if minutes is not None:
+        fields["minutes"] = minutes
+    return fields
+
+
+def normalize_deadline(due_date: str) -> Dict[str, str]:
+    """Структурированное поле дедлайна: due в формате ГГГГ-ММ-ДД"""
+    due = parse_date(due_date)
+    return {"due": due.isoformat()} if due else {}
+
+
+def due_iso(entry: Dict[str, Any]) -> Optional[str]:
+    """Срок дедлайна ГГГГ-ММ-ДД (для старых записей - разбор due_date)"""
+    due = entry.get("due")
+    if due is None:
+        parsed = parse_date(entry.get("due_date", ""))
+        due = parsed.isoformat() if parsed else None
+    return due
+
+
+def due_timestamp(entry: Dict[str, Any], tz, due_time: time) -> Optional[float]:
+    """Момент срока дедлайна (unix time) в часовом поясе pytz пользователя"""
+    due = due_iso(entry)
+    if due is None:
+        return None
+    return tz.localize(datetime.combine(date.fromisoformat(due), due_time)).timestamp()
+
+
+def format_minutes(minutes: int) -> str:
+    return f"{minutes // 60:02d}:{minutes % 60:02d}"
+
+
+# ========== ИНДЕКСЫ ==========
+class UserTimetable:
+    """Индексы одного пользователя: пары по дням недели и дедлайны по дате"""
+
+    def __init__(self):
+        self.by_weekday: Dict[int, List[Tuple[int, int, Dict[str, Any]]]] = {}
+        self.deadlines: List[Tuple[str, int, Dict[str, Any]]] = []
+        self._seq = 0
+
+    def add_class(self, entry: Dict[str, Any]):
+        weekday = entry.get("weekday")
+        if weekday is None:
+            weekday = parse_weekday(entry.get("day", ""))
+        if weekday is None:
+            return
+        minutes = entry.get("minutes")
+        if minutes is None:
+            minutes = parse_time(entry.get("time", ""))
+        self._seq += 1
+        # Пары без разобранного времени - в конце дня
+        insort(self.by_weekday.setdefault(weekday, []),
+               (minutes if minutes is not None else 24 * 60, self._seq, entry))
+
+    def add_deadline(self, entry: Dict[str, Any]):
+        due = due_iso(entry)
+        if due is None:
+            return
+        self._seq += 1
+        insort(self.deadlines, (due, self._seq, entry))
+
+    def classes_on(self, weekday: int) -> List[Dict[str, Any]]:
+        return [entry for _, _, entry in self.by_weekday.get(weekday, [])]
+
+    def deadlines_between(self, start: date, end: date) -> List[Tuple[date, Dict[str, Any]]]:
+        """Невыполненные дедлайны с датой в [start, end]"""
+        lo = bisect_left(self.deadlines, (start.isoformat(),))
+        hi = bisect_right(self.deadlines, (end.isoformat(), float("inf")))
+        return [
+            (date.fromisoformat(due), entry)
+            for due, _, entry in self.deadlines[lo:hi]
+            if not entry.get("completed")
+        ]
+
+
+class TimetableIndex:
+    """Индексы расписания и дедлайнов всех пользователей.
+
+    Строятся один раз при первом обращении, дальше обновляются при
+    добавлении записей, поэтому /today и утренняя рассылка не перебирают
+    и не разбирают заново все записи пользователя. В памяти - не больше
+    capacity индексов (LRU): вытесненный строится заново при обращении.
+    """
+
+    def __init__(self, capacity: int = 1000):
+        self.users = BoundedCache(capacity)
+
+    def get(self, user_id: int) -> Optional[UserTimetable]:
+        return self.users.get(user_id)
+
+    def build(self, user_id: int, schedule: List[Dict[str, Any]],
+              deadlines: List[Dict[str, Any]]) -> UserTimetable:
+        timetable = UserTimetable()
+        for entry in schedule:
+            timetable.add_class(entry)
+        for entry in deadlines:
+            timetable.add_deadline(entry)
+        self.users.put(user_id, timetable)
+        return timetable
+
+    def add_class(self, user_id: int, entry: Dict[str, Any]):
+        timetable = self.users.peek(user_id)
+        if timetable is not None:
+            timetable.add_class(entry)
+
+    def add_deadline(self, user_id: int, entry: Dict[str, Any]):
+        timetable = self.users.peek(user_id)
+        if timetable is not None:
+            timetable.add_deadline(entry)
+
+    def invalidate(self, user_id: int):
+        """Сброс индекса пользователя (перестроится при следующем обращении)"""
+        self.users.pop(user_id)
+
+    def clear(self):
+        self.users = BoundedCache(self.users.capacity)
+
+    def stats(self) -> Dict[str, Any]:
+        return self.users.stats()
+
+
+# ========== ОТОБРАЖЕНИЕ ==========
+def render_day(timetable: UserTimetable, today: date, horizon_days: int = 7) -> str:
+    """Пары на сегодня и дедлайны в ближайшие horizon_days дней"""
+    lines = [f"📅 <b>{WEEKDAY_NAMES[today.weekday()]}, {today.strftime('%d.%m')}</b>", ""]
+
+    classes = timetable.classes_on(today.weekday())
+    if classes:
+        lines.append("<b>Пары:</b>")
+        for entry in classes:
+            minutes = entry.get("minutes")
+            time_text = format_minutes(minutes) if minutes is not None else entry.get("time", "")
+            # Название предмета - ввод пользователя, сообщение отправляется в HTML
+            lines.append(f"• {time_text} - {html.escape(entry.get('subject', 'Предмет'))}")
+    else:
+        lines.append("🎉 Пар сегодня нет")
+
+    deadlines = timetable.deadlines_between(today, today + timedelta(days=horizon_days))
+    lines.append("")
+    if deadlines:
+        lines.append(f"<b>Дедлайны на {horizon_days} дн.:</b>")
+        for due, entry in deadlines:
+            days_left = (due - today).days
+            when = "сегодня" if days_left == 0 else f"через {days_left} дн."
+            lines.append(f"• {html.escape(entry.get('name', 'Задание'))} - {due.strftime('%d.%m.%Y')} ({when})")
+    else:
+        lines.append(f"✅ Дедлайнов в ближайшие {horizon_days} дн. нет")
+
+    return "\n".join(lines)
+
+
+def local_today(tz) -> date:
+    return datetime.now(tz).date()
@@ -0,0 +1,243 @@
+import codecs
+import csv
+import io
+import json
+from datetime import datetime
+from typing import Any, AsyncGenerator, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from aiogram import Bot
+from aiogram.types import InputFile
+
+from timetable import normalize_class, normalize_deadline
+
+EXPORT_FORMATS = ("jsonl", "csv")
+
+# Тип записи в файле -> список пользователя
+RECORD_TYPES = {"class": "schedule", "deadline": "deadlines", "note": "notes"}
+TYPE_OF_LIST = {key: record_type for record_type, key in RECORD_TYPES.items()}
+
+# Поля, которые видит пользователь (служебные поля индексов пересчитываются при импорте)
+FIELDS = {
+    "schedule": ("day", "time", "subject", "added"),
+    "deadlines": ("name", "due_date", "completed", "created"),
+    "notes": ("text", "created"),
+}
+REQUIRED = {"schedule": ("day", "time", "subject"), "deadlines": ("name", "due_date"), "notes": ("text",)}
+CSV_COLUMNS = ("type", "day", "time", "subject", "name", "due_date", "completed", "text", "created", "added")
+
+# Длиннее сообщение Telegram всё равно не пропустит
+MAX_FIELD_LENGTH = 4096
+TRUE_VALUES = {"true", "1", "yes", "да", "+"}
+FALSE_VALUES = {"false", "0", "no", "нет", "-", ""}
+
+
+def import_format(filename: Optional[str]) -> str:
+    """Формат файла по расширению: .csv - CSV, остальное - JSON Lines"""
+    return "csv" if (filename or "").lower().endswith(".csv") else "jsonl"
+
+
+# ---------- выгрузка ----------
+def export_records(lists: Dict[str, List[dict]]) -> Iterator[Dict[str, Any]]:
+    for key, record_type in TYPE_OF_LIST.items():
+        for item in lists.get(key, []):
+            record = {"type": record_type}
+            record.update((field, item[field]) for field in FIELDS[key] if item.get(field) is not None)
+            yield record
+
+
+def export_lines(lists: Dict[str, List[dict]], fmt: str) -> Iterator[str]:
+    """Строки файла выгрузки по одной записи"""
+    if fmt == "jsonl":
+        for record in export_records(lists):
+            yield json.dumps(record, ensure_ascii=False) + "\n"
+        return
+
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, CSV_COLUMNS, lineterminator="\n")
+    writer.writeheader()
+    for record in export_records(lists):
+        if "completed" in record:
+            record["completed"] = "true" if record["completed"] else "false"
+        writer.writerow(record)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+
+
+class StreamInputFile(InputFile):
+    """Файл для отправки, который собирается из строк по мере загрузки в Telegram"""
+
+    def __init__(self, lines: Iterable[str], filename: str, chunk_size: int = 64 * 1024):
+        super().__init__(filename=filename, chunk_size=chunk_size)
+        self.lines = lines
+
+    async def read(self, bot: Bot) -> AsyncGenerator[bytes, None]:
+        chunk: List[bytes] = []
+        size = 0
+        for line in self.lines:
+            data = line.encode("utf-8")
+            chunk.append(data)
+            size += len(data)
+            if size >= self.chunk_size:
+                yield b"".join(chunk)
+                chunk, size = [], 0
+        if chunk:
+            yield b"".join(chunk)
+
+
+# ---------- загрузка ----------
+class ImportParser:
+    """Разбор загруженного файла по частям: feed() по мере скачивания, затем close().
+
+    Каждая запись проверяется сразу; хорошие записи копятся в items по спискам,
+    ошибки - в errors с номером строки. Если записей больше max_records,
+    разбор прекращается (full) и файл не загружается целиком (too_many).
+    """
+
+    def __init__(self, fmt: str, max_records: int = 5000, max_errors: int = 10):
+        self.fmt = fmt
+        self.max_records = max_records
+        self.max_errors = max_errors
+        self.items: Dict[str, List[Dict[str, Any]]] = {key: [] for key in RECORD_TYPES.values()}
+        self.errors: List[str] = []
+        self.error_count = 0
+        self.total = 0
+        self.full = False
+        self.too_many = False
+
+        self._decoder = codecs.getincrementaldecoder("utf-8-sig")()
+        self._tail = ""
+        self._line_no = 0
+        # CSV: строки записи с незакрытыми кавычками и заголовок
+        self._record_lines: List[str] = []
+        self._record_start = 0
+        self._header: Optional[List[str]] = None
+        self._stamp = datetime.now().strftime("%d.%m.%Y %H:%M")
+
+    def feed(self, chunk: bytes):
+        if self.full:
+            return
+        try:
+            text = self._tail + self._decoder.decode(chunk)
+        except UnicodeDecodeError:
+            self._error(self._line_no + 1, "файл не в кодировке UTF-8")
+            self.full = True
+            return
+        lines = text.split("\n")
+        self._tail = lines.pop()
+        for line in lines:
+            self._line(line)
+            if self.full:
+                return
+
+    def close(self):
+        if self.full:
+            return
+        try:
+            text = self._tail + self._decoder.decode(b"", final=True)
+        except UnicodeDecodeError:
+            self._error(self._line_no + 1, "файл не в кодировке UTF-8")
+            return
+        self._tail = ""
+        if text:
+            self._line(text)
+        if self._record_lines:
+            self._error(self._record_start, "незакрытые кавычки")
+
+    def _error(self, line_no: int, reason: str):
+        self.error_count += 1
+        if len(self.errors) < self.max_errors:
+            self.errors.append(f"строка {line_no}: {reason}")
+
+    def _line(self, line: str):
+        self._line_no += 1
+        line = line.rstrip("\r")
+        if self.fmt == "jsonl":
+            if not line.strip():
+                return
+            try:
+                record = json.loads(line)
+            except ValueError:
+                self._error(self._line_no, "не JSON")
+                return
+            self._add(self._line_no, record)
+            return
+
+        # Поле CSV в кавычках может занимать несколько строк:
+        # запись закончена, когда кавычек чётное число
+        if not self._record_lines:
+            self._record_start = self._line_no
+        self._record_lines.append(line)
+        text = "\n".join(self._record_lines)
+        if text.count('"') % 2:
+            return
+        self._record_lines = []
+        if not text.strip():
+            return
+        row = next(csv.reader([text]), [])
+        if self._header is None:
+            self._header = [column.strip().lower() for column in row]
+            if "type" not in self._header:
+                self._error(self._record_start, "нет столбца type")
+                self.full = True
+            return
+        self._add(self._record_start, {
+            column: value for column, value in zip(self._header, row) if value != ""
+        })
+
+    def _add(self, line_no: int, record: Any):
+        if self.total >= self.max_records:
+            self.too_many = True
+            self.full = True
+            return
+        if not isinstance(record, dict):
+            self._error(line_no, "запись должна быть объектом")
+            return
+        key = RECORD_TYPES.get(str(record.get("type", "")).strip().lower())
+        if key is None:
+            self._error(line_no, f"неизвестный тип {record.get('type')!r} (нужен class, deadline или note)")
+            return
+
+        item, reason = self._validate(key, record)
+        if item is None:
+            self._error(line_no, reason)
+            return
+        self.items[key].append(item)
+        self.total += 1
+
+    def _validate(self, key: str, record: Dict[str, Any]) -> Tuple[Optional[Dict[str, Any]], str]:
+        item: Dict[str, Any] = {}
+        for field in FIELDS[key]:
+            value = record.get(field)
+            if value is None:
+                continue
+            if field == "completed":
+                if not isinstance(value, bool):
+                    flag = str(value).strip().lower()
+                    if flag not in TRUE_VALUES and flag not in FALSE_VALUES:
+                        return None, f"completed: ожидается true или false, получено {value!r}"
+                    value = flag in TRUE_VALUES
+                item[field] = value
+                continue
+            if not isinstance(value, (str, int, float)) or isinstance(value, bool):
+                return None, f"{field}: ожидается строка"
+            value = str(value).strip()
+            if len(value) > MAX_FIELD_LENGTH:
+                return None, f"{field}: длиннее {MAX_FIELD_LENGTH} символов"
+            item[field] = value
+
+        missing = [field for field in REQUIRED[key] if not item.get(field)]
+        if missing:
+            return None, f"не заполнено: {', '.join(missing)}"
+
+        # Служебные поля - как при добавлении через диалог
+        if key == "schedule":
+            item.setdefault("added", self._stamp)
+            item.update(normalize_class(item["day"], item["time"]))
+        elif key == "deadlines":
+            item.setdefault("created", self._stamp)
+            item.setdefault("completed", False)
+            item.update(normalize_deadline(item["due_date"]))
+        else:
+            item.setdefault("created", self._stamp)
+        return item, ""